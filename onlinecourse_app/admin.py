@@ -1,8 +1,187 @@
 from django.contrib import admin
-from .models import Course, Lesson, Question, Choice, Submission, Instructor, Learner
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Max, Min, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+from datetime import timedelta
+from .models import Course, Lesson, Question, Choice, Submission, Instructor, Learner, ExamConfig, LessonQuota, Enrollment, ArchivedSubmission
+from .analytics import PASSING_SCORE, BUCKETS
+from .search import get_search_backend
+from .archive import unpack_answers
 
 # Register your models here.
 
+def estimate_row_count(model, using):
+    """Cheap row count estimate of a whole table, None when unavailable"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]
+    elif connection.vendor == 'mysql':
+        sql = ("SELECT table_rows FROM information_schema.tables "
+               "WHERE table_schema = DATABASE() AND table_name = %s")
+        params = [table]
+    elif connection.vendor == 'sqlite':
+        return _sqlite_row_estimate(model, using)
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+def _sqlite_row_estimate(model, using):
+    # The rowid span: two index lookups (SQLite only optimizes a lone MIN or
+    # MAX). Archiving deletes the oldest rows, which moves the low end up, so
+    # only gaps in the middle inflate it. sqlite_stat1 isn't used: it is as
+    # old as the last ANALYZE.
+    rows = model._default_manager.using(using)
+    highest = rows.aggregate(highest=Max('pk'))['highest']
+    if highest is None:
+        return 0
+    return highest - rows.aggregate(lowest=Min('pk'))['lowest'] + 1
+
+# EstimatedCountPaginator class - no exact COUNT(*) over big tables
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists use the table's row estimate once it is above
+    ONLINECOURSE_ADMIN_COUNT_LIMIT; filtered ones count at most that
+    many rows. approximate tells the changelist to label the count.
+    """
+    approximate = False
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = getattr(settings, 'ONLINECOURSE_ADMIN_COUNT_LIMIT', 100000)
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                self.approximate = True
+                return estimate
+        count = queryset.order_by()[:limit].count()
+        self.approximate = count == limit
+        return count
+
+def _period_start(value, kind):
+    value = timezone.localtime(value) if timezone.is_aware(value) else value
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if kind in ('year', 'month'):
+        value = value.replace(day=1)
+    if kind == 'year':
+        value = value.replace(month=1)
+    return value
+
+def _next_period(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
+# DateHierarchyQuerySet class - date_hierarchy without scanning the table
+class DateHierarchyQuerySet(QuerySet):
+    """
+    The admin date hierarchy asks for MIN/MAX of the date field and the
+    DISTINCT years, months or days, each a full scan. Here the bounds are
+    two ordered LIMIT 1 queries and every candidate period is probed with
+    an EXISTS over its index range.
+    """
+    max_periods = 400
+    
+    def _bound(self, field_name, last=False):
+        ordering = f'-{field_name}' if last else field_name
+        return self.order_by(ordering).values_list(field_name, flat=True).first()
+    
+    def aggregate(self, *args, **kwargs):
+        # Only the bare MIN/MAX of one field is rewritten
+        if args or not kwargs or not all(
+            type(expression) in (Min, Max) and len(expression.source_expressions) == 1
+            and not expression.filter and hasattr(expression.source_expressions[0], 'name')
+            for expression in kwargs.values()
+        ):
+            return super().aggregate(*args, **kwargs)
+        return {
+            alias: self._bound(expression.source_expressions[0].name, last=type(expression) is Max)
+            for alias, expression in kwargs.items()
+        }
+    
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        first, last = self._bound(field_name), self._bound(field_name, last=True)
+        periods = []
+        if first is not None:
+            start = _period_start(first, kind)
+            while start <= last and len(periods) < self.max_periods:
+                end = _next_period(start, kind)
+                # The period's bounds go first: SQLite seeks the index with the
+                # first range on a column, not the narrowest one
+                period = self.model._base_manager.using(self.db).filter(
+                    **{f'{field_name}__gte': start, f'{field_name}__lt': end}
+                )
+                if (period & self.order_by()).exists():
+                    periods.append(start)
+                start = end
+        return periods if order == 'ASC' else periods[::-1]
+
+# LargeTableAdmin class - shared settings of changelists over big tables
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second COUNT(*) of the whole table
+    show_facets = admin.ShowFacets.NEVER  # Facets count every filter option
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.date_hierarchy:
+            queryset = DateHierarchyQuerySet(self.model, query=queryset.query, using=queryset._db)
+        return queryset
+
+def _graded(queryset):
+    """Pending submissions have no score yet, so score filters leave them out"""
+    if queryset.model is Submission:
+        return queryset.filter(status=Submission.GRADED)
+    return queryset
+
+# PassedFilter class - pass/fail without a DISTINCT over scores
+class PassedFilter(admin.SimpleListFilter):
+    title = 'result'
+    parameter_name = 'passed'
+    
+    def lookups(self, request, model_admin):
+        return [('yes', f'Passed (>= {PASSING_SCORE}%)'), ('no', 'Failed')]
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return _graded(queryset).filter(score__gte=PASSING_SCORE)
+        if self.value() == 'no':
+            return _graded(queryset).filter(score__lt=PASSING_SCORE)
+        return queryset
+
+# ScoreBucketFilter class - fixed score ranges, same buckets as the analytics histogram
+class ScoreBucketFilter(admin.SimpleListFilter):
+    title = 'score'
+    parameter_name = 'score_bucket'
+    
+    def lookups(self, request, model_admin):
+        width = 100 // BUCKETS
+        return [(str(bucket), f'{bucket * width}-{(bucket + 1) * width}%') for bucket in range(BUCKETS)]
+    
+    def queryset(self, request, queryset):
+        try:
+            bucket = int(self.value())
+        except (TypeError, ValueError):
+            return queryset
+        width = 100 / BUCKETS
+        queryset = _graded(queryset).filter(score__gte=bucket * width)
+        if bucket < BUCKETS - 1:
+            # 100% falls in the top bucket
+            queryset = queryset.filter(score__lt=(bucket + 1) * width)
+        return queryset
+
 # ChoiceInline class - TASK 2 REQUIREMENT
 class ChoiceInline(admin.StackedInline):
     model = Choice
@@ -24,11 +203,27 @@ class QuestionInline(admin.StackedInline):
         queryset = super().get_queryset(request)
         return queryset.select_related('lesson')
 
+# SearchIndexMixin - admin search through the full-text index
+class SearchIndexMixin:
+    search_kind = None
+    search_limit = 1000  # Best-ranked matches shown in the changelist
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        ids = get_search_backend().object_ids(self.search_kind, search_term, self.search_limit)
+        if ids is None:
+            # Backend without an index, use the LIKE search of search_fields
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=ids), False
+
 # QuestionAdmin class - TASK 2 REQUIREMENT
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(SearchIndexMixin, LargeTableAdmin):
     list_display = ['question_text', 'lesson', 'grade', 'get_course_name']
-    list_filter = ['lesson', 'grade']
+    list_filter = ['grade']  # A lesson filter would list every lesson in the sidebar
     search_fields = ['question_text', 'lesson__title']
+    search_kind = 'question'
+    autocomplete_fields = ['lesson']
     inlines = [ChoiceInline]  # Include ChoiceInline
     
     # Custom method to get course name
@@ -48,16 +243,19 @@ class QuestionAdmin(admin.ModelAdmin):
         return queryset.select_related('lesson__course')
 
 # LessonAdmin class - TASK 2 REQUIREMENT
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(SearchIndexMixin, LargeTableAdmin):
     list_display = ['title', 'course', 'get_question_count']
     list_filter = ['course']
     search_fields = ['title', 'content', 'course__name']
+    search_kind = 'lesson'
+    autocomplete_fields = ['course']
     inlines = [QuestionInline]  # Include QuestionInline
     
-    # Custom method to count questions
+    # Question count, annotated by get_queryset
     def get_question_count(self, obj):
-        return obj.question_set.count()
+        return obj.question_count
     get_question_count.short_description = 'Questions'
+    get_question_count.admin_order_field = 'question_count'
     
     # Customize the form
     fieldsets = [
@@ -67,36 +265,113 @@ class LessonAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        return queryset.select_related('course')
+        # Correlated subquery, evaluated only for the rows of the page
+        question_count = (Question.objects.filter(lesson=OuterRef('pk')).order_by()
+                          .values('lesson').annotate(count=Count('pk')).values('count'))
+        return queryset.select_related('course').annotate(
+            question_count=Coalesce(Subquery(question_count), 0)
+        )
 
 # CourseAdmin class (not required but helpful)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(SearchIndexMixin, admin.ModelAdmin):
     list_display = ['name', 'description_short']
     search_fields = ['name', 'description']
+    search_kind = 'course'
+    autocomplete_fields = ['instructors']
     
     def description_short(self, obj):
         return obj.description[:100] + '...' if len(obj.description) > 100 else obj.description
     description_short.short_description = 'Description'
 
 # SubmissionAdmin class (not required but helpful)
-class SubmissionAdmin(admin.ModelAdmin):
-    list_display = ['user', 'lesson', 'score', 'submitted_at']
-    list_filter = ['lesson', 'submitted_at', 'score']
-    search_fields = ['user__username', 'lesson__title']
+class SubmissionAdmin(LargeTableAdmin):
+    list_display = ['user', 'lesson', 'score', 'status', 'submitted_at']
+    list_filter = [PassedFilter, ScoreBucketFilter]
+    date_hierarchy = 'submitted_at'
+    ordering = ['-submitted_at']  # Date drill-downs read the index in order, no sort
+    search_fields = ['=user__username']  # Exact match uses the username index
     readonly_fields = ['submitted_at']
+    raw_id_fields = ['user', 'lesson', 'choices']
     
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
         return queryset.select_related('user', 'lesson__course')
 
+# ChoiceAdmin class - choices with a question lookup instead of a dropdown
+class ChoiceAdmin(LargeTableAdmin):
+    list_display = ['choice_text', 'question', 'is_correct']
+    list_filter = ['is_correct']
+    list_select_related = ['question']
+    autocomplete_fields = ['question']
+
+# LessonQuotaInline class - per-lesson question quotas of an exam
+class LessonQuotaInline(admin.TabularInline):
+    model = LessonQuota
+    extra = 1
+    raw_id_fields = ['lesson']
+
+# ExamConfigAdmin class - question pool sampling settings
+class ExamConfigAdmin(admin.ModelAdmin):
+    list_display = ['course', 'questions_per_attempt']
+    autocomplete_fields = ['course']
+    inlines = [LessonQuotaInline]
+
+# LearnerAdmin class - learner profiles, created in bulk by enroll_learners
+class LearnerAdmin(LargeTableAdmin):
+    list_display = ['user', 'occupation', 'social_link']
+    list_filter = ['occupation']
+    list_select_related = ['user']
+    search_fields = ['=user__username', '=user__email']
+    raw_id_fields = ['user']
+
+# InstructorAdmin class
+class InstructorAdmin(admin.ModelAdmin):
+    list_display = ['user', 'full_time', 'total_learners']
+    list_filter = ['full_time']
+    list_select_related = ['user']
+    search_fields = ['=user__username', '=user__email']
+    raw_id_fields = ['user']
+
+# EnrollmentAdmin class - learner progress, maintained by submit
+class EnrollmentAdmin(LargeTableAdmin):
+    list_display = ['user', 'course', 'attempts', 'best_score', 'passed', 'last_attempt_at']
+    list_filter = ['passed']
+    list_select_related = ['user', 'course']
+    search_fields = ['=user__username']
+    raw_id_fields = ['user']
+    autocomplete_fields = ['course']
+    ordering = ['-id']
+    readonly_fields = ['attempts', 'best_score', 'last_score', 'last_attempt_at', 'passed']
+
+# ArchivedSubmissionAdmin class - old attempts, written only by archive_submissions
+class ArchivedSubmissionAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'lesson', 'score', 'submitted_at', 'archived_at']
+    list_filter = [PassedFilter]
+    date_hierarchy = 'submitted_at'
+    ordering = ['-submitted_at']
+    search_fields = ['=user__username']
+    list_select_related = ['user', 'lesson']
+    fields = ['id', 'user', 'lesson', 'score', 'submitted_at', 'archived_at', 'answer_count']
+    readonly_fields = fields
+    
+    def answer_count(self, obj):
+        return len(unpack_answers(obj.answers)[0])
+    answer_count.short_description = 'Answers'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Register all models with admin site
 admin.site.register(Course, CourseAdmin)
 admin.site.register(Lesson, LessonAdmin)
 admin.site.register(Question, QuestionAdmin)
-admin.site.register(Choice)
+admin.site.register(Choice, ChoiceAdmin)
 admin.site.register(Submission, SubmissionAdmin)
-
-# Note: Instructor and Learner models are imported but not registered
-# as they might be custom user models. If you need to register them:
-# admin.site.register(Instructor)
-# admin.site.register(Learner)
\ No newline at end of file
+admin.site.register(ExamConfig, ExamConfigAdmin)
+admin.site.register(Learner, LearnerAdmin)
+admin.site.register(Instructor, InstructorAdmin)
+admin.site.register(Enrollment, EnrollmentAdmin)
+admin.site.register(ArchivedSubmission, ArchivedSubmissionAdmin)
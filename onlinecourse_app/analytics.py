@@ -0,0 +1,177 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import F, Count, Sum, Q, Value, IntegerField
+from django.db.models.functions import Cast, Floor, Least
+from .models import Question, Submission, GradedAnswer, CourseStats, ScoreBucket, QuestionStats, ArchivedSubmission
+from .archive import unpack_answers
+
+# Course and question analytics
+# Aggregates are kept in small denormalized tables and bumped with F()
+# expressions inside the submit transaction, so dashboards read
+# O(questions) rows instead of scanning every submission.
+
+PASSING_SCORE = 70
+BUCKETS = 10
+
+
+def score_bucket(score):
+    """Histogram bucket of a score; 100% falls in the top bucket"""
+    return min(max(int(score // (100 / BUCKETS)), 0), BUCKETS - 1)
+
+
+def _increment(model, lookup, create_kwargs, **increments):
+    """Increment counters of one row, creating it when it doesn't exist yet"""
+    updates = {field: F(field) + amount for field, amount in increments.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    # Ignore a concurrent insert, then apply the increment to whichever row won
+    model.objects.bulk_create([model(**create_kwargs)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(**updates)
+
+
+def record_submissions(course_id, graded):
+    """
+    Add graded submissions of one course to the course and question aggregates
+    graded is a list of (score, graded_answers). The number of statements
+    depends on the distinct buckets and counts, not on the submissions, so
+    a batch of the grading worker costs about as much as a single submit.
+    """
+    if not graded:
+        return
+    scores = [score for score, _ in graded]
+    _increment(CourseStats, {'course_id': course_id}, {'course_id': course_id},
+               attempts=len(scores),
+               passes=sum(1 for score in scores if score >= PASSING_SCORE),
+               score_total=sum(scores))
+    
+    # Buckets in a fixed order so concurrent writers lock rows alike
+    buckets = Counter(score_bucket(score) for score in scores)
+    for bucket, count in sorted(buckets.items()):
+        _increment(ScoreBucket, {'course_id': course_id, 'bucket': bucket},
+                   {'course_id': course_id, 'bucket': bucket}, count=count)
+    
+    attempts = Counter()
+    correct = Counter()
+    for _, graded_answers in graded:
+        for answer in graded_answers:
+            attempts[answer.question_id] += 1
+            if answer.is_correct:
+                correct[answer.question_id] += 1
+    if not attempts:
+        return
+    
+    # Rows for questions seen for the first time are created first
+    existing = set(QuestionStats.objects.filter(question_id__in=attempts)
+                   .values_list('question_id', flat=True))
+    missing = [question_id for question_id in attempts if question_id not in existing]
+    if missing:
+        QuestionStats.objects.bulk_create(
+            [QuestionStats(question_id=question_id) for question_id in missing],
+            ignore_conflicts=True,
+        )
+    
+    # Questions with the same increments share one UPDATE
+    increments = {}
+    for question_id, count in attempts.items():
+        increments.setdefault((count, correct[question_id]), []).append(question_id)
+    for (count, correct_count), question_ids in sorted(increments.items()):
+        updates = {'attempts': F('attempts') + count}
+        if correct_count:
+            updates['correct'] = F('correct') + correct_count
+        QuestionStats.objects.filter(question_id__in=question_ids).update(**updates)
+
+
+def record_submission(course_id, score, graded_answers):
+    """Add one graded submission to the course and question aggregates"""
+    record_submissions(course_id, [(score, graded_answers)])
+
+
+def rebuild_course_stats(course_id):
+    """Recompute all aggregates of a course from its submissions, archived ones included"""
+    with transaction.atomic():
+        # Pending submissions are counted when the worker grades them
+        submissions = Submission.objects.filter(lesson__course_id=course_id, status=Submission.GRADED)
+        archived = ArchivedSubmission.objects.filter(lesson__course_id=course_id)
+        totals = Counter()
+        histogram = Counter()
+        for queryset in (submissions, archived):
+            totals.update({field: value or 0 for field, value in queryset.aggregate(
+                attempts=Count('id'),
+                passes=Count('id', filter=Q(score__gte=PASSING_SCORE)),
+                score_total=Sum('score'),
+            ).items()})
+            buckets = (queryset
+                       .annotate(bucket=Least(Cast(Floor(F('score') / (100 / BUCKETS)), IntegerField()), Value(BUCKETS - 1)))
+                       .values_list('bucket').annotate(count=Count('id')).order_by('bucket'))
+            histogram.update(dict(buckets))
+        CourseStats.objects.update_or_create(course_id=course_id, defaults={
+            'attempts': totals['attempts'],
+            'passes': totals['passes'],
+            'score_total': totals['score_total'],
+        })
+    
+        ScoreBucket.objects.filter(course_id=course_id).delete()
+        ScoreBucket.objects.bulk_create([
+            ScoreBucket(course_id=course_id, bucket=bucket, count=count)
+            for bucket, count in sorted(histogram.items())
+        ])
+    
+        QuestionStats.objects.filter(question__lesson__course_id=course_id).delete()
+        rows = (GradedAnswer.objects.filter(question__lesson__course_id=course_id)
+                .values_list('question_id')
+                .annotate(attempts=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+                .order_by('question_id'))
+        counts = {question_id: [attempts, correct] for question_id, attempts, correct in rows}
+        # Archived answers are only stored packed, so they are counted here
+        question_ids = set(Question.objects.filter(lesson__course_id=course_id).values_list('id', flat=True))
+        for packed in archived.values_list('answers', flat=True).iterator(chunk_size=2000):
+            for question_id, _, is_correct, _ in unpack_answers(packed)[0]:
+                if question_id in question_ids:
+                    question_counts = counts.setdefault(question_id, [0, 0])
+                    question_counts[0] += 1
+                    question_counts[1] += is_correct
+        QuestionStats.objects.bulk_create([
+            QuestionStats(question_id=question_id, attempts=attempts, correct=correct)
+            for question_id, (attempts, correct) in sorted(counts.items())
+        ], batch_size=1000)
+
+
+def course_report(course):
+    """Collect the dashboard data of a course from the aggregate tables"""
+    stats = CourseStats.objects.filter(course=course).first()
+    attempts = stats.attempts if stats else 0
+    passes = stats.passes if stats else 0
+    
+    histogram = [0] * BUCKETS
+    for bucket, count in ScoreBucket.objects.filter(course=course).values_list('bucket', 'count'):
+        histogram[bucket] = count
+    
+    questions = []
+    rows = (Question.objects.filter(lesson__course=course)
+            .select_related('stats')
+            .order_by('id'))
+    for question in rows:
+        question_stats = getattr(question, 'stats', None)
+        question_attempts = question_stats.attempts if question_stats else 0
+        question_correct = question_stats.correct if question_stats else 0
+        questions.append({
+            'question_id': question.id,
+            'question_text': question.question_text[:100],
+            'attempts': question_attempts,
+            'correct': question_correct,
+            'percent_correct': (question_correct / question_attempts) * 100 if question_attempts else None,
+        })
+    
+    return {
+        'course_id': course.id,
+        'course': course.name,
+        'attempts': attempts,
+        'passes': passes,
+        'pass_rate': (passes / attempts) * 100 if attempts else None,
+        'average_score': (stats.score_total / attempts) if attempts else None,
+        'histogram': [
+            {'from': bucket * 100 // BUCKETS, 'to': (bucket + 1) * 100 // BUCKETS, 'count': count}
+            for bucket, count in enumerate(histogram)
+        ],
+        'questions': questions,
+    }
@@ -0,0 +1,114 @@
+from asgiref.sync import sync_to_async
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from .content_version import get_course_version, aget_course_version
+from .models import Question, Choice
+from .routers import pin_to_primary
+
+# Precompiled answer key for a course
+# Grading used to run 3-4 queries per question. The answer key holds
+# everything grading needs in memory and is built with two queries,
+# then kept in the cache under the course's content version.
+
+# Bump when the layout of AnswerKey changes so old pickles are ignored
+ANSWER_KEY_FORMAT = 1
+
+QUESTION_TEXT_LENGTH = 100
+
+QuestionKey = namedtuple('QuestionKey', [
+    'id', 'lesson_id', 'grade', 'text', 'correct_ids', 'correct_texts',
+])
+
+
+def truncate_text(text, length=QUESTION_TEXT_LENGTH):
+    """Shorten question text the way the result page shows it"""
+    return text[:length] + "..." if len(text) > length else text
+
+
+class AnswerKey:
+    """Questions and correct choices of one course, ready for grading"""
+
+    def __init__(self, course_id, version, questions, choices):
+        self.course_id = course_id
+        self.version = version
+        # question id -> QuestionKey, in question id order
+        self.questions = questions
+        # choice id -> (question id, choice text)
+        self.choices = choices
+
+    @property
+    def question_ids(self):
+        return list(self.questions)
+
+    @property
+    def total_questions(self):
+        return len(self.questions)
+
+    def choice_text(self, choice_id):
+        entry = self.choices.get(choice_id)
+        return entry[1] if entry else None
+
+    def question_for_choice(self, choice_id):
+        entry = self.choices.get(choice_id)
+        return entry[0] if entry else None
+
+
+def build_answer_key(course_id, version=None):
+    """Build the answer key for a course with two queries"""
+    questions = {}
+    rows = (Question.objects.filter(lesson__course_id=course_id)
+            .order_by('id')
+            .values_list('id', 'lesson_id', 'grade', 'question_text'))
+    for question_id, lesson_id, grade, text in rows:
+        questions[question_id] = (lesson_id, grade, truncate_text(text), [], [])
+
+    choices = {}
+    rows = (Choice.objects.filter(question__lesson__course_id=course_id)
+            .order_by('id')
+            .values_list('id', 'question_id', 'choice_text', 'is_correct'))
+    for choice_id, question_id, choice_text, is_correct in rows:
+        choices[choice_id] = (question_id, choice_text)
+        if is_correct:
+            questions[question_id][3].append(choice_id)
+            questions[question_id][4].append(choice_text)
+
+    compiled = {
+        question_id: QuestionKey(
+            id=question_id,
+            lesson_id=lesson_id,
+            grade=grade,
+            text=text,
+            correct_ids=frozenset(correct_ids),
+            correct_texts=tuple(correct_texts),
+        )
+        for question_id, (lesson_id, grade, text, correct_ids, correct_texts) in questions.items()
+    }
+    return AnswerKey(course_id, version, compiled, choices)
+
+
+def _answer_key_cache_key(course_id, version):
+    return f'onlinecourse:answer_key:{ANSWER_KEY_FORMAT}:{course_id}:{version}'
+
+
+def get_answer_key(course_id):
+    """Return the cached answer key of a course, building it when missing"""
+    version = get_course_version(course_id)
+    key = _answer_key_cache_key(course_id, version)
+    answer_key = cache.get(key)
+    if answer_key is None:
+        # Cached under the current version, so never build it from a lagging replica
+        with pin_to_primary():
+            answer_key = build_answer_key(course_id, version)
+        timeout = getattr(settings, 'ONLINECOURSE_ANSWER_KEY_TIMEOUT', 24 * 60 * 60)
+        cache.set(key, answer_key, timeout=timeout)
+    return answer_key
+
+
+async def aget_answer_key(course_id):
+    """Async get_answer_key; a missing key is built in a worker thread"""
+    version = await aget_course_version(course_id)
+    answer_key = await cache.aget(_answer_key_cache_key(course_id, version))
+    if answer_key is None:
+        answer_key = await sync_to_async(get_answer_key)(course_id)
+    return answer_key
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class OnlinecourseAppConfig(AppConfig):
     name = "onlinecourse_app"
+    # Keep the integer ids the tables were created with
+    default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        # Register cache invalidation and SQLite tuning signal handlers
+        from . import signals  # noqa: F401
+        from . import db  # noqa: F401
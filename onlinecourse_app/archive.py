@@ -0,0 +1,152 @@
+from collections import defaultdict
+from django.db import transaction
+from .models import Submission, GradedAnswer, ExamAttempt, ArchivedSubmission, Question, Choice
+import struct
+import time
+
+# Submission archive
+# Graded submissions older than the retention window move into
+# ArchivedSubmission: one row per attempt, its graded answers and selected
+# choices packed into a binary field. Each batch is copied and deleted in
+# its own short transaction, so the submission, choice and graded answer
+# tables only hold recent attempts. Archived ids keep resolving on the
+# result page and in the submission API, and the analytics and enrollment
+# rebuilds read the archive too.
+#
+# Packed format (little endian): a header with the format version and the
+# answer and choice counts, then per answer the question id, the selected
+# choice id (0 for none), the correct flag and the points earned, then the
+# selected choice ids. Version 1 stored the points as float32, which
+# rounds fractional partial credit; version 2 stores them as float64 and
+# version 1 rows are still read.
+
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct('<BHH')
+_ANSWERS = {
+    1: struct.Struct('<IIBf'),
+    2: struct.Struct('<IIBd'),
+}
+
+
+def pack_answers(answers, choice_ids):
+    """Pack (question id, selected choice id, is correct, points) tuples and choice ids"""
+    answer_struct = _ANSWERS[FORMAT_VERSION]
+    parts = [_HEADER.pack(FORMAT_VERSION, len(answers), len(choice_ids))]
+    for question_id, choice_id, is_correct, points in answers:
+        parts.append(answer_struct.pack(question_id, choice_id or 0, is_correct, points))
+    parts.append(struct.pack(f'<{len(choice_ids)}I', *choice_ids))
+    return b''.join(parts)
+
+
+def unpack_answers(data):
+    """Reverse pack_answers: return (answer tuples, choice ids)"""
+    data = bytes(data)
+    version, answer_count, choice_count = _HEADER.unpack_from(data)
+    answer_struct = _ANSWERS.get(version)
+    if answer_struct is None:
+        raise ValueError(f'Unknown archive format version {version}')
+    answers = []
+    offset = _HEADER.size
+    for _ in range(answer_count):
+        question_id, choice_id, is_correct, points = answer_struct.unpack_from(data, offset)
+        answers.append((question_id, choice_id or None, bool(is_correct), points))
+        offset += answer_struct.size
+    choice_ids = list(struct.unpack_from(f'<{choice_count}I', data, offset))
+    return answers, choice_ids
+
+
+def archive_batch(submission_ids):
+    """Move graded submissions into the archive; return how many were moved"""
+    with transaction.atomic():
+        # Re-read inside the transaction: a submission may have been re-graded meanwhile
+        rows = list(Submission.objects.filter(id__in=submission_ids, status=Submission.GRADED)
+                    .values_list('id', 'user_id', 'lesson_id', 'submitted_at', 'score'))
+        ids = [row[0] for row in rows]
+        if not ids:
+            return 0
+
+        answers = defaultdict(list)
+        for submission_id, *answer in (GradedAnswer.objects.filter(submission_id__in=ids)
+                                       .order_by('submission_id', 'question_id')
+                                       .values_list('submission_id', 'question_id', 'selected_choice_id',
+                                                    'is_correct', 'points_earned')):
+            answers[submission_id].append(answer)
+        choice_ids = defaultdict(list)
+        for submission_id, choice_id in (Submission.choices.through.objects.filter(submission_id__in=ids)
+                                         .order_by('submission_id', 'choice_id')
+                                         .values_list('submission_id', 'choice_id')):
+            choice_ids[submission_id].append(choice_id)
+
+        ArchivedSubmission.objects.bulk_create([
+            ArchivedSubmission(
+                id=submission_id,
+                user_id=user_id,
+                lesson_id=lesson_id,
+                submitted_at=submitted_at,
+                score=score,
+                answers=pack_answers(answers[submission_id], choice_ids[submission_id]),
+            )
+            for submission_id, user_id, lesson_id, submitted_at, score in rows
+        ])
+        # Deleting the submission would reopen its attempt (the link is SET_NULL)
+        ExamAttempt.objects.filter(submission_id__in=ids).delete()
+        Submission.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive_submissions(cutoff, batch_size=500, pause=0):
+    """
+    Archive the graded submissions made before cutoff, batch by batch
+    Yields the running total after each batch. pause sleeps between
+    batches, leaving the database to other writers for a while.
+    """
+    archived = 0
+    last_id = 0
+    while True:
+        submission_ids = list(
+            Submission.objects.filter(submitted_at__lt=cutoff, status=Submission.GRADED, id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not submission_ids:
+            break
+        last_id = submission_ids[-1]
+        archived += archive_batch(submission_ids)
+        yield archived
+        if pause:
+            time.sleep(pause)
+
+
+def get_archived_submission(submission_id):
+    """The archived submission with user, lesson and course, or None"""
+    return (ArchivedSubmission.objects.select_related('user', 'lesson__course')
+            .filter(id=submission_id).first())
+
+
+async def aget_archived_submission(submission_id):
+    """Async get_archived_submission"""
+    return await (ArchivedSubmission.objects.select_related('user', 'lesson__course')
+                  .filter(id=submission_id).afirst())
+
+
+def archived_graded_answers(archived):
+    """
+    Unsaved GradedAnswer instances of an archived submission and its choice ids
+    Questions and choices are loaded in two queries; answers to questions
+    deleted since are dropped, as their graded answers would have been.
+    """
+    answers, choice_ids = unpack_answers(archived.answers)
+    questions = Question.objects.in_bulk([answer[0] for answer in answers])
+    choices = Choice.objects.in_bulk([answer[1] for answer in answers if answer[1]])
+    graded_answers = [
+        GradedAnswer(
+            submission_id=archived.id,
+            question=questions[question_id],
+            selected_choice=choices.get(choice_id),
+            is_correct=is_correct,
+            points_earned=points,
+        )
+        for question_id, choice_id, is_correct, points in answers
+        if question_id in questions
+    ]
+    return graded_answers, choice_ids
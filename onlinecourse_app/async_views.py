@@ -0,0 +1,161 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import render, redirect
+from .models import Course, Lesson, Submission, ArchivedSubmission
+from .answer_key import aget_answer_key
+from .exam_paper import get_attempt_paper, attempt_seed, shuffle_paper
+from .attempts import aget_or_start_attempt
+from .drafts import aget_draft_selections
+from .archive import aget_archived_submission, archived_graded_answers
+from .content_version import aget_course_version, aget_catalog_version
+from .page_cache import versioned_page
+from .reporting import serialize_submission
+from .views import _pending_context, _has_multi_select, _result_rows, _result_context
+import asyncio
+import time
+
+# Async learner views
+# Native async versions of the read-heavy learner pages, selected in
+# urls.py with ONLINECOURSE_ASYNC_VIEWS under an ASGI server. They use the
+# async ORM and cache interfaces, so a request that waits (the result page
+# polling for its grade) holds no worker thread. Rendering and the row
+# building are shared with the sync views in views.py.
+
+
+async def _user(request):
+    """Resolve request.user once so templates don't load it synchronously"""
+    request.user = await request.auser()
+    return request.user
+
+
+async def _get_course(course_id):
+    try:
+        return await Course.objects.aget(id=course_id)
+    except Course.DoesNotExist:
+        raise Http404('No Course matches the given query.')
+
+
+# Home page view, cached per catalog version (it shows the username)
+@versioned_page('index', aget_catalog_version, per_user=True)
+async def index(request):
+    """Display all available courses"""
+    courses = [course async for course in Course.objects.all()]
+    context = {
+        'courses': courses,
+        'user': await _user(request),
+    }
+    return render(request, 'onlinecourse_app/index.html', context)
+
+# Course details view, cached per course content version
+@versioned_page('course_details', aget_course_version)
+async def course_details(request, course_id):
+    """Display course details with all lessons"""
+    course = await _get_course(course_id)
+    lessons = [lesson async for lesson in Lesson.objects.filter(course=course).order_by('id')]
+    
+    context = {
+        'course': course,
+        'lessons': lessons,
+        'user': await _user(request),
+    }
+    return render(request, 'onlinecourse_app/course_details_bootstrap.html', context)
+
+# Exam page
+@login_required
+async def take_exam(request, course_id):
+    """Display exam questions for a course"""
+    user = await _user(request)
+    course = await _get_course(course_id)
+    
+    # Questions drawn for this attempt, choices shuffled per learner and attempt
+    attempt = await aget_or_start_attempt(user, course.id)
+    paper = await sync_to_async(get_attempt_paper)(course.id, attempt.question_ids)
+    exam_questions = shuffle_paper(paper, attempt_seed(user.pk, attempt.seed))
+    
+    # Answers autosaved before a reload or crash are checked again
+    selections = await aget_draft_selections(attempt.id)
+    selected_ids = {choice_id for ids in selections.values() for choice_id in ids}
+    
+    context = {
+        'course': course,
+        'exam_questions': exam_questions,
+        'total_questions': len(exam_questions),
+        'selected_ids': selected_ids,
+        'idempotency_key': f'attempt-{attempt.id}-{attempt.seed}',
+        'user': user,
+    }
+    
+    return render(request, 'onlinecourse_app/exam.html', context)
+
+
+async def _wait_for_grading(submission):
+    """Async views._wait_for_grading: the wait sleeps without a thread"""
+    deadline = time.monotonic() + getattr(settings, 'ONLINECOURSE_RESULT_WAIT', 1.0)
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+        status = await Submission.objects.filter(id=submission.id).values_list('status', flat=True).afirst()
+        if status != Submission.PENDING:
+            return await Submission.objects.select_related('lesson__course').aget(id=submission.id)
+    return submission
+
+# Exam result page
+async def show_exam_result(request, submission_id):
+    """Display exam results"""
+    user = await _user(request)
+    try:
+        submission = await Submission.objects.select_related('lesson__course').filter(id=submission_id).afirst()
+        if submission is None:
+            submission = await aget_archived_submission(submission_id)
+            if submission is None:
+                raise Submission.DoesNotExist
+        course = submission.lesson.course if submission.lesson else None
+    
+        # An asynchronously graded submission may still be in the queue
+        if submission.status == Submission.PENDING:
+            if request.GET.get('wait'):
+                submission = await _wait_for_grading(submission)
+            if submission.status == Submission.PENDING:
+                return render(request, 'onlinecourse_app/exam_pending.html',
+                              _pending_context(user, submission, course))
+    
+        answer_key = await aget_answer_key(course.id) if course else None
+        if isinstance(submission, ArchivedSubmission):
+            graded_answers, choice_ids = await sync_to_async(archived_graded_answers)(submission)
+        else:
+            graded_answers = [
+                answer async for answer in submission.graded_answers
+                .select_related('question', 'selected_choice').order_by('question_id')
+            ]
+    
+            choice_ids = None
+            if _has_multi_select(answer_key):
+                choice_ids = [
+                    choice_id async for choice_id in Submission.choices.through.objects
+                    .filter(submission_id=submission.id).values_list('choice_id', flat=True)
+                ]
+    
+        submission_data = _result_rows(answer_key, graded_answers, choice_ids)
+        context = _result_context(user, submission, course, submission_data)
+        return render(request, 'onlinecourse_app/exam_result.html', context)
+    
+    except Submission.DoesNotExist:
+        messages.error(request, 'Submission not found.')
+        return redirect('onlinecourse_app:index')
+    except Exception as e:
+        messages.error(request, f'Error loading results: {str(e)}')
+        return redirect('onlinecourse_app:index')
+
+# API view to get submission details
+async def get_submission_details(request, submission_id):
+    """API endpoint to get submission details in JSON format"""
+    if request.method == 'GET':
+        submission = (await Submission.objects.select_related('user', 'lesson__course').filter(id=submission_id).afirst()
+                      or await aget_archived_submission(submission_id))
+        if submission is None:
+            return JsonResponse({'error': 'Submission not found'}, status=404)
+        return JsonResponse(serialize_submission(submission))
+    
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
@@ -0,0 +1,48 @@
+from asgiref.sync import sync_to_async
+from .exam_paper import get_question_pool, sample_questions
+from .models import ExamAttempt
+import secrets
+
+# Exam attempts
+# Each attempt records the question ids drawn for it, so take_exam shows
+# and submit grades exactly the same questions.
+
+
+def get_open_attempt(user, course_id):
+    """Return the learner's unsubmitted attempt for a course, if any"""
+    return (ExamAttempt.objects.filter(user=user, course_id=course_id, submission__isnull=True)
+            .order_by('-id').first())
+
+
+def start_attempt(user, course_id):
+    """Draw the questions for a new attempt and record them"""
+    seed = secrets.token_hex(8)
+    question_ids = sample_questions(get_question_pool(course_id), seed)
+    return ExamAttempt.objects.create(
+        user=user, course_id=course_id, seed=seed, question_ids=question_ids
+    )
+
+
+def get_or_start_attempt(user, course_id):
+    """Return the open attempt of a learner, starting one if needed"""
+    return get_open_attempt(user, course_id) or start_attempt(user, course_id)
+
+
+async def aget_open_attempt(user, course_id):
+    """Async get_open_attempt, for the async views"""
+    return await (ExamAttempt.objects.filter(user=user, course_id=course_id, submission__isnull=True)
+                  .order_by('-id').afirst())
+
+
+async def astart_attempt(user, course_id):
+    """Async start_attempt; the question pool comes from the cache"""
+    seed = secrets.token_hex(8)
+    pool = await sync_to_async(get_question_pool)(course_id)
+    return await ExamAttempt.objects.acreate(
+        user=user, course_id=course_id, seed=seed, question_ids=sample_questions(pool, seed)
+    )
+
+
+async def aget_or_start_attempt(user, course_id):
+    """Async get_or_start_attempt, for the async views"""
+    return await aget_open_attempt(user, course_id) or await astart_attempt(user, course_id)
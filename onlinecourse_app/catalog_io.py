@@ -0,0 +1,263 @@
+from django.db import transaction
+from .content_version import bump_course_version, bump_catalog_version
+from .models import Course, Lesson, Question, Choice
+from .search import get_search_backend
+from .streams import batched, truthy
+import csv
+import json
+
+# Streaming catalog import and export
+# A catalog is a stream of records, one per question, each naming its
+# course and lesson:
+#
+#   {"course": "...", "course_description": "...", "lesson": "...",
+#    "lesson_content": "...", "question": "...", "grade": 1,
+#    "choices": [{"text": "...", "is_correct": true}, ...]}
+#
+# Records without "question" only declare a course or lesson. In CSV the
+# same data is flattened to one row per choice; consecutive rows of the
+# same question are grouped back together.
+
+CSV_FIELDS = [
+    'course', 'course_description', 'lesson', 'lesson_content',
+    'question', 'grade', 'choice', 'is_correct',
+]
+
+
+def iter_jsonl(stream):
+    """Yield catalog records from a JSON Lines stream"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'Line {line_number}: {e}')
+
+
+def iter_csv(stream):
+    """Yield catalog records from a CSV stream, one row per choice"""
+    record = None
+    for row in csv.DictReader(stream):
+        key = (row.get('course'), row.get('lesson'), row.get('question'))
+        if record is None or key != record['_key']:
+            if record is not None:
+                del record['_key']
+                yield record
+            record = {
+                '_key': key,
+                'course': row.get('course', ''),
+                'course_description': row.get('course_description', ''),
+                'lesson': row.get('lesson', ''),
+                'lesson_content': row.get('lesson_content', ''),
+            }
+            if row.get('question'):
+                record['question'] = row['question']
+                record['grade'] = int(row.get('grade') or 1)
+                record['choices'] = []
+        if row.get('choice') and 'question' in record:
+            record['choices'].append({
+                'text': row['choice'],
+                'is_correct': truthy(row.get('is_correct', '')),
+            })
+    if record is not None:
+        del record['_key']
+        yield record
+
+
+def _bump_versions(course_ids):
+    for course_id in course_ids:
+        bump_course_version(course_id)
+    bump_catalog_version()
+
+
+class CatalogImporter:
+    """
+    Insert catalog records with bulk_create, one transaction per batch
+    Courses and lessons are resolved by name with one query per batch and
+    remembered, so rows never trigger individual lookups.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.course_ids = {}
+        self.lesson_ids = {}
+        self.touched_courses = set()
+        self.counts = {'courses': 0, 'lessons': 0, 'questions': 0, 'choices': 0}
+
+    def run(self, records):
+        try:
+            for batch in batched(records, self.batch_size):
+                with transaction.atomic():
+                    course_ids = self._import_batch(batch)
+                    # bulk_create sends no signals, so the cached content of
+                    # the courses a batch touched is invalidated once it commits
+                    transaction.on_commit(lambda course_ids=course_ids: _bump_versions(course_ids))
+                yield dict(self.counts)
+        finally:
+            # Also after a failed batch or an early stop, so committed rows get indexed
+            if self.touched_courses:
+                for _ in get_search_backend().rebuild(sorted(self.touched_courses), self.batch_size):
+                    pass
+
+    def _import_batch(self, batch):
+        """Import one batch; returns the ids of the courses it touched"""
+        for record in batch:
+            if not record.get('course'):
+                raise ValueError(f'Record without a course: {record}')
+        self._resolve_courses(batch)
+        self._resolve_lessons(batch)
+        
+        questions = []
+        question_choices = []
+        for record in batch:
+            if not record.get('question'):
+                continue
+            if not record.get('lesson'):
+                raise ValueError(f'Question without a lesson: {record}')
+            course_id = self.course_ids[record['course']]
+            questions.append(Question(
+                lesson_id=self.lesson_ids[(course_id, record['lesson'])],
+                question_text=record['question'],
+                grade=int(record.get('grade') or 1),
+            ))
+            question_choices.append(record.get('choices') or [])
+        
+        Question.objects.bulk_create(questions, batch_size=self.batch_size)
+        choices = [
+            Choice(
+                question_id=question.id,
+                choice_text=choice['text'],
+                is_correct=truthy(choice.get('is_correct')),
+            )
+            for question, record_choices in zip(questions, question_choices)
+            for choice in record_choices
+        ]
+        Choice.objects.bulk_create(choices, batch_size=self.batch_size)
+        self.counts['questions'] += len(questions)
+        self.counts['choices'] += len(choices)
+        return {self.course_ids[record['course']] for record in batch}
+
+    def _resolve_courses(self, batch):
+        """Map new course names to ids, creating the missing courses"""
+        descriptions = {}
+        for record in batch:
+            if record['course'] not in self.course_ids:
+                descriptions.setdefault(record['course'], record.get('course_description') or '')
+        if not descriptions:
+            return
+        
+        existing = (Course.objects.filter(name__in=list(descriptions))
+                    .order_by('-id').values_list('name', 'id'))
+        self.course_ids.update(existing)
+        missing = [Course(name=name, description=description)
+                   for name, description in descriptions.items() if name not in self.course_ids]
+        Course.objects.bulk_create(missing)
+        for course in missing:
+            self.course_ids[course.name] = course.id
+        self.counts['courses'] += len(missing)
+        self.touched_courses.update(self.course_ids[name] for name in descriptions)
+
+    def _resolve_lessons(self, batch):
+        """Map new (course, lesson title) pairs to ids, creating the missing lessons"""
+        contents = {}
+        for record in batch:
+            if not record.get('lesson'):
+                continue
+            key = (self.course_ids[record['course']], record['lesson'])
+            if key not in self.lesson_ids:
+                contents.setdefault(key, record.get('lesson_content') or '')
+        if not contents:
+            return
+        
+        course_ids = {course_id for course_id, _ in contents}
+        titles = {title for _, title in contents}
+        existing = (Lesson.objects.filter(course_id__in=course_ids, title__in=titles)
+                    .order_by('-id').values_list('course_id', 'title', 'id'))
+        for course_id, title, lesson_id in existing:
+            self.lesson_ids[(course_id, title)] = lesson_id
+        missing = [Lesson(course_id=course_id, title=title, content=content)
+                   for (course_id, title), content in contents.items()
+                   if (course_id, title) not in self.lesson_ids]
+        Lesson.objects.bulk_create(missing)
+        for lesson in missing:
+            self.lesson_ids[(lesson.course_id, lesson.title)] = lesson.id
+        self.counts['lessons'] += len(missing)
+        self.touched_courses.update(course_ids)
+
+
+def iter_catalog(course_ids=None, batch_size=1000):
+    """
+    Yield catalog records without loading the catalog into memory
+    Courses without lessons and lessons without questions come first,
+    then every question with its choices, read in keyset chunks.
+    """
+    courses = Course.objects.filter(lesson__isnull=True)
+    lessons = Lesson.objects.filter(question__isnull=True).select_related('course')
+    questions = Question.objects.select_related('lesson__course')
+    if course_ids:
+        courses = courses.filter(id__in=course_ids)
+        lessons = lessons.filter(course_id__in=course_ids)
+        questions = questions.filter(lesson__course_id__in=course_ids)
+    
+    for course in courses.order_by('id').iterator(chunk_size=batch_size):
+        yield {'course': course.name, 'course_description': course.description}
+    
+    for lesson in lessons.order_by('id').iterator(chunk_size=batch_size):
+        yield {
+            'course': lesson.course.name,
+            'course_description': lesson.course.description,
+            'lesson': lesson.title,
+            'lesson_content': lesson.content,
+        }
+    
+    last_id = 0
+    while True:
+        chunk = list(questions.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        
+        choices = {}
+        rows = (Choice.objects.filter(question_id__in=[question.id for question in chunk])
+                .order_by('id').values_list('question_id', 'choice_text', 'is_correct'))
+        for question_id, choice_text, is_correct in rows:
+            choices.setdefault(question_id, []).append({'text': choice_text, 'is_correct': is_correct})
+        
+        for question in chunk:
+            lesson = question.lesson
+            yield {
+                'course': lesson.course.name,
+                'course_description': lesson.course.description,
+                'lesson': lesson.title,
+                'lesson_content': lesson.content,
+                'question': question.question_text,
+                'grade': question.grade,
+                'choices': choices.get(question.id, []),
+            }
+
+
+def write_jsonl(records, stream):
+    """Write catalog records as JSON Lines; returns the number written"""
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(records, stream):
+    """Write catalog records as CSV, one row per choice; returns the number written"""
+    writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        row = {field: record.get(field, '') for field in CSV_FIELDS}
+        choices = record.get('choices') or []
+        if not choices:
+            writer.writerow(row)
+        for choice in choices:
+            writer.writerow(dict(row, choice=choice['text'], is_correct=int(choice['is_correct'])))
+        count += 1
+    return count
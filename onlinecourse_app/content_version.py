@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import Course, content_version_stamp
+
+# Version stamps for course content
+# Every cached structure derived from a course (answer key, exam paper,
+# rendered pages, ...) is keyed on the course's current version, so bumping
+# the version is enough to make all of them stale at once. Old entries
+# simply expire.
+#
+# A version is the millisecond time of the last content change. It is
+# stored on Course.content_version and mirrored in the cache, so reads cost
+# no query, and it doubles as the Last-Modified time of course pages. The
+# catalog (the course list) has its own cache-only version.
+#
+# A per-process cache never sees the bumps made by other processes (web
+# workers, grade_pending, catalog imports), so the cached copies live for
+# ONLINECOURSE_VERSION_TIMEOUT seconds only; after that a course version is
+# read again from the database, and a lost catalog version gets a new stamp.
+
+CATALOG_VERSION_KEY = 'onlinecourse:catalog_version'
+
+
+def _version_cache_key(course_id):
+    return f'onlinecourse:course_version:{course_id}'
+
+
+def _timeout():
+    # None keeps the versions until the next bump (a cache shared by every process)
+    return getattr(settings, 'ONLINECOURSE_VERSION_TIMEOUT', None)
+
+
+def _next_version(current):
+    # Strictly increasing even when two bumps land in the same millisecond
+    return max(content_version_stamp(), (current or 0) + 1)
+
+
+def get_course_version(course_id):
+    """Return the current content version of a course, None if it doesn't exist"""
+    key = _version_cache_key(course_id)
+    version = cache.get(key)
+    if version is None:
+        version = Course.objects.filter(pk=course_id).values_list('content_version', flat=True).first()
+        if version is None:
+            return None
+        cache.add(key, version, timeout=_timeout())
+        version = cache.get(key, version)
+    return version
+
+
+async def aget_course_version(course_id):
+    """Async get_course_version, for the async views"""
+    key = _version_cache_key(course_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = await (Course.objects.filter(pk=course_id)
+                         .values_list('content_version', flat=True).afirst())
+        if version is None:
+            return None
+        await cache.aadd(key, version, timeout=_timeout())
+        version = await cache.aget(key, version)
+    return version
+
+
+def bump_course_version(course_id):
+    """Mark all cached content of a course as stale"""
+    key = _version_cache_key(course_id)
+    version = _next_version(cache.get(key))
+    # update() sends no signals, so this doesn't bump again
+    Course.objects.filter(pk=course_id).update(content_version=version)
+    cache.set(key, version, timeout=_timeout())
+    return version
+
+
+def get_catalog_version():
+    """Return the current version of the course list"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Lost from the cache: any fresh stamp is newer than what was served
+        cache.add(CATALOG_VERSION_KEY, content_version_stamp(), timeout=_timeout())
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    """Async get_catalog_version, for the async views"""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, content_version_stamp(), timeout=_timeout())
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Mark the cached course list as stale"""
+    version = _next_version(cache.get(CATALOG_VERSION_KEY))
+    cache.set(CATALOG_VERSION_KEY, version, timeout=_timeout())
+    return version
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# SQLite tuning
+# PRAGMAs from ONLINECOURSE_SQLITE_PRAGMAS are applied to every new SQLite
+# connection: WAL lets readers run while a submit holds the write lock,
+# busy_timeout makes writers queue instead of failing with
+# "database is locked".
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'ONLINECOURSE_SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
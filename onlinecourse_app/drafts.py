@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import caches
+import time
+
+# Exam drafts
+# Answers autosaved while an exam is open live in the cache, one entry per
+# attempt, so clicking through an exam costs no database write. submit
+# commits the draft (or the posted form) and then drops it. Drafts use the
+# ONLINECOURSE_DRAFT_CACHE alias, so culls of other cached data never drop
+# a learner's answers mid-exam.
+
+
+def _cache():
+    return caches[getattr(settings, 'ONLINECOURSE_DRAFT_CACHE', 'default')]
+
+
+def _draft_cache_key(attempt_id):
+    return f'onlinecourse:draft:{attempt_id}'
+
+
+def save_draft(attempt_id, selections):
+    """Replace the draft of an attempt; selections maps question id to choice ids"""
+    draft = {
+        'selections': {question_id: sorted(choice_ids) for question_id, choice_ids in selections.items()},
+        'saved_at': time.time(),
+    }
+    timeout = getattr(settings, 'ONLINECOURSE_DRAFT_TIMEOUT', 24 * 60 * 60)
+    _cache().set(_draft_cache_key(attempt_id), draft, timeout=timeout)
+    return draft
+
+
+def get_draft(attempt_id):
+    """Return the saved draft of an attempt, or None"""
+    return _cache().get(_draft_cache_key(attempt_id))
+
+
+def _draft_selections(draft):
+    if draft is None:
+        return {}
+    return {question_id: set(choice_ids) for question_id, choice_ids in draft['selections'].items()}
+
+
+def get_draft_selections(attempt_id):
+    """Return the drafted selections of an attempt as question id -> set of choice ids"""
+    return _draft_selections(get_draft(attempt_id))
+
+
+async def aget_draft_selections(attempt_id):
+    """Async get_draft_selections, for the async views"""
+    return _draft_selections(await _cache().aget(_draft_cache_key(attempt_id)))
+
+
+def delete_draft(attempt_id):
+    _cache().delete(_draft_cache_key(attempt_id))
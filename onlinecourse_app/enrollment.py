@@ -0,0 +1,176 @@
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import Instructor, Learner
+from .streams import batched, truthy
+import csv
+
+# Bulk user provisioning
+# A cohort arrives as a CSV with one row per user:
+#
+#   username,password,email,first_name,last_name,role,occupation,social_link,full_time,password_hash
+#
+# role is "learner" (default) or "instructor". Passwords are hashed before
+# the batch transaction opens, usually on a process pool, because PBKDF2
+# is the slow part; users and profiles are then written with bulk_create.
+# An optional password_hash column carries hashes exported from another
+# Django site, which are stored as they are. A row with neither gets an
+# unusable password.
+
+USER_CSV_FIELDS = [
+    'username', 'password', 'email', 'first_name', 'last_name',
+    'role', 'occupation', 'social_link', 'full_time', 'password_hash',
+]
+
+ROLES = ('learner', 'instructor')
+
+_OCCUPATIONS = {code for code, _ in Learner.OCCUPATION_CHOICES}
+
+
+def iter_user_csv(stream):
+    """Yield user records from a CSV stream with a header row"""
+    for line_number, row in enumerate(csv.DictReader(stream), 2):
+        username = (row.get('username') or '').strip()
+        if not username:
+            raise ValueError(f'Line {line_number}: missing username')
+        role = (row.get('role') or 'learner').strip().lower()
+        if role not in ROLES:
+            raise ValueError(f'Line {line_number}: unknown role {role!r}')
+        occupation = (row.get('occupation') or Learner.STUDENT).strip()
+        if occupation not in _OCCUPATIONS:
+            raise ValueError(f'Line {line_number}: unknown occupation {occupation!r}')
+        password_hash = (row.get('password_hash') or '').strip()
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                raise ValueError(f'Line {line_number}: unknown password hash format')
+        yield {
+            'username': username,
+            'password': row.get('password') or '',
+            'password_hash': password_hash,
+            'email': (row.get('email') or '').strip(),
+            'first_name': (row.get('first_name') or '').strip(),
+            'last_name': (row.get('last_name') or '').strip(),
+            'role': role,
+            'occupation': occupation,
+            'social_link': (row.get('social_link') or '').strip(),
+            'full_time': truthy(row.get('full_time') or 'true'),
+        }
+
+
+def hash_password(password):
+    """Hash one password; runs in the worker processes of the pool"""
+    return make_password(password)
+
+
+class UserImporter:
+    """
+    Create users with their Learner or Instructor profile, one transaction per batch
+    Existing usernames are found with one query per batch and skipped, or
+    updated with update_existing. map_function hashes the passwords of a
+    batch; pass a process pool's map to spread them over the CPUs.
+    """
+
+    def __init__(self, batch_size=1000, update_existing=False, map_function=map):
+        self.batch_size = batch_size
+        self.update_existing = update_existing
+        self.map_function = map_function
+        self.counts = {'created': 0, 'updated': 0, 'skipped': 0, 'learners': 0, 'instructors': 0}
+
+    def run(self, records):
+        for batch in batched(records, self.batch_size):
+            self._import_batch(batch)
+            yield dict(self.counts)
+
+    def _import_batch(self, batch):
+        records = {}
+        for record in batch:
+            if record['username'] in records:
+                # A username repeated within the batch: the first row wins
+                self.counts['skipped'] += 1
+            else:
+                records[record['username']] = record
+
+        existing = dict(User.objects.filter(username__in=list(records)).values_list('username', 'id'))
+        new = [record for username, record in records.items() if username not in existing]
+        updated = []
+        if self.update_existing:
+            updated = [record for username, record in records.items() if username in existing]
+        else:
+            self.counts['skipped'] += len(existing)
+
+        # Hashing happens before the transaction, so no lock is held meanwhile
+        hashed = [record for record in new + updated if record['password'] and not record['password_hash']]
+        for record, password in zip(hashed, self.map_function(hash_password, [r['password'] for r in hashed])):
+            record['password_hash'] = password
+
+        with transaction.atomic():
+            user_ids = self._create_users(new)
+            user_ids.update(self._update_users(updated, existing))
+            self._save_profiles(new + updated, user_ids, check_existing=bool(updated))
+        self.counts['created'] += len(new)
+        self.counts['updated'] += len(updated)
+
+    def _create_users(self, records):
+        users = [
+            User(
+                username=record['username'],
+                password=record['password_hash'] or make_password(None),
+                email=record['email'],
+                first_name=record['first_name'],
+                last_name=record['last_name'],
+            )
+            for record in records
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        if users and users[0].pk is None:
+            # Backends that can't return ids from a bulk insert
+            return dict(User.objects.filter(username__in=[user.username for user in users])
+                        .values_list('username', 'id'))
+        return {user.username: user.pk for user in users}
+
+    def _update_users(self, records, existing):
+        fields = ['email', 'first_name', 'last_name']
+        with_password = []
+        without_password = []
+        for record in records:
+            user = User(id=existing[record['username']], **{field: record[field] for field in fields})
+            if record['password_hash']:
+                user.password = record['password_hash']
+                with_password.append(user)
+            else:
+                without_password.append(user)
+        User.objects.bulk_update(with_password, fields + ['password'], batch_size=self.batch_size)
+        User.objects.bulk_update(without_password, fields, batch_size=self.batch_size)
+        return {record['username']: existing[record['username']] for record in records}
+
+    def _save_profiles(self, records, user_ids, check_existing):
+        learners = [
+            Learner(user_id=user_ids[record['username']], occupation=record['occupation'],
+                    social_link=record['social_link'])
+            for record in records if record['role'] == 'learner'
+        ]
+        instructors = [
+            Instructor(user_id=user_ids[record['username']], full_time=record['full_time'])
+            for record in records if record['role'] == 'instructor'
+        ]
+        if check_existing:
+            # An updated user whose role changed loses the profile of the old role
+            Learner.objects.filter(user_id__in=[profile.user_id for profile in instructors]).delete()
+            Instructor.objects.filter(user_id__in=[profile.user_id for profile in learners]).delete()
+        self._save(Learner, learners, ['occupation', 'social_link'], check_existing)
+        self._save(Instructor, instructors, ['full_time'], check_existing)
+        self.counts['learners'] += len(learners)
+        self.counts['instructors'] += len(instructors)
+
+    def _save(self, model, profiles, fields, check_existing):
+        """Create profiles, updating the ones updated users already have"""
+        if check_existing and profiles:
+            existing = dict(model.objects.filter(user_id__in=[profile.user_id for profile in profiles])
+                            .values_list('user_id', 'id'))
+            for profile in profiles:
+                profile.pk = existing.get(profile.user_id)
+            model.objects.bulk_update([p for p in profiles if p.pk], fields, batch_size=self.batch_size)
+            profiles = [p for p in profiles if not p.pk]
+        model.objects.bulk_create(profiles, batch_size=self.batch_size)
@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from .content_version import get_course_version
+from .models import Question, Choice, ExamConfig, LessonQuota
+from .routers import pin_to_primary
+import random
+
+# Exam paper for a course
+# The question-and-choice structure is loaded with one prefetch and cached
+# under the course version, so every learner taking the same exam shares
+# it. Choice order is shuffled per learner and attempt in Python with a
+# seeded RNG: a reload shows the same order and grading can reproduce it.
+
+# Bump when the layout of the cached paper changes
+EXAM_PAPER_FORMAT = 2
+
+
+def build_exam_paper(course_id, question_ids=None):
+    """Load the questions and choices of a course in two queries"""
+    questions = Question.objects.filter(lesson__course_id=course_id)
+    if question_ids is not None:
+        # Only the questions drawn for one attempt
+        questions = questions.filter(id__in=question_ids)
+    questions = (questions.order_by('id')
+                 .prefetch_related(Prefetch('choice_set', queryset=Choice.objects.order_by('id'))))
+    paper = []
+    for question in questions:
+        choices = question.choice_set.all()
+        paper.append({
+            'question': {
+                'id': question.id,
+                'lesson_id': question.lesson_id,
+                'question_text': question.question_text,
+                'grade': question.grade,
+                # Several correct choices make it a multi-select question
+                'multiple': sum(1 for choice in choices if choice.is_correct) > 1,
+            },
+            'choices': [
+                {'id': choice.id, 'choice_text': choice.choice_text}
+                for choice in choices
+            ],
+        })
+    return paper
+
+
+def _exam_paper_cache_key(course_id, version):
+    return f'onlinecourse:exam_paper:{EXAM_PAPER_FORMAT}:{course_id}:{version}'
+
+
+def get_exam_paper(course_id):
+    """Return the cached exam paper of a course, building it when missing"""
+    key = _exam_paper_cache_key(course_id, get_course_version(course_id))
+    paper = cache.get(key)
+    if paper is None:
+        # Cached under the current version, so never build it from a lagging replica
+        with pin_to_primary():
+            paper = build_exam_paper(course_id)
+        timeout = getattr(settings, 'ONLINECOURSE_EXAM_PAPER_TIMEOUT', 24 * 60 * 60)
+        cache.set(key, paper, timeout=timeout)
+    return paper
+
+
+def attempt_seed(user_id, attempt_token):
+    """Seed identifying one learner's attempt"""
+    return f'{user_id}:{attempt_token}'
+
+
+def shuffled_choices(choices, seed, question_id):
+    """Return choices in the deterministic order for this attempt"""
+    choices = list(choices)
+    random.Random(f'{seed}:{question_id}').shuffle(choices)
+    return choices
+
+
+def shuffle_paper(paper, seed):
+    """Return a copy of the paper with choices shuffled for this attempt"""
+    return [
+        {
+            'question': item['question'],
+            'choices': shuffled_choices(item['choices'], seed, item['question']['id']),
+        }
+        for item in paper
+    ]
+
+
+def build_question_pool(course_id):
+    """Load the question ids of a course grouped by lesson, plus its exam config"""
+    question_ids = []
+    lessons = {}
+    rows = (Question.objects.filter(lesson__course_id=course_id)
+            .order_by('id')
+            .values_list('id', 'lesson_id'))
+    for question_id, lesson_id in rows:
+        question_ids.append(question_id)
+        lessons.setdefault(lesson_id, []).append(question_id)
+    
+    config = ExamConfig.objects.filter(course_id=course_id).first()
+    quotas = {}
+    if config is not None:
+        quotas = dict(LessonQuota.objects.filter(exam_config=config)
+                      .values_list('lesson_id', 'questions'))
+    return {
+        'per_attempt': config.questions_per_attempt if config else 0,
+        'quotas': quotas,
+        'question_ids': question_ids,
+        'lessons': lessons,
+    }
+
+
+def _question_pool_cache_key(course_id, version):
+    return f'onlinecourse:question_pool:{EXAM_PAPER_FORMAT}:{course_id}:{version}'
+
+
+def get_question_pool(course_id):
+    """Return the cached question pool of a course, building it when missing"""
+    key = _question_pool_cache_key(course_id, get_course_version(course_id))
+    pool = cache.get(key)
+    if pool is None:
+        with pin_to_primary():
+            pool = build_question_pool(course_id)
+        timeout = getattr(settings, 'ONLINECOURSE_EXAM_PAPER_TIMEOUT', 24 * 60 * 60)
+        cache.set(key, pool, timeout=timeout)
+    return pool
+
+
+def is_sampled(pool):
+    """True when attempts draw a subset of the bank"""
+    return bool(pool['per_attempt'] or pool['quotas'])
+
+
+def sample_questions(pool, seed):
+    """
+    Draw the question ids of one attempt from the in-memory pool
+    Lesson quotas are drawn first, the rest of questions_per_attempt is
+    filled from the remaining questions of every lesson.
+    """
+    all_ids = pool['question_ids']
+    if not is_sampled(pool):
+        return list(all_ids)
+    
+    rng = random.Random(seed)
+    drawn = set()
+    for lesson_id, count in sorted(pool['quotas'].items()):
+        lesson_ids = pool['lessons'].get(lesson_id, [])
+        drawn.update(rng.sample(lesson_ids, min(count, len(lesson_ids))))
+    
+    remaining = pool['per_attempt'] - len(drawn)
+    if remaining > 0:
+        # Sample candidate positions and skip the ones already drawn, so
+        # the cost follows the number of draws rather than the bank size
+        while remaining > 0 and len(drawn) < len(all_ids):
+            question_id = all_ids[rng.randrange(len(all_ids))]
+            if question_id not in drawn:
+                drawn.add(question_id)
+                remaining -= 1
+    return sorted(drawn)
+
+
+def get_attempt_paper(course_id, question_ids):
+    """Return the paper holding just the questions drawn for an attempt"""
+    if is_sampled(get_question_pool(course_id)):
+        # Load only the drawn questions instead of the whole bank
+        return build_exam_paper(course_id, question_ids)
+    wanted = set(question_ids)
+    return [item for item in get_exam_paper(course_id) if item['question']['id'] in wanted]
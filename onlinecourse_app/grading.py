@@ -0,0 +1,270 @@
+from collections import namedtuple
+from django.conf import settings
+from django.db import connection, transaction
+from .analytics import record_submission, record_submissions
+from .models import Choice, Submission, GradedAnswer, ExamAttempt
+from .progress import record_progress, record_progress_many
+
+# Grading engine
+# Answers are graded in memory against the answer key by comparing the
+# set of selected choice ids with the set of correct ones. Question grades
+# are used as weights; questions with several correct choices accept
+# several selections and can earn partial credit.
+
+GradeResult = namedtuple('GradeResult', [
+    'score', 'points', 'max_points', 'correct_answers', 'graded_answers',
+])
+
+
+def _parse_choice_id(value):
+    """Turn a posted choice id into an int, ignoring junk values"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def group_selections(answer_key, choice_ids):
+    """Group choice ids by question, dropping ids the answer key doesn't know"""
+    selections = {}
+    for choice_id in choice_ids:
+        question_id = answer_key.question_for_choice(choice_id)
+        if question_id is not None:
+            selections.setdefault(question_id, set()).add(choice_id)
+    return selections
+
+
+def selections_from_post(answer_key, question_ids, post):
+    """Read the selected choices of each question from the exam form"""
+    selections = {}
+    for question_id in question_ids:
+        for value in post.getlist(f'question_{question_id}'):
+            choice_id = _parse_choice_id(value)
+            # Only choices belonging to this question count as an answer
+            if choice_id and answer_key.question_for_choice(choice_id) == question_id:
+                selections.setdefault(question_id, set()).add(choice_id)
+    return selections
+
+
+def grade_question(question, selected_ids, partial_credit=True):
+    """Return the points earned on one question"""
+    correct_ids = question.correct_ids
+    if not selected_ids or not correct_ids:
+        return 0.0
+    if selected_ids == correct_ids:
+        return float(question.grade)
+    if partial_credit and len(correct_ids) > 1:
+        # Each right pick earns a share, each wrong pick cancels one
+        right = len(selected_ids & correct_ids)
+        wrong = len(selected_ids - correct_ids)
+        return question.grade * max(right - wrong, 0) / len(correct_ids)
+    return 0.0
+
+
+def grade_attempt(answer_key, question_ids, selections, partial_credit=None):
+    """Grade one attempt and build its unsaved GradedAnswer rows"""
+    if partial_credit is None:
+        partial_credit = getattr(settings, 'ONLINECOURSE_PARTIAL_CREDIT', True)
+    
+    points = 0.0
+    max_points = 0
+    correct_answers = 0
+    graded_answers = []
+    for question_id in question_ids:
+        question = answer_key.questions.get(question_id)
+        if question is None:
+            # Question removed since the attempt was drawn
+            continue
+        selected_ids = selections.get(question_id, set())
+        earned = grade_question(question, selected_ids, partial_credit)
+        is_correct = bool(selected_ids) and selected_ids == question.correct_ids
+        
+        points += earned
+        max_points += question.grade
+        if is_correct:
+            correct_answers += 1
+        graded_answers.append(GradedAnswer(
+            question_id=question_id,
+            selected_choice_id=min(selected_ids) if selected_ids else None,
+            is_correct=is_correct,
+            points_earned=earned,
+        ))
+    
+    score = (points / max_points) * 100 if max_points > 0 else 0
+    return GradeResult(score, points, max_points, correct_answers, graded_answers)
+
+
+def grade_batch(answer_key, attempts, partial_credit=None):
+    """
+    Grade many attempts of one course against the same answer key
+    attempts yields (submission id, question ids, selected choice ids).
+    """
+    for submission_id, question_ids, choice_ids in attempts:
+        selections = group_selections(answer_key, choice_ids)
+        yield submission_id, grade_attempt(answer_key, question_ids, selections, partial_credit)
+
+
+def load_answers(submission_ids):
+    """
+    Read what was drawn and selected for some stored submissions
+    Returns {submission id: (question ids or None, choice ids)}; question
+    ids are None for submissions made before attempts were recorded.
+    """
+    drawn = dict(ExamAttempt.objects.filter(submission_id__in=submission_ids)
+                 .values_list('submission_id', 'question_ids'))
+    
+    selected = {}
+    Through = Submission.choices.through
+    rows = Through.objects.filter(submission_id__in=submission_ids).values_list('submission_id', 'choice_id')
+    for submission_id, choice_id in rows:
+        selected.setdefault(submission_id, []).append(choice_id)
+    
+    return {
+        submission_id: (drawn.get(submission_id), selected.get(submission_id, []))
+        for submission_id in submission_ids
+    }
+
+
+# Submission write path
+# A submission, its selected choices and its graded answers are written
+# in one short transaction with a fixed number of statements, so the
+# SQLite write lock is held for O(1) statements instead of O(questions).
+
+
+def valid_choice_ids(choice_ids, question_ids):
+    """Return the subset of choice_ids that belong to the given questions"""
+    if not choice_ids:
+        return set()
+    return set(Choice.objects.filter(id__in=choice_ids, question_id__in=question_ids)
+               .values_list('id', flat=True))
+
+
+def find_submission(user, idempotency_key):
+    """Return the id of the learner's submission made with this key, if any"""
+    if not idempotency_key:
+        return None
+    return (Submission.objects.filter(user=user, idempotency_key=idempotency_key)
+            .values_list('id', flat=True).first())
+
+
+def save_submission(user, course_id, lesson_id, score, question_ids, graded_answers, choice_ids,
+                    attempt=None, idempotency_key=None):
+    """
+    Write a graded submission atomically
+    graded_answers are unsaved GradedAnswer objects and choice_ids the
+    selected choices. The attempt, if given, is closed by linking it to
+    the submission. Course analytics and the learner's enrollment are
+    updated in the same transaction.
+    A second submission with the same idempotency_key raises IntegrityError.
+    """
+    with transaction.atomic():
+        # One id__in lookup validates every posted choice
+        valid_ids = valid_choice_ids(set(choice_ids), question_ids)
+        
+        submission = Submission.objects.create(
+            user=user, lesson_id=lesson_id, score=score, idempotency_key=idempotency_key or None
+        )
+        
+        # Selected choices go into the M2M through table with one INSERT
+        Through = Submission.choices.through
+        Through.objects.bulk_create([
+            Through(submission_id=submission.id, choice_id=choice_id)
+            for choice_id in sorted(valid_ids)
+        ])
+        
+        for answer in graded_answers:
+            answer.submission = submission
+            if answer.selected_choice_id not in valid_ids:
+                answer.selected_choice_id = None
+        GradedAnswer.objects.bulk_create(graded_answers)
+        
+        if attempt is not None:
+            ExamAttempt.objects.filter(pk=attempt.pk).update(submission=submission)
+            attempt.submission = submission
+        
+        record_submission(course_id, score, graded_answers)
+        record_progress(user.pk, course_id, score, submission.submitted_at)
+    
+    return submission
+
+
+# Asynchronous grading
+# With ONLINECOURSE_ASYNC_GRADING on, submit only stores the raw answers
+# of a pending submission and returns. The grade_pending worker grades
+# the queue in batches and commits each batch in one transaction.
+
+
+def save_pending_submission(user, lesson_id, question_ids, choice_ids, attempt=None, idempotency_key=None):
+    """
+    Write an ungraded submission atomically
+    Only the submission, its selected choices and the attempt link are
+    written; grading and analytics wait for the worker.
+    """
+    with transaction.atomic():
+        valid_ids = valid_choice_ids(set(choice_ids), question_ids)
+        
+        submission = Submission.objects.create(
+            user=user, lesson_id=lesson_id, status=Submission.PENDING,
+            idempotency_key=idempotency_key or None,
+        )
+        
+        Through = Submission.choices.through
+        Through.objects.bulk_create([
+            Through(submission_id=submission.id, choice_id=choice_id)
+            for choice_id in sorted(valid_ids)
+        ])
+        
+        if attempt is not None:
+            ExamAttempt.objects.filter(pk=attempt.pk).update(submission=submission)
+            attempt.submission = submission
+    
+    return submission
+
+
+def pending_submissions(limit):
+    """(submission id, course id) of the oldest pending submissions"""
+    return list(Submission.objects.filter(status=Submission.PENDING)
+                .order_by('id').values_list('id', 'lesson__course_id')[:limit])
+
+
+def save_graded_batch(results):
+    """
+    Write graded pending submissions in one transaction
+    results maps a course id to its [(submission id, GradeResult)].
+    Submissions that are no longer pending (graded by another worker) are
+    skipped. Analytics and enrollments follow in the same transaction.
+    Returns the number of submissions written.
+    """
+    submission_ids = [submission_id for graded in results.values() for submission_id, _ in graded]
+    with transaction.atomic():
+        pending = Submission.objects.filter(id__in=submission_ids, status=Submission.PENDING)
+        if connection.features.has_select_for_update_skip_locked:
+            # Rows another worker is writing are left to it
+            pending = pending.select_for_update(skip_locked=True)
+        rows = pending.values_list('id', 'user_id', 'submitted_at')
+        pending_by_id = {submission_id: (user_id, submitted_at) for submission_id, user_id, submitted_at in rows}
+        
+        submissions = []
+        graded_answers = []
+        progress = []
+        for course_id, graded in results.items():
+            scored = []
+            for submission_id, result in graded:
+                if submission_id not in pending_by_id:
+                    continue
+                submissions.append(Submission(id=submission_id, score=result.score, status=Submission.GRADED))
+                for answer in result.graded_answers:
+                    answer.submission_id = submission_id
+                    graded_answers.append(answer)
+                scored.append((result.score, result.graded_answers))
+                user_id, submitted_at = pending_by_id[submission_id]
+                progress.append((user_id, course_id, result.score, submitted_at))
+            record_submissions(course_id, scored)
+        
+        GradedAnswer.objects.bulk_create(graded_answers, batch_size=1000)
+        Submission.objects.bulk_update(submissions, ['score', 'status'], batch_size=500)
+        # A learner's latest submission sets their last score
+        progress.sort(key=lambda row: row[3])
+        record_progress_many(progress)
+    
+    return len(submissions)
@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from onlinecourse_app.archive import archive_submissions
+from onlinecourse_app.models import Submission
+import time
+
+
+class Command(BaseCommand):
+    help = "Move graded submissions older than the retention window into the compact archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=getattr(settings, 'ONLINECOURSE_ARCHIVE_AFTER_DAYS', 365),
+                            help='Archive submissions made more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Submissions moved per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the submissions that would be archived')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            count = Submission.objects.filter(submitted_at__lt=cutoff, status=Submission.GRADED).count()
+            self.stdout.write(f'{count} submissions made before {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        started = time.monotonic()
+        archived = 0
+        for archived in archive_submissions(cutoff, options['batch_size'], options['pause']):
+            self.stdout.write(f'Archived {archived} submissions')
+
+        elapsed = time.monotonic() - started
+        rate = archived / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} submissions made before {cutoff:%Y-%m-%d} in {elapsed:.1f}s ({rate:.0f}/s)'
+        ))
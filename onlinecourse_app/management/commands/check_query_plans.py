@@ -0,0 +1,109 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from onlinecourse_app.models import Lesson, Question, Choice, Submission, GradedAnswer, ExamAttempt, Enrollment, ArchivedSubmission
+from onlinecourse_app.reporting import filter_submissions
+import re
+
+# Patterns of a full table scan in EXPLAIN output, per database vendor.
+# SQLite reports "SCAN <table>" without an index, or "SCAN <table> USING
+# INDEX" when it walks a whole index; the latter is fine for a LIMITed
+# read in index order, so only bare scans fail.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?P<table>\w+)\b(?! USING)'),
+    'postgresql': re.compile(r'\bSeq Scan on (?P<table>\w+)'),
+    'mysql': re.compile(r"'table': '(?P<table>\w+)'.*'type': 'ALL'"),
+}
+
+SORT_PATTERN = re.compile(r'USE TEMP B-TREE FOR ORDER BY|\bSort\b')
+
+
+def hot_queries(course_id=1, lesson_id=1, question_id=1, user_id=1, submission_id=1):
+    """(name, queryset) for each query the views, grading and admin run per request"""
+    since = timezone.now() - timedelta(days=30)
+    question_ids = [question_id, question_id + 1]
+    return [
+        ('course_details lessons',
+         Lesson.objects.filter(course_id=course_id).order_by('id')),
+        ('answer key questions',
+         Question.objects.filter(lesson__course_id=course_id).order_by('id')
+         .values_list('id', 'lesson_id', 'grade', 'question_text')),
+        ('answer key choices',
+         Choice.objects.filter(question__lesson__course_id=course_id).order_by('id')
+         .values_list('id', 'question_id', 'is_correct', 'choice_text')),
+        ('correct choices of questions',
+         Choice.objects.filter(question_id__in=question_ids, is_correct=True).values_list('id', flat=True)),
+        ('valid choice ids',
+         Choice.objects.filter(id__in=[1, 2], question_id__in=question_ids).values_list('id', flat=True)),
+        ('open exam attempt',
+         ExamAttempt.objects.filter(user_id=user_id, course_id=course_id, submission__isnull=True)
+         .order_by('-id')[:1]),
+        ('result page answers',
+         GradedAnswer.objects.filter(submission_id=submission_id).order_by('question_id')),
+        ('my courses',
+         Enrollment.objects.filter(user_id=user_id).select_related('course').order_by('-last_attempt_at', '-id')),
+        ('enrollment of a submit',
+         Enrollment.objects.filter(user_id=user_id, course_id=course_id)),
+        ('learner submission list',
+         Submission.objects.filter(user_id=user_id, id__gt=0).order_by('id')[:101]),
+        ('learner submissions since',
+         filter_submissions(user_id=user_id, since=since).order_by('-submitted_at')[:100]),
+        ('lesson submissions since',
+         Submission.objects.filter(lesson_id=lesson_id, submitted_at__gte=since)
+         .order_by('-submitted_at')[:100]),
+        ('course export page',
+         filter_submissions(course_id=course_id, since=since).filter(id__gt=0).order_by('id')[:2000]),
+        ('archived course export page',
+         filter_submissions(course_id=course_id, since=since, archived=True).filter(id__gt=0)
+         .order_by('id')[:2000]),
+        ('grading queue',
+         Submission.objects.filter(status=Submission.PENDING).order_by('id').values_list('id', 'lesson__course_id')[:500]),
+        ('archive batch',
+         Submission.objects.filter(submitted_at__lt=since, status=Submission.GRADED, id__gt=0)
+         .order_by('id').values_list('id', flat=True)[:500]),
+        ('archived learner submissions',
+         ArchivedSubmission.objects.filter(user_id=user_id).order_by('-submitted_at')[:100]),
+        ('admin submissions by date',
+         Submission.objects.filter(submitted_at__gte=since).order_by('-submitted_at', '-id')[:100]),
+        ('admin lessons of a course with question count',
+         Lesson.objects.filter(course_id=course_id).annotate(question_count=Coalesce(Subquery(
+             Question.objects.filter(lesson=OuterRef('pk')).order_by().values('lesson')
+             .annotate(count=Count('pk')).values('count')
+         ), 0)).order_by('-id')[:100]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot queries and fail when one of them scans a whole table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, queryset in hot_queries():
+            alias = router.db_for_read(queryset.model)
+            vendor = connections[alias].vendor
+            pattern = FULL_SCAN_PATTERNS.get(vendor)
+            if pattern is None:
+                raise CommandError(f'No full scan pattern for the {vendor} backend')
+
+            plan = queryset.explain()
+            scanned = sorted({match.group('table') for match in pattern.finditer(plan)})
+            if scanned:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {", ".join(scanned)}'))
+            elif SORT_PATTERN.search(plan):
+                self.stdout.write(self.style.WARNING(f'SORT       {name}'))
+            else:
+                self.stdout.write(f'ok         {name}')
+            if options['verbose_plans'] or scanned:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries fall back to a full scan')
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index'))
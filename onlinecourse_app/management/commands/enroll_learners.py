@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from onlinecourse_app.enrollment import UserImporter, iter_user_csv
+import django
+import os
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = "Create users with Learner or Instructor profiles from a CSV, hashing passwords in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file, or '-' for stdin")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users written per transaction')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Processes hashing passwords (1 hashes in this process)')
+        parser.add_argument('--update', action='store_true',
+                            help='Update existing usernames instead of skipping them')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        processes = options['processes']
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        pool = ProcessPoolExecutor(processes, initializer=django.setup) if processes > 1 else None
+        map_function = map
+        if pool is not None:
+            def map_function(function, items):
+                # A few chunks per process keeps them all busy to the end of a batch
+                return pool.map(function, items, chunksize=max(len(items) // (processes * 4), 1))
+
+        try:
+            importer = UserImporter(options['batch_size'], options['update'], map_function)
+            started = time.monotonic()
+            counts = importer.counts
+            for counts in importer.run(iter_user_csv(stream)):
+                done = counts['created'] + counts['updated'] + counts['skipped']
+                rate = done / (time.monotonic() - started)
+                self.stdout.write(f"Processed {done} users ({rate:.0f}/s)")
+        except ValueError as e:
+            raise CommandError(f'Enrollment failed: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        done = counts['created'] + counts['updated'] + counts['skipped']
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['created']}, updated {counts['updated']} and skipped {counts['skipped']} users "
+            f"({counts['learners']} learners, {counts['instructors']} instructors) "
+            f"in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} users/s)"
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from onlinecourse_app.catalog_io import iter_catalog, write_jsonl, write_csv
+
+
+class Command(BaseCommand):
+    help = "Export courses, lessons, questions and choices as JSON Lines or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='Output format (default: from the file extension)')
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help='Only export this course (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Questions read per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        output_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        write = write_csv if output_format == 'csv' else write_jsonl
+        records = iter_catalog(options['course_ids'], batch_size=options['batch_size'])
+        
+        if path == '-':
+            write(records, self.stdout)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            count = write(records, stream)
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} records to {path}'))
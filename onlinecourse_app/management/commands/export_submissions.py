@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from onlinecourse_app.reporting import parse_filters, iter_export_rows, csv_lines, jsonl_lines
+
+
+class Command(BaseCommand):
+    help = "Export submissions, archived ones included, with user, lesson and course as CSV or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Output format (default: from the file extension)')
+        parser.add_argument('--course', help='Only submissions of this course id')
+        parser.add_argument('--since', help='Submitted on or after this ISO date/datetime')
+        parser.add_argument('--until', help='Submitted on or before this ISO date/datetime')
+        parser.add_argument('--passed', help='1 for passed only, 0 for failed only')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows read per query')
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        path = options['path']
+        output_format = options['format'] or ('jsonl' if path.endswith('.jsonl') else 'csv')
+        rows = iter_export_rows(filters, chunk_size=options['chunk_size'])
+        lines = jsonl_lines(rows) if output_format == 'jsonl' else csv_lines(rows)
+        
+        if path == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            for line in lines:
+                stream.write(line)
+                count += 1
+        if output_format == 'csv':
+            count -= 1  # header
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} submissions to {path}'))
@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from onlinecourse_app.answer_key import build_answer_key
+from onlinecourse_app.grading import grade_batch, load_answers, pending_submissions, save_graded_batch
+from onlinecourse_app.models import Course
+from onlinecourse_app.routers import pin_to_primary
+import django
+import time
+
+
+def _grade_chunk(job):
+    """Grade a chunk of attempts; runs in the worker processes too"""
+    answer_key, attempts = job
+    return answer_key.course_id, list(grade_batch(answer_key, attempts))
+
+
+class Command(BaseCommand):
+    help = "Grade pending submissions in batches (used with ONLINECOURSE_ASYNC_GRADING)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Submissions graded and written per transaction')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Grade each batch on a pool of this many processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        processes = options['processes']
+        # Answer keys of the courses seen so far, reused while their version holds
+        self.answer_keys = {}
+        pool = ProcessPoolExecutor(processes, initializer=django.setup) if processes > 1 else None
+        graded = 0
+        try:
+            while True:
+                pending = pending_submissions(batch_size)
+                if not pending:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                started = time.monotonic()
+                try:
+                    written = self._grade(pending, pool, processes)
+                except OperationalError as e:
+                    # e.g. "database is locked" under a submit burst; the
+                    # batch is still pending and is picked up again
+                    self.stderr.write(f'Batch of {len(pending)} failed, retrying: {e}')
+                    time.sleep(options['poll_interval'])
+                    continue
+                graded += written
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'Graded {written} submissions in {elapsed * 1000:.0f}ms ({graded} total)')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Done: {graded} submissions graded'))
+
+    def _answer_key(self, course_id, version):
+        answer_key = self.answer_keys.get(course_id)
+        if answer_key is None or answer_key.version != version:
+            with pin_to_primary():
+                answer_key = self.answer_keys[course_id] = build_answer_key(course_id, version)
+        return answer_key
+
+    def _grade(self, pending, pool, processes):
+        """Grade one batch of (submission id, course id) and write it"""
+        answers = load_answers([submission_id for submission_id, _ in pending])
+        by_course = {}
+        for submission_id, course_id in pending:
+            by_course.setdefault(course_id, []).append(submission_id)
+        # Versions come from the database, not the cache: a per-process
+        # cache would never see the edits made through the web workers
+        with pin_to_primary():
+            versions = dict(Course.objects.filter(pk__in=by_course).values_list('id', 'content_version'))
+
+        jobs = []
+        for course_id, submission_ids in by_course.items():
+            answer_key = self._answer_key(course_id, versions.get(course_id))
+            attempts = []
+            for submission_id in submission_ids:
+                question_ids, choice_ids = answers[submission_id]
+                if question_ids is None:
+                    question_ids = answer_key.question_ids
+                attempts.append((submission_id, question_ids, choice_ids))
+            # One chunk per process, so a single busy course still spreads out
+            size = -(-len(attempts) // processes)
+            jobs += [(answer_key, attempts[start:start + size]) for start in range(0, len(attempts), size)]
+
+        results = {}
+        for course_id, graded in (pool.map(_grade_chunk, jobs) if pool else map(_grade_chunk, jobs)):
+            results.setdefault(course_id, []).extend(graded)
+        return save_graded_batch(results)
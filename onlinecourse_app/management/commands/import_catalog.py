@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from onlinecourse_app.catalog_io import CatalogImporter, iter_jsonl, iter_csv
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = "Import courses, lessons, questions and choices from JSON Lines or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Records inserted per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            records = iter_csv(stream) if input_format == 'csv' else iter_jsonl(stream)
+            importer = CatalogImporter(batch_size=options['batch_size'])
+            started = time.monotonic()
+            counts = importer.counts
+            for counts in importer.run(records):
+                self.stdout.write(f"Imported {counts['questions']} questions")
+        except (ValueError, KeyError) as e:
+            raise CommandError(f'Import failed: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['courses']} courses, {counts['lessons']} lessons, "
+            f"{counts['questions']} questions and {counts['choices']} choices in {elapsed:.1f}s"
+        ))
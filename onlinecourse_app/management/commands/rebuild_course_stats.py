@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from onlinecourse_app.analytics import rebuild_course_stats
+from onlinecourse_app.models import Course
+from onlinecourse_app.progress import rebuild_enrollments
+
+
+class Command(BaseCommand):
+    help = "Rebuild course and question analytics and learner enrollments from historic submissions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int,
+                            help='Courses to rebuild (default: all)')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by('id')
+        if options['course_ids']:
+            courses = courses.filter(id__in=options['course_ids'])
+        
+        for course_id in courses.values_list('id', flat=True):
+            rebuild_course_stats(course_id)
+            rebuild_enrollments(course_id)
+            self.stdout.write(f'Rebuilt stats and enrollments of course {course_id}')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from onlinecourse_app.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of courses, lessons and questions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int,
+                            help='Courses to re-index (default: drop and rebuild everything)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        course_ids = options['course_ids'] or None
+        count = 0
+        for count in get_search_backend().rebuild(course_ids, options['batch_size']):
+            self.stdout.write(f'Indexed {count} documents')
+        self.stdout.write(self.style.SUCCESS(f'Done: {count} documents'))
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from onlinecourse_app.analytics import rebuild_course_stats
+from onlinecourse_app.answer_key import build_answer_key
+from onlinecourse_app.grading import grade_batch, load_answers
+from onlinecourse_app.models import Course, Submission, GradedAnswer
+from onlinecourse_app.progress import rebuild_enrollments
+import time
+
+
+class Command(BaseCommand):
+    help = "Re-grade every submission of a course against its current answer key"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Submissions graded and written per transaction')
+
+    def handle(self, *args, **options):
+        course_id = options['course_id']
+        chunk_size = options['chunk_size']
+        if not Course.objects.filter(pk=course_id).exists():
+            raise CommandError(f'Course {course_id} does not exist')
+        
+        # Always grade against the database, not a possibly stale cache entry
+        answer_key = build_answer_key(course_id)
+        started = time.monotonic()
+        regraded = 0
+        last_id = 0
+        
+        while True:
+            # Keyset pagination keeps every chunk an indexed range scan
+            submission_ids = list(
+                Submission.objects.filter(lesson__course_id=course_id, id__gt=last_id)
+                .order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not submission_ids:
+                break
+            last_id = submission_ids[-1]
+            
+            results = list(grade_batch(answer_key, self._attempts(answer_key, submission_ids)))
+            self._write(results)
+            
+            regraded += len(results)
+            self.stdout.write(f'Re-graded {regraded} submissions')
+        
+        # Scores changed, so the course analytics and learner progress have to follow
+        rebuild_course_stats(course_id)
+        rebuild_enrollments(course_id)
+        
+        elapsed = time.monotonic() - started
+        rate = regraded / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-graded {regraded} submissions of course {course_id} in {elapsed:.1f}s ({rate:.0f}/s)'
+        ))
+
+    def _attempts(self, answer_key, submission_ids):
+        """Yield (submission id, question ids, choice ids) for a chunk"""
+        for submission_id, (question_ids, choice_ids) in load_answers(submission_ids).items():
+            # Submissions made before attempts were recorded used every question
+            if question_ids is None:
+                question_ids = answer_key.question_ids
+            yield submission_id, question_ids, choice_ids
+
+    def _write(self, results):
+        """Replace graded answers and scores of a chunk in one transaction"""
+        submissions = []
+        graded_answers = []
+        for submission_id, result in results:
+            submissions.append(Submission(id=submission_id, score=result.score, status=Submission.GRADED))
+            for answer in result.graded_answers:
+                answer.submission_id = submission_id
+                graded_answers.append(answer)
+        
+        with transaction.atomic():
+            GradedAnswer.objects.filter(submission_id__in=[s.id for s in submissions]).delete()
+            GradedAnswer.objects.bulk_create(graded_answers, batch_size=1000)
+            Submission.objects.bulk_update(submissions, ['score', 'status'], batch_size=500)
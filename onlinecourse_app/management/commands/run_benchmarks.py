@@ -0,0 +1,177 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.conf import settings
+from django.test.utils import override_settings
+from django.urls import reverse
+from onlinecourse_app.attempts import get_or_start_attempt
+from onlinecourse_app.exam_paper import get_attempt_paper
+from onlinecourse_app.middleware import RequestSample
+from onlinecourse_app.models import Course, Question, Submission
+from urllib.parse import quote
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+
+class Command(BaseCommand):
+    help = "Benchmark every onlinecourse_app route and report queries, latency and memory as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per route')
+        parser.add_argument('--course', type=int, help='Course to use (default: the one with most questions)')
+        parser.add_argument('--username', default='benchmark_runner',
+                            help='Staff user the benchmark logs in as (created if missing)')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        course = self._course(options['course'])
+        user, _ = User.objects.get_or_create(username=options['username'], defaults={'is_staff': True})
+        client = Client()
+        client.force_login(user)
+        self.client = client
+        self.user = user
+        self.course = course
+        
+        iterations = options['iterations']
+        routes = {}
+        # The test client talks to 'testserver', like under the test runner
+        with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver']):
+            for name, prepare in self._routes():
+                routes[name] = self._measure(prepare, iterations)
+                self.stderr.write(f"{name}: {routes[name]['median_ms']} ms, {routes[name]['queries']} queries")
+        
+        report = {
+            'meta': {
+                'commit': self._commit(),
+                'iterations': iterations,
+                'course_id': course.id,
+                'course_questions': Question.objects.filter(lesson__course=course).count(),
+                'submissions': Submission.objects.count(),
+                'database': connection.vendor,
+            },
+            'routes': routes,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def _course(self, course_id):
+        if course_id:
+            try:
+                return Course.objects.get(pk=course_id)
+            except Course.DoesNotExist:
+                raise CommandError(f'Course {course_id} does not exist')
+        course = (Course.objects.annotate(questions=Count('lesson__question'))
+                  .order_by('-questions', 'id').first())
+        if course is None:
+            raise CommandError('No courses; run seed_benchmark_data first')
+        return course
+
+    def _commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _exam_answers(self):
+        """POST data answering every question of the open attempt"""
+        attempt = get_or_start_attempt(self.user, self.course.id)
+        data = {}
+        for item in get_attempt_paper(self.course.id, attempt.question_ids):
+            if item['choices']:
+                data[f"question_{item['question']['id']}"] = item['choices'][0]['id']
+        return data
+
+    def _latest_submission_id(self):
+        return Submission.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True).first()
+
+    def _routes(self):
+        """
+        Yield (name, prepare) for every route
+        prepare() sets up untimed state and returns the request to time.
+        """
+        course_id = self.course.id
+        client = self.client
+        
+        def get(url_name, *args, query=''):
+            url = reverse(url_name, args=args) + query
+            return lambda: (lambda: client.get(url))
+        
+        # Submit first so the result and detail routes have something to show
+        client.post(reverse('onlinecourse_app:submit', args=[course_id]), self._exam_answers())
+        
+        yield 'index', get('onlinecourse_app:index')
+        yield 'course_details', get('onlinecourse_app:course_details', course_id)
+        yield 'take_exam', get('onlinecourse_app:take_exam', course_id)
+        
+        search_term = (self.course.name.split() or ['exam'])[0]
+        yield 'search', get('onlinecourse_app:search', query=f'?q={quote(search_term)}')
+        
+        def autosave():
+            data = self._exam_answers()
+            return lambda: client.post(reverse('onlinecourse_app:autosave', args=[course_id]), data)
+        yield 'autosave', autosave
+        
+        def submit():
+            # Answers are prepared outside the timed section
+            data = self._exam_answers()
+            return lambda: client.post(reverse('onlinecourse_app:submit', args=[course_id]), data)
+        yield 'submit', submit
+        
+        submission_id = self._latest_submission_id()
+        yield 'show_exam_result', get('onlinecourse_app:show_exam_result', submission_id)
+        yield 'submission_details', get('onlinecourse_app:submission_details', submission_id)
+        yield 'list_submissions', get('onlinecourse_app:list_submissions', query=f'?course={course_id}')
+        yield 'my_courses', get('onlinecourse_app:my_courses')
+        yield 'course_analytics', get('onlinecourse_app:course_analytics', course_id)
+        yield 'course_analytics_json', get('onlinecourse_app:course_analytics_json', course_id)
+        yield 'export_submissions', get('onlinecourse_app:export_submissions', query=f'?course={course_id}')
+        yield 'query_stats', get('onlinecourse_app:query_stats')
+
+    def _run(self, prepare):
+        """Run one timed request, including reading a streamed body"""
+        call = prepare()
+        started = time.perf_counter()
+        response = call()
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        return response, time.perf_counter() - started
+
+    def _measure(self, prepare, iterations):
+        # Warm caches first, then count the queries of a warm request
+        self._run(prepare)
+        sample = RequestSample()
+        with connection.execute_wrapper(sample):
+            response, _ = self._run(prepare)
+        
+        timings = []
+        for _ in range(iterations):
+            _, elapsed = self._run(prepare)
+            timings.append(elapsed * 1000)
+        timings.sort()
+        
+        tracemalloc.start()
+        try:
+            self._run(prepare)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        return {
+            'status': response.status_code,
+            'queries': sample.queries,
+            'db_ms': round(sample.db_time * 1000, 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(int(round(0.95 * (len(timings) - 1))), len(timings) - 1)], 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
@@ -0,0 +1,150 @@
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from onlinecourse_app.analytics import rebuild_course_stats
+from onlinecourse_app.content_version import bump_course_version, bump_catalog_version
+from onlinecourse_app.models import Course, Lesson, Question, Choice, Submission, GradedAnswer
+from onlinecourse_app.progress import rebuild_enrollments
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic dataset of courses, users and historic submissions for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=5)
+        parser.add_argument('--lessons', type=int, default=10, help='Lessons per course')
+        parser.add_argument('--questions', type=int, default=10, help='Questions per lesson')
+        parser.add_argument('--choices', type=int, default=4, help='Choices per question')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--submissions', type=int, default=1000, help='Historic submissions in total')
+        parser.add_argument('--answers', type=int, default=10,
+                            help='Answered questions stored per historic submission')
+        parser.add_argument('--password', default='benchmark', help='Password of the seeded users')
+        parser.add_argument('--prefix', default='bench', help='Prefix of seeded course and user names')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        
+        courses = self._seed_catalog(options)
+        users = self._seed_users(options)
+        self._seed_submissions(options, courses, users)
+        
+        for course_id in courses:
+            bump_course_version(course_id)
+            rebuild_course_stats(course_id)
+            rebuild_enrollments(course_id)
+        bump_catalog_version()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(courses)} courses, {len(users)} users and '
+            f"{options['submissions']} submissions in {time.monotonic() - started:.1f}s"
+        ))
+
+    def _bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return objects
+
+    def _seed_catalog(self, options):
+        """Create courses, lessons, questions and choices; returns course id -> lesson ids"""
+        prefix = options['prefix']
+        courses = {}
+        for course_number in range(options['courses']):
+            with transaction.atomic():
+                course = Course.objects.create(
+                    name=f'{prefix} course {course_number}',
+                    description=f'Synthetic course {course_number} for benchmarks',
+                )
+                lessons = self._bulk(Lesson, [
+                    Lesson(course=course, title=f'Lesson {number}', content=f'Content of lesson {number}. ' * 20)
+                    for number in range(options['lessons'])
+                ])
+                questions = self._bulk(Question, [
+                    Question(lesson=lesson, question_text=f'Question {number} of {lesson.title}?',
+                             grade=self.rng.randint(1, 3))
+                    for lesson in lessons
+                    for number in range(options['questions'])
+                ])
+                for start in range(0, len(questions), self.batch_size):
+                    self._bulk(Choice, [
+                        Choice(question=question, choice_text=f'Choice {number}', is_correct=(number == 0))
+                        for question in questions[start:start + self.batch_size]
+                        for number in range(options['choices'])
+                    ])
+            courses[course.id] = [lesson.id for lesson in lessons]
+            self.stdout.write(f'Seeded course {course.id} with {len(questions)} questions')
+        return courses
+
+    def _seed_users(self, options):
+        """Create learners sharing one password hash; returns their ids"""
+        prefix = options['prefix']
+        password = make_password(options['password'])
+        existing = set(User.objects.filter(username__startswith=f'{prefix}_user_')
+                       .values_list('username', flat=True))
+        self._bulk(User, [
+            User(username=f'{prefix}_user_{number}', password=password)
+            for number in range(options['users'])
+            if f'{prefix}_user_{number}' not in existing
+        ])
+        return list(User.objects.filter(username__startswith=f'{prefix}_user_').values_list('id', flat=True))
+
+    def _seed_submissions(self, options, courses, users):
+        """Create historic submissions with some answered questions each"""
+        if not courses or not users:
+            return
+        
+        # Questions and choices of every course, read once
+        answers = {}
+        for course_id in courses:
+            choices = {}
+            rows = (Choice.objects.filter(question__lesson__course_id=course_id)
+                    .values_list('question_id', 'id', 'is_correct'))
+            for question_id, choice_id, is_correct in rows:
+                choices.setdefault(question_id, []).append((choice_id, is_correct))
+            answers[course_id] = list(choices.items())
+        
+        course_ids = list(courses)
+        now = timezone.now()
+        Through = Submission.choices.through
+        remaining = options['submissions']
+        while remaining > 0:
+            count = min(remaining, self.batch_size)
+            remaining -= count
+            batch_courses = [self.rng.choice(course_ids) for _ in range(count)]
+            with transaction.atomic():
+                submissions = self._bulk(Submission, [
+                    Submission(
+                        user_id=self.rng.choice(users),
+                        lesson_id=courses[course_id][0],
+                        score=round(self.rng.uniform(0, 100), 2),
+                    )
+                    for course_id in batch_courses
+                ])
+                # auto_now_add ignores explicit values, so spread dates per batch
+                Submission.objects.filter(id__in=[s.id for s in submissions]).update(
+                    submitted_at=now - timedelta(minutes=self.rng.randint(0, 365 * 24 * 60))
+                )
+                
+                through_rows = []
+                graded_answers = []
+                for submission, course_id in zip(submissions, batch_courses):
+                    questions = answers[course_id]
+                    for question_id, choices in self.rng.sample(questions, min(options['answers'], len(questions))):
+                        choice_id, is_correct = self.rng.choice(choices)
+                        through_rows.append(Through(submission_id=submission.id, choice_id=choice_id))
+                        graded_answers.append(GradedAnswer(
+                            submission_id=submission.id, question_id=question_id,
+                            selected_choice_id=choice_id, is_correct=is_correct,
+                            points_earned=1 if is_correct else 0,
+                        ))
+                self._bulk(Through, through_rows)
+                self._bulk(GradedAnswer, graded_answers)
+            self.stdout.write(f"Seeded {options['submissions'] - remaining} submissions")
@@ -0,0 +1,221 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import deque
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('onlinecourse_app.querystats')
+
+# Per-request query instrumentation
+# QueryStatsMiddleware counts SQL queries and DB time through
+# connection.execute_wrapper, times template rendering and the whole
+# request, and aggregates the samples per URL name into rolling
+# percentiles. Per-view query budgets log or raise when exceeded.
+# It is opt-in: enable it with ONLINECOURSE_QUERY_STATS = True.
+#
+# The execute wrapper stays installed on every connection and finds the
+# request's sample in a context variable. Context variables follow async
+# views into the threads that run their ORM calls, so the middleware works
+# the same under WSGI and ASGI, without a thread per async request.
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more SQL queries than its configured budget"""
+
+
+class RequestSample:
+    """Measurements of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Execute wrapper: time every query run on the connection
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+_current_sample = ContextVar('onlinecourse_query_sample', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection; times the queries of sampled requests"""
+    sample = _current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    return sample(execute, sql, params, many, context)
+
+
+def _install_query_timer(connection, **kwargs):
+    # First in the list: connection.execute_wrapper() blocks pop the last one
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+_template_timer_lock = threading.Lock()
+_template_timer_installed = False
+
+
+def _install_template_timer():
+    """Wrap Template.render once so top-level render time is recorded"""
+    global _template_timer_installed
+    with _template_timer_lock:
+        if _template_timer_installed:
+            return
+        original_render = Template.render
+
+        def timed_render(self, context):
+            sample = _current_sample.get()
+            if sample is None:
+                return original_render(self, context)
+            # Included templates are part of their parent's render time
+            sample.template_depth += 1
+            started = time.perf_counter()
+            try:
+                return original_render(self, context)
+            finally:
+                sample.template_depth -= 1
+                if sample.template_depth == 0:
+                    sample.template_time += time.perf_counter() - started
+
+        Template.render = timed_render
+        _template_timer_installed = True
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class QueryStats:
+    """Rolling window of request samples per URL name"""
+
+    METRICS = ['queries', 'db_ms', 'template_ms', 'wall_ms']
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._requests = {}
+
+    def add(self, view_name, record):
+        with self._lock:
+            samples = self._samples.get(view_name)
+            if samples is None:
+                samples = self._samples[view_name] = deque(maxlen=self.window)
+            samples.append(tuple(record[metric] for metric in self.METRICS))
+            self._requests[view_name] = self._requests.get(view_name, 0) + 1
+
+    def summary(self):
+        """Return p50/p95/p99 and max of every metric per URL name"""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+            requests = dict(self._requests)
+
+        summary = {}
+        for view_name, samples in sorted(snapshot.items()):
+            entry = {'requests': requests[view_name], 'window': len(samples)}
+            for position, metric in enumerate(self.METRICS):
+                ordered = sorted(sample[position] for sample in samples)
+                entry[metric] = {
+                    'p50': _percentile(ordered, 0.50),
+                    'p95': _percentile(ordered, 0.95),
+                    'p99': _percentile(ordered, 0.99),
+                    'max': ordered[-1],
+                }
+            summary[view_name] = entry
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._requests.clear()
+
+
+# Process wide statistics, read by the stats endpoint
+query_stats = QueryStats(getattr(settings, 'ONLINECOURSE_QUERY_STATS_WINDOW', 500))
+
+
+class QueryStatsMiddleware:
+    """Record query count, DB time, template time and wall time per URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'ONLINECOURSE_QUERY_STATS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'ONLINECOURSE_QUERY_BUDGETS', {})
+        self.budget_action = getattr(settings, 'ONLINECOURSE_QUERY_BUDGET_ACTION', 'log')
+        _install_template_timer()
+        # Connections opened from now on, in any thread, get the query timer
+        connection_created.connect(_install_query_timer)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Connections of this thread opened before the middleware was loaded
+        for alias in connections:
+            _install_query_timer(connections[alias])
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+        return self._record(request, response, sample, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+        return self._record(request, response, sample, time.perf_counter() - started)
+
+    def _record(self, request, response, sample, wall_time):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        record = {
+            'view': view_name,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': sample.queries,
+            'db_ms': round(sample.db_time * 1000, 3),
+            'template_ms': round(sample.template_time * 1000, 3),
+            'wall_ms': round(wall_time * 1000, 3),
+        }
+        query_stats.add(view_name, record)
+        logger.info(json.dumps(record))
+
+        budget = self.budgets.get(view_name)
+        if budget is not None and sample.queries > budget:
+            message = f'{view_name} ran {sample.queries} queries (budget {budget})'
+            if self.budget_action == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
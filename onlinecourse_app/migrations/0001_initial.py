@@ -0,0 +1,181 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('passes', models.IntegerField(default=0)),
+                ('score_total', models.FloatField(default=0)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='onlinecourse_app.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExamConfig',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('questions_per_attempt', models.PositiveIntegerField(default=0, help_text='0 draws every question of the course')),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='exam_config', to='onlinecourse_app.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Instructor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_time', models.BooleanField(default=True)),
+                ('total_learners', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Learner',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occupation', models.CharField(choices=[('student', 'Student'), ('developer', 'Software Developer'), ('data_scientist', 'Data Scientist'), ('dba', 'Database Admin')], default='student', max_length=20)),
+                ('social_link', models.URLField(blank=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Lesson',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('content', models.TextField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LessonQuota',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('questions', models.PositiveIntegerField(default=1)),
+                ('exam_config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_quotas', to='onlinecourse_app.examconfig')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.lesson')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Question',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_text', models.TextField()),
+                ('grade', models.IntegerField(default=1)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.lesson')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Choice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('choice_text', models.CharField(max_length=200)),
+                ('is_correct', models.BooleanField(default=False)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('correct', models.IntegerField(default=0)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='onlinecourse_app.question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScoreBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_buckets', to='onlinecourse_app.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('score', models.FloatField(default=0)),
+                ('choices', models.ManyToManyField(to='onlinecourse_app.choice')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GradedAnswer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_correct', models.BooleanField(default=False)),
+                ('points_earned', models.FloatField(default=0)),
+                ('selected_choice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='onlinecourse_app.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.question')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='graded_answers', to='onlinecourse_app.submission')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExamAttempt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seed', models.CharField(max_length=32)),
+                ('question_ids', models.JSONField(default=list)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('submission', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attempt', to='onlinecourse_app.submission')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'id'], name='lesson_course_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['lesson', 'id'], name='question_lesson_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(fields=['question', 'is_correct'], name='choice_question_correct_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scorebucket',
+            unique_together={('course', 'bucket')},
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['user', 'submitted_at'], name='submission_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['lesson', 'submitted_at'], name='submission_lesson_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gradedanswer',
+            index=models.Index(fields=['submission', 'question'], name='graded_submission_q_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examattempt',
+            index=models.Index(fields=['user', 'course', 'submission'], name='attempt_user_course_idx'),
+        ),
+    ]
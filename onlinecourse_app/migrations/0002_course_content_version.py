@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:38
+
+import onlinecourse_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinecourse_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='content_version',
+            field=models.BigIntegerField(default=onlinecourse_app.models.content_version_stamp, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinecourse_app', '0003_submission_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('graded', 'Graded')], default='graded', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='submission_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinecourse_app', '0005_enrollment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSubmission',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('submitted_at', models.DateTimeField()),
+                ('score', models.FloatField(default=0)),
+                ('answers', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinecourse_app.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_submissions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'submitted_at'], name='archived_user_time_idx'), models.Index(fields=['lesson', 'submitted_at'], name='archived_lesson_time_idx')],
+            },
+        ),
+    ]
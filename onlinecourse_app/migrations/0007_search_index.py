@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# The FTS5 index behind search.Fts5SearchBackend. Other databases use the
+# unindexed fallback backend, so there is nothing to create on them. The
+# replica gets the table through replication, like the rest of the schema.
+
+SEARCH_TABLE = 'onlinecourse_search'
+
+TITLE_WEIGHT = 5.0
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "title, body, course_id UNINDEXED, lesson_id UNINDEXED, "
+        "tokenize = 'porter unicode61', prefix = '2 3 4')"
+    )
+    # Persist the weighted ranking so ORDER BY rank uses it
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', %s)",
+        [f'bm25({TITLE_WEIGHT}, 1.0)'],
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinecourse_app', '0006_archivedsubmission'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,9 +1,18 @@
 from django.db import models
 from django.contrib.auth.models import User
+import time
+
+
+def content_version_stamp():
+    """Millisecond timestamp used as a course content version"""
+    return int(time.time() * 1000)
 
 class Course(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
+    # Bumped whenever the course, its lessons, questions or choices change
+    content_version = models.BigIntegerField(default=content_version_stamp, editable=False)
+    instructors = models.ManyToManyField('Instructor', blank=True, related_name='courses')
     
     def __str__(self):
         return self.name
@@ -13,6 +22,12 @@ class Lesson(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     content = models.TextField()
     
+    class Meta:
+        indexes = [
+            # Lessons of a course in id order (course details, exam paper)
+            models.Index(fields=['course', 'id'], name='lesson_course_id_idx'),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -21,6 +36,12 @@ class Question(models.Model):
     question_text = models.TextField()
     grade = models.IntegerField(default=1)
     
+    class Meta:
+        indexes = [
+            # Questions of a lesson in id order (answer key, exam paper)
+            models.Index(fields=['lesson', 'id'], name='question_lesson_id_idx'),
+        ]
+    
     def __str__(self):
         return self.question_text[:50]  # First 50 chars
 
@@ -29,6 +50,12 @@ class Choice(models.Model):
     choice_text = models.CharField(max_length=200)
     is_correct = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Correct choices of a question (grading)
+            models.Index(fields=['question', 'is_correct'], name='choice_question_correct_idx'),
+        ]
+    
     def __str__(self):
         return self.choice_text
 
@@ -36,8 +63,30 @@ class Submission(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
     choices = models.ManyToManyField(Choice)
-    submitted_at = models.DateTimeField(auto_now_add=True)
+    submitted_at = models.DateTimeField(auto_now_add=True, db_index=True)
     score = models.FloatField(default=0)
+    # Sent with the submit POST; a repeated POST returns this submission
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # Pending submissions hold raw answers until the grade_pending worker grades them
+    PENDING = 'pending'
+    GRADED = 'graded'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (GRADED, 'Graded'),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=GRADED)
+    
+    class Meta:
+        indexes = [
+            # The grading queue; only pending rows are indexed, so it stays small
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='submission_pending_idx'),
+            # A learner's or a lesson's submissions within a date range
+            models.Index(fields=['user', 'submitted_at'], name='submission_user_time_idx'),
+            models.Index(fields=['lesson', 'submitted_at'], name='submission_lesson_time_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='submission_idempotency_key'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.lesson.title}"
@@ -73,4 +122,141 @@ class Learner(models.Model):
     def __str__(self):
         return self.user.username
 
+# Graded answer - one row per question of a submission
+class GradedAnswer(models.Model):
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name='graded_answers')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    selected_choice = models.ForeignKey(Choice, on_delete=models.SET_NULL, null=True, blank=True)
+    is_correct = models.BooleanField(default=False)
+    points_earned = models.FloatField(default=0)
+    
+    class Meta:
+        indexes = [
+            # Answers of a submission in question order (result page)
+            models.Index(fields=['submission', 'question'], name='graded_submission_q_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.submission_id} - {self.question_id}"
+
+# Exam configuration - how many questions each attempt draws from the bank
+class ExamConfig(models.Model):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='exam_config')
+    questions_per_attempt = models.PositiveIntegerField(
+        default=0, help_text='0 draws every question of the course'
+    )
+    
+    def __str__(self):
+        return f"{self.course.name} exam"
+
+# Lesson quota - minimum number of questions drawn from one lesson
+class LessonQuota(models.Model):
+    exam_config = models.ForeignKey(ExamConfig, on_delete=models.CASCADE, related_name='lesson_quotas')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
+    questions = models.PositiveIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.lesson.title}: {self.questions}"
+
+# Exam attempt - the questions drawn for one learner's attempt
+class ExamAttempt(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    seed = models.CharField(max_length=32)
+    question_ids = models.JSONField(default=list)
+    started_at = models.DateTimeField(auto_now_add=True)
+    submission = models.OneToOneField(
+        Submission, on_delete=models.SET_NULL, null=True, blank=True, related_name='attempt'
+    )
+    
+    class Meta:
+        indexes = [
+            # The open attempt of a learner in a course; without submission the
+            # planner picks the unique submission index and walks every open attempt
+            models.Index(fields=['user', 'course', 'submission'], name='attempt_user_course_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.course.name} ({self.seed})"
+
+# Course statistics - maintained incrementally on every submission
+class CourseStats(models.Model):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='stats')
+    attempts = models.IntegerField(default=0)
+    passes = models.IntegerField(default=0)
+    score_total = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.course.name} stats"
+
+# Score bucket - histogram of scores per course in 10% steps
+class ScoreBucket(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='score_buckets')
+    bucket = models.IntegerField()  # 0 = 0-10%, ..., 9 = 90-100%
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['course', 'bucket']
+    
+    def __str__(self):
+        return f"{self.course.name} {self.bucket * 10}%: {self.count}"
+
+# Question statistics - how often each question is answered correctly
+class QuestionStats(models.Model):
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='stats')
+    attempts = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.question} stats"
+
+# Enrollment - a learner's progress in a course, maintained on every submission
+class Enrollment(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollments')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
+    enrolled_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    best_score = models.FloatField(default=0)
+    last_score = models.FloatField(null=True, blank=True)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    passed = models.BooleanField(default=False)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='enrollment_user_course'),
+        ]
+        indexes = [
+            # A learner's courses, most recently attempted first
+            models.Index(fields=['user', 'last_attempt_at'], name='enrollment_user_recent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.course.name}"
+
+# Archived submission - an old attempt compacted into one row by archive_submissions
+class ArchivedSubmission(models.Model):
+    # The id of the archived submission, so result links keep working
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_submissions')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
+    submitted_at = models.DateTimeField()
+    score = models.FloatField(default=0)
+    # Graded answers and selected choices, packed by archive.pack_answers
+    answers = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # A learner's or a lesson's archived attempts within a date range
+            models.Index(fields=['user', 'submitted_at'], name='archived_user_time_idx'),
+            models.Index(fields=['lesson', 'submitted_at'], name='archived_lesson_time_idx'),
+        ]
+    
+    @property
+    def status(self):
+        return 'archived'
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.lesson.title} (archived)"
+
 # Create your models here.
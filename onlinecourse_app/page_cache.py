@@ -0,0 +1,128 @@
+from asgiref.sync import iscoroutinefunction
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+import hashlib
+
+# Versioned page cache
+# Catalog pages are rendered once per content version and kept in the
+# cache. The version also makes the ETag and Last-Modified validators, so
+# a browser revalidating an unchanged page gets a 304 without the view
+# running. Nothing expires on a timer: a content change bumps the version
+# and every page built from the old one is simply never asked for again.
+# Pages go to the ONLINECOURSE_PAGE_CACHE alias, so per-user pages can't
+# crowd answer keys and exam papers out of the default cache.
+
+
+def _cache():
+    return caches[getattr(settings, 'ONLINECOURSE_PAGE_CACHE', 'default')]
+
+
+def _variant(request, per_user):
+    """Which rendering of a page a request gets"""
+    if not request.user.is_authenticated:
+        return 'anon'
+    return f'user-{request.user.pk}' if per_user else 'auth'
+
+
+def _page_cache_key(name, version, variant):
+    return f'onlinecourse:page:{name}:{version}:{variant}'
+
+
+def _validators(name, version, variant):
+    """ETag and Last-Modified time of one rendering of a page"""
+    etag = quote_etag(hashlib.md5(f'{name}:{version}:{variant}'.encode()).hexdigest())
+    return etag, version // 1000
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.streaming
+
+
+def _finish(response, etag, last_modified, variant):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the page but revalidate it on every visit
+    if variant == 'anon':
+        patch_cache_control(response, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True, private=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def versioned_page(name, get_version, per_user=False):
+    """
+    Serve a GET view from the cache keyed on get_version(**view_kwargs)
+    The page varies on authentication state, or on the user when per_user
+    is set (for pages that show the username). When get_version returns
+    None the view runs uncached, e.g. to produce its 404. Async views get
+    an async wrapper, which expects an async get_version.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_versioned_page(view, name, get_version, per_user)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            version = get_version(**kwargs)
+            if version is None:
+                return view(request, *args, **kwargs)
+
+            variant = _variant(request, per_user)
+            etag, last_modified = _validators(name, version, variant)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                key = _page_cache_key(name, version, variant)
+                cached = _cache().get(key)
+                if cached is not None:
+                    content, content_type = cached
+                    response = HttpResponse(content, content_type=content_type)
+                else:
+                    response = view(request, *args, **kwargs)
+                    if not _cacheable(response):
+                        return response
+                    timeout = getattr(settings, 'ONLINECOURSE_PAGE_CACHE_TIMEOUT', 24 * 60 * 60)
+                    _cache().set(key, (response.content, response['Content-Type']), timeout=timeout)
+
+            return _finish(response, etag, last_modified, variant)
+        return wrapper
+    return decorator
+
+
+def _async_versioned_page(view, name, get_version, per_user):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await view(request, *args, **kwargs)
+        version = await get_version(**kwargs)
+        if version is None:
+            return await view(request, *args, **kwargs)
+
+        # Resolves the user once; request.user then needs no sync query
+        request.user = await request.auser()
+        variant = _variant(request, per_user)
+        etag, last_modified = _validators(name, version, variant)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = _page_cache_key(name, version, variant)
+            cached = await _cache().aget(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = await view(request, *args, **kwargs)
+                if not _cacheable(response):
+                    return response
+                timeout = getattr(settings, 'ONLINECOURSE_PAGE_CACHE_TIMEOUT', 24 * 60 * 60)
+                await _cache().aset(key, (response.content, response['Content-Type']), timeout=timeout)
+
+        return _finish(response, etag, last_modified, variant)
+    return wrapper
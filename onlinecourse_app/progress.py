@@ -0,0 +1,155 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Greatest
+from .analytics import PASSING_SCORE
+from .models import Submission, Enrollment, Instructor, ArchivedSubmission
+
+# Learner progress per course
+# An Enrollment row per learner and course holds the attempt count, best
+# and last score and pass status. It is created on the first graded
+# submission and bumped with F() expressions inside the submit
+# transaction, so a learner's dashboard reads one row per course instead
+# of aggregating their submissions. Instructor.total_learners counts the
+# distinct learners enrolled in any of an instructor's courses and is
+# bumped when a learner enrolls in the first of them.
+
+
+def _enroll(user_id, course_id):
+    """Create the enrollment; False when it already existed (a concurrent submit won)"""
+    try:
+        with transaction.atomic():
+            Enrollment.objects.create(user_id=user_id, course_id=course_id)
+    except IntegrityError:
+        return False
+
+    # Instructors of the course who didn't teach this learner yet
+    other_courses = (Enrollment.objects.filter(user_id=user_id, course__instructors=OuterRef('pk'))
+                     .exclude(course_id=course_id))
+    (Instructor.objects.filter(courses=course_id)
+     .filter(~Exists(other_courses))
+     .update(total_learners=F('total_learners') + 1))
+    return True
+
+
+def record_progress(user_id, course_id, score, attempted_at):
+    """Add one graded submission to the learner's enrollment in the course"""
+    updates = {
+        'attempts': F('attempts') + 1,
+        'best_score': Greatest('best_score', Value(score)),
+        'last_score': score,
+        'last_attempt_at': attempted_at,
+    }
+    if score >= PASSING_SCORE:
+        updates['passed'] = True
+
+    enrollment = Enrollment.objects.filter(user_id=user_id, course_id=course_id)
+    if not enrollment.update(**updates):
+        _enroll(user_id, course_id)
+        enrollment.update(**updates)
+
+
+def record_progress_many(attempts):
+    """
+    record_progress for a batch of graded submissions
+    attempts are (user id, course id, score, attempted at) tuples, in
+    submission order. They are merged per learner and course, missing
+    enrollments are created with one INSERT and all of them are updated
+    with one bulk UPDATE. The learner counts of the instructors of newly
+    enrolled courses are recounted after commit.
+    """
+    progress = {}
+    for user_id, course_id, score, attempted_at in attempts:
+        row = progress.get((user_id, course_id))
+        if row is None:
+            progress[(user_id, course_id)] = [1, score, score, attempted_at]
+        else:
+            row[0] += 1
+            row[1] = max(row[1], score)
+            row[2], row[3] = score, attempted_at
+    if not progress:
+        return
+
+    enrollments = Enrollment.objects.filter(user_id__in={user_id for user_id, _ in progress},
+                                            course_id__in={course_id for _, course_id in progress})
+    ids = {(user_id, course_id): enrollment_id
+           for enrollment_id, user_id, course_id in enrollments.values_list('id', 'user_id', 'course_id')}
+    missing = [key for key in progress if key not in ids]
+    if missing:
+        # A concurrent submit may enroll the same learner; its row is kept
+        Enrollment.objects.bulk_create([Enrollment(user_id=user_id, course_id=course_id)
+                                        for user_id, course_id in missing], ignore_conflicts=True)
+        ids = {(user_id, course_id): enrollment_id
+               for enrollment_id, user_id, course_id in enrollments.values_list('id', 'user_id', 'course_id')}
+        instructor_ids = list(Instructor.objects.filter(courses__in={course_id for _, course_id in missing})
+                              .values_list('id', flat=True).distinct())
+        transaction.on_commit(lambda: refresh_total_learners(instructor_ids))
+
+    updates = [
+        Enrollment(
+            id=ids[key],
+            attempts=F('attempts') + count,
+            best_score=Greatest('best_score', Value(best_score)),
+            last_score=last_score,
+            last_attempt_at=last_attempt_at,
+            passed=Value(True) if best_score >= PASSING_SCORE else F('passed'),
+        )
+        for key, (count, best_score, last_score, last_attempt_at) in progress.items()
+    ]
+    Enrollment.objects.bulk_update(updates, ['attempts', 'best_score', 'last_score', 'last_attempt_at', 'passed'],
+                                   batch_size=500)
+
+
+def refresh_total_learners(instructor_ids):
+    """Recount the learners of some instructors, e.g. after their courses changed"""
+    for instructor_id in instructor_ids:
+        total = (Enrollment.objects.filter(course__instructors=instructor_id)
+                 .values('user_id').distinct().count())
+        Instructor.objects.filter(pk=instructor_id).update(total_learners=total)
+
+
+def _progress_rows(submissions):
+    """Attempts, best and last score and last attempt per learner of some submissions"""
+    latest = submissions.filter(user_id=OuterRef('user_id')).order_by('-submitted_at', '-id')
+    return (submissions.values('user_id')
+            .annotate(attempts=Count('id'), best_score=Max('score'), last_attempt_at=Max('submitted_at'),
+                      last_score=Subquery(latest.values('score')[:1]))
+            .order_by('user_id'))
+
+
+def rebuild_enrollments(course_id):
+    """Recompute the enrollments of a course from its graded and archived submissions"""
+    with transaction.atomic():
+        progress = {}
+        for row in _progress_rows(ArchivedSubmission.objects.filter(lesson__course_id=course_id)):
+            progress[row['user_id']] = row
+        for row in _progress_rows(Submission.objects.filter(lesson__course_id=course_id,
+                                                            status=Submission.GRADED)):
+            archived = progress.get(row['user_id'])
+            if archived is not None:
+                row['attempts'] += archived['attempts']
+                row['best_score'] = max(row['best_score'], archived['best_score'])
+                if archived['last_attempt_at'] > row['last_attempt_at']:
+                    row['last_attempt_at'] = archived['last_attempt_at']
+                    row['last_score'] = archived['last_score']
+            progress[row['user_id']] = row
+        rows = progress.values()
+
+        existing = dict(Enrollment.objects.filter(course_id=course_id).values_list('user_id', 'id'))
+        enrollments = [
+            Enrollment(
+                id=existing.get(row['user_id']),
+                user_id=row['user_id'],
+                course_id=course_id,
+                attempts=row['attempts'],
+                best_score=row['best_score'],
+                last_score=row['last_score'],
+                last_attempt_at=row['last_attempt_at'],
+                passed=row['best_score'] >= PASSING_SCORE,
+            )
+            for row in rows
+        ]
+        fields = ['attempts', 'best_score', 'last_score', 'last_attempt_at', 'passed']
+        Enrollment.objects.bulk_update([e for e in enrollments if e.id], fields, batch_size=1000)
+        Enrollment.objects.bulk_create([e for e in enrollments if not e.id], batch_size=1000)
+
+    refresh_total_learners(Instructor.objects.filter(courses=course_id).values_list('id', flat=True))
@@ -0,0 +1,199 @@
+from datetime import datetime, time as dt_time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .analytics import PASSING_SCORE
+from .models import Submission, ArchivedSubmission
+from operator import itemgetter
+import csv
+import heapq
+import json
+
+# Submission exports
+# Rows are read page by page with keyset pagination on id, each page
+# streamed with .iterator(), so an export of millions of submissions uses
+# constant memory and every query is a short indexed range scan.
+# Submissions still waiting for grading have no score or pass status.
+# Archived submissions are read the same way from their own table and
+# merged in by id, so an export covers every attempt.
+
+EXPORT_FIELDS = [
+    'id', 'user_id', 'username', 'course_id', 'course', 'lesson_id', 'lesson',
+    'score', 'passed', 'submitted_at',
+]
+
+_COLUMNS = [
+    'id', 'user_id', 'user__username', 'lesson__course_id', 'lesson__course__name',
+    'lesson_id', 'lesson__title', 'score', 'submitted_at',
+]
+
+
+def _parse_moment(value, end_of_day=False):
+    """Parse an ISO date or datetime filter value"""
+    # Dates first: parse_datetime also reads a bare date, as midnight
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day, dt_time.max if end_of_day else dt_time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'Invalid date: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _parse_passed(value):
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'pass', 'passed'):
+        return True
+    if value in ('0', 'false', 'no', 'fail', 'failed'):
+        return False
+    raise ValueError(f'Invalid pass/fail filter: {value}')
+
+
+def parse_filters(params):
+    """Turn request or command options into submission filters"""
+    filters = {}
+    if params.get('user'):
+        try:
+            filters['user_id'] = int(params['user'])
+        except ValueError:
+            raise ValueError(f"Invalid user: {params['user']}")
+    if params.get('course'):
+        try:
+            filters['course_id'] = int(params['course'])
+        except ValueError:
+            raise ValueError(f"Invalid course: {params['course']}")
+    if params.get('since'):
+        filters['since'] = _parse_moment(params['since'])
+    if params.get('until'):
+        filters['until'] = _parse_moment(params['until'], end_of_day=True)
+    if params.get('passed') not in (None, ''):
+        filters['passed'] = _parse_passed(params['passed'])
+    return filters
+
+
+def filter_submissions(user_id=None, course_id=None, since=None, until=None, passed=None, archived=False):
+    """Return the submissions matching the export filters, from the archive when archived is set"""
+    submissions = (ArchivedSubmission if archived else Submission).objects.all()
+    if user_id is not None:
+        submissions = submissions.filter(user_id=user_id)
+    if course_id is not None:
+        submissions = submissions.filter(lesson__course_id=course_id)
+    if since is not None:
+        submissions = submissions.filter(submitted_at__gte=since)
+    if until is not None:
+        submissions = submissions.filter(submitted_at__lte=until)
+    # Pending submissions are neither passed nor failed yet; archived ones are all graded
+    graded = {} if archived else {'status': Submission.GRADED}
+    if passed is True:
+        submissions = submissions.filter(score__gte=PASSING_SCORE, **graded)
+    elif passed is False:
+        submissions = submissions.filter(score__lt=PASSING_SCORE, **graded)
+    return submissions
+
+
+def iter_submission_rows(submissions, chunk_size=2000):
+    """Yield export rows as dicts, one keyset page at a time"""
+    # The archive has no status column: everything in it is graded
+    columns = _COLUMNS if submissions.model is ArchivedSubmission else _COLUMNS + ['status']
+    last_id = 0
+    while True:
+        page = (submissions.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list(*columns)[:chunk_size])
+        count = 0
+        for row in page.iterator(chunk_size=chunk_size):
+            count += 1
+            last_id = row[0]
+            (submission_id, user_id, username, course_id, course,
+             lesson_id, lesson, score, submitted_at, *status) = row
+            # A pending submission has no score yet
+            graded = status != [Submission.PENDING]
+            yield {
+                'id': submission_id,
+                'user_id': user_id,
+                'username': username,
+                'course_id': course_id,
+                'course': course,
+                'lesson_id': lesson_id,
+                'lesson': lesson,
+                'score': score if graded else None,
+                'passed': score >= PASSING_SCORE if graded else None,
+                'submitted_at': submitted_at.isoformat(),
+            }
+        if count < chunk_size:
+            break
+
+
+def iter_export_rows(filters, chunk_size=2000):
+    """Yield the export rows of live and archived submissions, in id order"""
+    return heapq.merge(
+        iter_submission_rows(filter_submissions(**filters, archived=True), chunk_size),
+        iter_submission_rows(filter_submissions(**filters), chunk_size),
+        key=itemgetter('id'),
+    )
+
+
+class _Echo:
+    """File-like object whose write() just returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Yield CSV lines for export rows, header first"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def jsonl_lines(rows):
+    """Yield JSON Lines for export rows"""
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+# Submission API
+# Fields a client can pick with ?fields=; everything is read from one
+# select_related query, so a page costs the same no matter which are picked.
+# score and passed are null while a submission waits for grading.
+
+
+def _graded(submission):
+    return submission.status != Submission.PENDING
+
+
+API_FIELDS = {
+    'id': lambda submission: submission.id,
+    'user_id': lambda submission: submission.user_id,
+    'user': lambda submission: submission.user.username if submission.user else 'Anonymous',
+    'score': lambda submission: submission.score if _graded(submission) else None,
+    'passed': lambda submission: submission.score >= PASSING_SCORE if _graded(submission) else None,
+    'status': lambda submission: submission.status,
+    'submitted_at': lambda submission: submission.submitted_at.isoformat(),
+    'lesson_id': lambda submission: submission.lesson_id,
+    'lesson': lambda submission: submission.lesson.title if submission.lesson else 'N/A',
+    'course_id': lambda submission: submission.lesson.course_id if submission.lesson else None,
+    'course': lambda submission: submission.lesson.course.name if submission.lesson and submission.lesson.course else 'N/A',
+}
+
+DEFAULT_API_FIELDS = ['id', 'user', 'score', 'passed', 'submitted_at', 'course']
+
+
+def parse_fields(value):
+    """Parse a comma separated ?fields= value"""
+    if not value:
+        return DEFAULT_API_FIELDS
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def serialize_submission(submission, fields=DEFAULT_API_FIELDS):
+    """Turn a submission (with user and lesson__course loaded) into a dict"""
+    return {field: API_FIELDS[field](submission) for field in fields}
@@ -0,0 +1,112 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+import time
+
+# Primary / replica database routing
+# Catalog reads (courses, lessons, questions, choices) go to the "replica"
+# alias when one is configured; everything else, and every write, stays on
+# the primary. A client that just wrote (e.g. submitted an exam) is pinned
+# to the primary for ONLINECOURSE_REPLICA_LAG seconds so it reads its own
+# writes.
+
+REPLICA_ALIAS = 'replica'
+
+CATALOG_MODELS = {'course', 'lesson', 'question', 'choice', 'examconfig', 'lessonquota'}
+
+PIN_COOKIE = 'onlinecourse_primary'
+
+_pinned = ContextVar('onlinecourse_pinned_to_primary', default=False)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def pin_to_primary():
+    """Route every read inside the block to the primary"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send catalog reads to the replica, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if (REPLICA_ALIAS in settings.DATABASES
+                and not is_pinned()
+                and model._meta.app_label == 'onlinecourse_app'
+                and model._meta.model_name in CATALOG_MODELS):
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        return db != REPLICA_ALIAS
+
+
+class PrimaryPinMiddleware:
+    """Pin writing requests, and clients that wrote recently, to the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI with async views the request never leaves the event loop
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _pinning(self, request):
+        """(pin, writing) for a request"""
+        writing = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        pinned_until = request.COOKIES.get(PIN_COOKIE)
+        try:
+            recently_wrote = pinned_until is not None and float(pinned_until) > time.time()
+        except ValueError:
+            recently_wrote = False
+        pin = (writing or recently_wrote) and REPLICA_ALIAS in settings.DATABASES
+        return pin, writing
+
+    def _set_pin_cookie(self, response):
+        lag = getattr(settings, 'ONLINECOURSE_REPLICA_LAG', 10)
+        response.set_cookie(PIN_COOKIE, str(time.time() + lag), max_age=lag,
+                            httponly=True, samesite='Lax')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        pin, writing = self._pinning(request)
+        if not pin:
+            return self.get_response(request)
+        
+        with pin_to_primary():
+            response = self.get_response(request)
+        if writing:
+            self._set_pin_cookie(response)
+        return response
+
+    async def __acall__(self, request):
+        pin, writing = self._pinning(request)
+        if not pin:
+            return await self.get_response(request)
+        
+        # The context variable follows the ORM calls into sync_to_async threads
+        with pin_to_primary():
+            response = await self.get_response(request)
+        if writing:
+            self._set_pin_cookie(response)
+        return response
@@ -0,0 +1,314 @@
+from collections import namedtuple
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction, DatabaseError
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+from .models import Course, Lesson, Question
+import logging
+import re
+
+# Full-text search over courses, lessons and questions
+# Documents live in an inverted index that model signals keep in sync
+# (see signals.py); `rebuild_search_index` fills it from scratch. The
+# backend is pluggable through ONLINECOURSE_SEARCH_BACKEND. On SQLite the
+# default is an FTS5 table, created by migration 0007 and only ever written
+# on the default database; elsewhere a LIKE fallback without an index.
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('course', 'lesson', 'question')
+
+SEARCH_TABLE = 'onlinecourse_search'
+
+MAX_TERMS = 10
+
+MIN_PREFIX_LENGTH = 3
+
+# Marks FTS5 puts around matched terms, swapped for <mark> after escaping
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+# (kind, object_id, course_id, lesson_id, title, body)
+Document = namedtuple('Document', 'kind object_id course_id lesson_id title body')
+
+SearchHit = namedtuple('SearchHit', 'kind object_id course_id lesson_id title snippet')
+
+
+def _documents(kind, queryset):
+    if kind == 'course':
+        for pk, name, description in queryset.values_list('id', 'name', 'description'):
+            yield Document(kind, pk, pk, None, name, description)
+    elif kind == 'lesson':
+        for pk, course_id, title, content in queryset.values_list('id', 'course_id', 'title', 'content'):
+            yield Document(kind, pk, course_id, pk, title, content)
+    else:
+        rows = queryset.values_list('id', 'lesson__course_id', 'lesson_id', 'question_text')
+        for pk, course_id, lesson_id, text in rows:
+            yield Document(kind, pk, course_id, lesson_id, '', text)
+
+
+def _queryset(kind, course_ids=None):
+    if kind == 'course':
+        queryset = Course.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(id__in=course_ids)
+    elif kind == 'lesson':
+        queryset = Lesson.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(course_id__in=course_ids)
+    else:
+        queryset = Question.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(lesson__course_id__in=course_ids)
+    return queryset.order_by('id')
+
+
+def iter_documents(course_ids=None, batch_size=1000):
+    """Yield the documents of every (or the given) course in keyset chunks"""
+    for kind in KINDS:
+        queryset = _queryset(kind, course_ids)
+        last_id = 0
+        while True:
+            chunk = list(_documents(kind, queryset.filter(id__gt=last_id)[:batch_size]))
+            if not chunk:
+                break
+            yield from chunk
+            last_id = chunk[-1].object_id
+
+
+def documents_for(kind, object_ids):
+    """Load the current documents of some objects of one kind"""
+    return list(_documents(kind, _queryset(kind).filter(id__in=object_ids)))
+
+
+def fts_query(text):
+    """Turn user input into an FTS5 query: all words, the last one as a prefix"""
+    terms = re.findall(r'\w+', text)[:MAX_TERMS]
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    # Very short prefixes expand to most of the vocabulary
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the highlight marks into <mark> tags"""
+    html = escape(snippet)
+    html = html.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+    return mark_safe(html)
+
+
+class SearchBackend:
+    """Interface of a search backend"""
+
+    def index(self, documents):
+        """Add or replace documents"""
+        raise NotImplementedError
+
+    def remove(self, kind, object_ids):
+        raise NotImplementedError
+
+    def rebuild(self, course_ids=None, batch_size=1000):
+        """Re-index every (or the given) course; yields the running count"""
+        raise NotImplementedError
+
+    def search(self, text, kinds=KINDS, course_id=None, limit=20, offset=0):
+        """Return ranked SearchHits"""
+        raise NotImplementedError
+
+    def object_ids(self, kind, text, limit):
+        """Ids of matching objects of one kind, or None when the backend has no index"""
+        return None
+
+    def index_objects(self, kind, object_ids):
+        """Re-read some objects and index them; deleted ones are removed"""
+        documents = documents_for(kind, object_ids)
+        found = {document.object_id for document in documents}
+        missing = [pk for pk in object_ids if pk not in found]
+        if documents:
+            self.index(documents)
+        if missing:
+            self.remove(kind, missing)
+
+
+class Fts5SearchBackend(SearchBackend):
+    """
+    SQLite FTS5 index
+    The rowid encodes kind and object id, so replacing or removing a
+    document is a rowid lookup rather than a scan. Ranking is bm25 with
+    titles weighted above bodies; prefix indexes keep as-you-type queries
+    from expanding over the whole vocabulary.
+    """
+
+    def _write_alias(self):
+        # The replica gets the index through replication
+        return DEFAULT_DB_ALIAS
+
+    def _read_alias(self):
+        return router.db_for_read(Lesson)
+
+    @staticmethod
+    def _rowid(kind, object_id):
+        return object_id * len(KINDS) + KINDS.index(kind)
+
+    @staticmethod
+    def _split_rowid(rowid):
+        object_id, kind_index = divmod(rowid, len(KINDS))
+        return KINDS[kind_index], object_id
+
+    def index(self, documents):
+        alias = self._write_alias()
+        rows = [
+            (self._rowid(d.kind, d.object_id), d.title, d.body, d.course_id, d.lesson_id)
+            for d in documents
+        ]
+        with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, body, course_id, lesson_id) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, kind, object_ids):
+        alias = self._write_alias()
+        with connections[alias].cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+                [(self._rowid(kind, pk),) for pk in object_ids],
+            )
+
+    def rebuild(self, course_ids=None, batch_size=1000):
+        alias = self._write_alias()
+        with connections[alias].cursor() as cursor:
+            if course_ids is None:
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            else:
+                placeholders = ', '.join(['%s'] * len(course_ids))
+                cursor.execute(
+                    f"DELETE FROM {SEARCH_TABLE} WHERE course_id IN ({placeholders})", list(course_ids)
+                )
+
+        count = 0
+        batch = []
+        for document in iter_documents(course_ids, batch_size):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                self.index(batch)
+                count += len(batch)
+                batch = []
+                yield count
+        if batch:
+            self.index(batch)
+            count += len(batch)
+            yield count
+        if course_ids is None:
+            with connections[alias].cursor() as cursor:
+                # Merge the index segments written by the batches
+                cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+    def _match(self, columns, text, kinds, course_id, limit, offset):
+        query = fts_query(text)
+        if not query:
+            return []
+        sql = f"SELECT {columns} FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        params = [query]
+        if set(kinds) != set(KINDS):
+            sql += f" AND rowid %% {len(KINDS)} IN ({', '.join(str(KINDS.index(kind)) for kind in kinds)})"
+        if course_id is not None:
+            sql += " AND course_id = %s"
+            params.append(course_id)
+        sql += " ORDER BY rank LIMIT %s OFFSET %s"
+        params += [limit, offset]
+
+        alias = self._read_alias()
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        except DatabaseError:
+            logger.exception('Search index query failed')
+            return []
+
+    def search(self, text, kinds=KINDS, course_id=None, limit=20, offset=0):
+        snippet = (f"snippet({SEARCH_TABLE}, -1, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}', "
+                   "'…', 16)")
+        rows = self._match(f"rowid, course_id, lesson_id, title, {snippet}",
+                           text, kinds, course_id, limit, offset)
+        hits = []
+        for rowid, hit_course_id, lesson_id, title, text_snippet in rows:
+            kind, object_id = self._split_rowid(rowid)
+            hits.append(SearchHit(kind, object_id, hit_course_id, lesson_id, title, highlight(text_snippet)))
+        return hits
+
+    def object_ids(self, kind, text, limit):
+        rows = self._match('rowid', text, [kind], None, limit, 0)
+        return [self._split_rowid(rowid)[1] for rowid, in rows]
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Fallback for databases without FTS5: no index, icontains on the
+    model tables and no ranking beyond kind order
+    """
+
+    SNIPPET_RADIUS = 60
+
+    FIELDS = {
+        'course': ['name', 'description'],
+        'lesson': ['title', 'content'],
+        'question': ['question_text'],
+    }
+
+    def index(self, documents):
+        pass
+
+    def remove(self, kind, object_ids):
+        pass
+
+    def rebuild(self, course_ids=None, batch_size=1000):
+        return iter(())
+
+    def _snippet(self, text, terms):
+        lowered = text.lower()
+        position = lowered.find(terms[0].lower()) if terms else -1
+        start = max(position - self.SNIPPET_RADIUS, 0)
+        excerpt = text[start:start + 2 * self.SNIPPET_RADIUS]
+        html = escape(excerpt)
+        for term in terms:
+            html = re.sub(f'({re.escape(escape(term))})', r'<mark>\1</mark>', html, flags=re.IGNORECASE)
+        prefix = '…' if start else ''
+        suffix = '…' if start + 2 * self.SNIPPET_RADIUS < len(text) else ''
+        return mark_safe(prefix + html + suffix)
+
+    def search(self, text, kinds=KINDS, course_id=None, limit=20, offset=0):
+        terms = re.findall(r'\w+', text)[:MAX_TERMS]
+        if not terms:
+            return []
+        hits = []
+        for kind in KINDS:
+            if kind not in kinds:
+                continue
+            queryset = _queryset(kind, None if course_id is None else [course_id])
+            for term in terms:
+                condition = Q()
+                for field in self.FIELDS[kind]:
+                    condition |= Q(**{f'{field}__icontains': term})
+                queryset = queryset.filter(condition)
+            for document in _documents(kind, queryset[:offset + limit]):
+                hits.append(SearchHit(*document[:5], self._snippet(document.body or document.title, terms)))
+        return hits[offset:offset + limit]
+
+
+def get_search_backend():
+    """Return the configured search backend"""
+    path = getattr(settings, 'ONLINECOURSE_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite':
+        return Fts5SearchBackend()
+    return LikeSearchBackend()
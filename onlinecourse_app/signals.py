@@ -0,0 +1,172 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .content_version import bump_course_version, bump_catalog_version
+from .models import Course, Lesson, Question, Choice, ExamConfig, LessonQuota, Enrollment, Instructor
+from .progress import refresh_total_learners
+from .search import get_search_backend
+
+# Cache invalidation for course content
+# Any change to a course, its lessons, questions or choices bumps the
+# course version, which makes the cached answer key and course page stale.
+# Exam config changes do the same for the cached question pool, and course
+# changes also bump the catalog version of the course list.
+#
+# A cascading delete sends pre_delete for every collected row before
+# deleting any of them, and post_delete for children before their parent.
+# Rows whose parent is being deleted too are skipped, so deleting a course
+# invalidates it once instead of looking up the course of every question
+# and choice.
+
+_deleting = set()
+
+
+@receiver(pre_delete, sender=Course)
+@receiver(pre_delete, sender=Lesson)
+@receiver(pre_delete, sender=Question)
+def parent_deleting(sender, instance, **kwargs):
+    _deleting.add((sender, instance.pk))
+
+
+def _parent_deleting(model, pk):
+    return (model, pk) in _deleting
+
+
+def _invalidate(course_id):
+    if course_id is None:
+        return
+    # Wait for commit so a concurrent rebuild can't cache uncommitted data
+    transaction.on_commit(lambda: bump_course_version(course_id))
+
+
+def _course_id_for_lesson(lesson_id):
+    return Lesson.objects.filter(pk=lesson_id).values_list('course_id', flat=True).first()
+
+
+def _course_id_for_question(question_id):
+    return (Question.objects.filter(pk=question_id)
+            .values_list('lesson__course_id', flat=True).first())
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        _deleting.discard((Course, instance.pk))
+    _invalidate(instance.pk)
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=Lesson)
+def lesson_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        _deleting.discard((Lesson, instance.pk))
+        if _parent_deleting(Course, instance.course_id):
+            return
+    _invalidate(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        _deleting.discard((Question, instance.pk))
+        if _parent_deleting(Lesson, instance.lesson_id):
+            return
+    _invalidate(_course_id_for_lesson(instance.lesson_id))
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete and _parent_deleting(Question, instance.question_id):
+        return
+    _invalidate(_course_id_for_question(instance.question_id))
+
+
+@receiver([post_save, post_delete], sender=ExamConfig)
+def exam_config_changed(sender, instance, **kwargs):
+    _invalidate(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=LessonQuota)
+def lesson_quota_changed(sender, instance, **kwargs):
+    _invalidate(ExamConfig.objects.filter(pk=instance.exam_config_id)
+                .values_list('course_id', flat=True).first())
+
+
+# Search index maintenance
+# Documents are re-read after commit, so the index only ever sees
+# committed content; a delete removes the document by id.
+
+def _reindex(kind, object_id):
+    transaction.on_commit(lambda: get_search_backend().index_objects(kind, [object_id]))
+
+
+def _unindex(kind, object_id):
+    transaction.on_commit(lambda: get_search_backend().remove(kind, [object_id]))
+
+
+@receiver(post_save, sender=Course)
+def course_saved_search(sender, instance, **kwargs):
+    _reindex('course', instance.pk)
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved_search(sender, instance, **kwargs):
+    _reindex('lesson', instance.pk)
+
+
+@receiver(post_save, sender=Question)
+def question_saved_search(sender, instance, **kwargs):
+    _reindex('question', instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted_search(sender, instance, **kwargs):
+    _unindex('course', instance.pk)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted_search(sender, instance, **kwargs):
+    _unindex('lesson', instance.pk)
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted_search(sender, instance, **kwargs):
+    _unindex('question', instance.pk)
+
+
+# Instructor learner counts
+# Enrollments bump Instructor.total_learners as they are created; when the
+# instructors of a course change, or an enrollment goes away, the affected
+# instructors are recounted after commit.
+
+def _recount(instructor_ids):
+    instructor_ids = list(instructor_ids)
+    if instructor_ids:
+        transaction.on_commit(lambda: refresh_total_learners(instructor_ids))
+
+
+@receiver(m2m_changed, sender=Course.instructors.through)
+def course_instructors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is the instructor whose courses changed
+        _recount([instance.pk])
+    elif action == 'pre_clear':
+        _recount(instance.instructors.values_list('id', flat=True))
+    else:
+        _recount(pk_set)
+
+
+@receiver(pre_delete, sender=Course)
+def course_deleting(sender, instance, **kwargs):
+    # The cascade removes the course's instructor links before its
+    # enrollments, so they are read here, while they still exist
+    _recount(instance.instructors.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    if _parent_deleting(Course, instance.course_id):
+        return
+    _recount(Instructor.objects.filter(courses=instance.course_id).values_list('id', flat=True))
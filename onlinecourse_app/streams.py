@@ -0,0 +1,21 @@
+# Record stream helpers
+# Shared by the streaming imports (catalog_io, enrollment): records are
+# read lazily from CSV or JSON Lines and written batch by batch, so memory
+# stays flat however large the file is.
+
+
+def truthy(value):
+    """Read a CSV/JSON flag: 1, true, yes or y (any case); anything else is false"""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def batched(records, batch_size):
+    """Yield lists of up to batch_size records"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,3 +1,1000 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from datetime import datetime
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .admin import estimate_row_count
+from .answer_key import build_answer_key, get_answer_key
+from .archive import pack_answers, unpack_answers, archive_batch
+from .attempts import get_open_attempt, get_or_start_attempt
+from .catalog_io import CatalogImporter, iter_jsonl
+from .content_version import get_course_version
+from .db import apply_sqlite_pragmas
+from .exam_paper import get_exam_paper, get_question_pool, sample_questions, shuffle_paper
+from .grading import grade_attempt, save_submission
+from .middleware import QueryBudgetExceeded, _install_query_timer, query_stats
+from .reporting import EXPORT_FIELDS, iter_export_rows, parse_filters
+from .routers import PIN_COOKIE, REPLICA_ALIAS, PrimaryPinMiddleware, pin_to_primary
+from .search import Fts5SearchBackend, LikeSearchBackend
+from .models import (
+    Course, Lesson, Question, Choice, Submission, GradedAnswer, CourseStats, ScoreBucket, QuestionStats,
+    Enrollment, ExamAttempt, ArchivedSubmission, Instructor, Learner, ExamConfig, LessonQuota,
+)
+from unittest import mock, skipUnless
+import io
+import json
+import os
+import struct
+import tempfile
+import time
+
+
+# ExamTestCase class - one course with two single-select and one multi-select question
+class ExamTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('learner', password='secret')
+        cls.course = Course.objects.create(name='Databases', description='Indexes and queries')
+        cls.lesson = Lesson.objects.create(course=cls.course, title='Indexes', content='B-trees')
+
+        cls.single = Question.objects.create(lesson=cls.lesson, question_text='Index type?', grade=1)
+        cls.single_right = Choice.objects.create(question=cls.single, choice_text='B-tree', is_correct=True)
+        cls.single_wrong = Choice.objects.create(question=cls.single, choice_text='List', is_correct=False)
+
+        cls.weighted = Question.objects.create(lesson=cls.lesson, question_text='Lookup cost?', grade=2)
+        cls.weighted_right = Choice.objects.create(question=cls.weighted, choice_text='log n', is_correct=True)
+        cls.weighted_wrong = Choice.objects.create(question=cls.weighted, choice_text='n', is_correct=False)
+
+        cls.multi = Question.objects.create(lesson=cls.lesson, question_text='Indexed?', grade=2)
+        cls.multi_right = [
+            Choice.objects.create(question=cls.multi, choice_text='Primary key', is_correct=True),
+            Choice.objects.create(question=cls.multi, choice_text='Unique column', is_correct=True),
+        ]
+        cls.multi_wrong = Choice.objects.create(question=cls.multi, choice_text='Blob', is_correct=False)
+
+        cls.question_ids = [cls.single.id, cls.weighted.id, cls.multi.id]
+
+    def setUp(self):
+        # Cached versions and answer keys would outlive the rolled back rows
+        for alias in caches:
+            caches[alias].clear()
+
+    def all_right(self):
+        return {
+            self.single.id: {self.single_right.id},
+            self.weighted.id: {self.weighted_right.id},
+            self.multi.id: {choice.id for choice in self.multi_right},
+        }
+
+
+class GradeAttemptTests(ExamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.answer_key = build_answer_key(self.course.id)
+
+    def test_all_correct(self):
+        result = grade_attempt(self.answer_key, self.question_ids, self.all_right())
+        self.assertEqual(result.score, 100)
+        self.assertEqual(result.points, 5)
+        self.assertEqual(result.max_points, 5)
+        self.assertEqual(result.correct_answers, 3)
+
+    def test_single_select_is_weighted_by_grade(self):
+        selections = self.all_right()
+        selections[self.weighted.id] = {self.weighted_wrong.id}
+        result = grade_attempt(self.answer_key, self.question_ids, selections)
+        self.assertEqual(result.points, 3)
+        self.assertEqual(result.score, 60)
+        answers = {answer.question_id: answer for answer in result.graded_answers}
+        self.assertFalse(answers[self.weighted.id].is_correct)
+        self.assertEqual(answers[self.weighted.id].points_earned, 0)
+        self.assertEqual(answers[self.weighted.id].selected_choice_id, self.weighted_wrong.id)
+
+    def test_unanswered_question(self):
+        selections = self.all_right()
+        del selections[self.single.id]
+        result = grade_attempt(self.answer_key, self.question_ids, selections)
+        answers = {answer.question_id: answer for answer in result.graded_answers}
+        self.assertIsNone(answers[self.single.id].selected_choice_id)
+        self.assertFalse(answers[self.single.id].is_correct)
+        self.assertEqual(result.points, 4)
+
+    def test_multi_select_needs_every_correct_choice(self):
+        selections = self.all_right()
+        selections[self.multi.id] = {self.multi_right[0].id}
+        result = grade_attempt(self.answer_key, self.question_ids, selections, partial_credit=False)
+        self.assertEqual(result.points, 3)
+        self.assertEqual(result.correct_answers, 2)
+
+    def test_partial_credit(self):
+        selections = self.all_right()
+        selections[self.multi.id] = {self.multi_right[0].id}
+        result = grade_attempt(self.answer_key, self.question_ids, selections, partial_credit=True)
+        answers = {answer.question_id: answer for answer in result.graded_answers}
+        # One of two correct choices earns half the grade, but isn't correct
+        self.assertEqual(answers[self.multi.id].points_earned, 1)
+        self.assertFalse(answers[self.multi.id].is_correct)
+        self.assertEqual(result.points, 4)
+        self.assertEqual(result.score, 80)
+
+    def test_partial_credit_wrong_pick_cancels_a_right_one(self):
+        selections = self.all_right()
+        selections[self.multi.id] = {self.multi_right[0].id, self.multi_wrong.id}
+        result = grade_attempt(self.answer_key, self.question_ids, selections, partial_credit=True)
+        answers = {answer.question_id: answer for answer in result.graded_answers}
+        self.assertEqual(answers[self.multi.id].points_earned, 0)
+
+    def test_questions_outside_the_attempt_are_ignored(self):
+        result = grade_attempt(self.answer_key, [self.single.id], self.all_right())
+        self.assertEqual(result.max_points, 1)
+        self.assertEqual([answer.question_id for answer in result.graded_answers], [self.single.id])
+
+
+class SaveSubmissionTests(ExamTestCase):
+
+    def save(self, selections, choice_ids, attempt=None):
+        result = grade_attempt(build_answer_key(self.course.id), self.question_ids, selections)
+        return result, save_submission(
+            user=self.user,
+            course_id=self.course.id,
+            lesson_id=self.lesson.id,
+            score=result.score,
+            question_ids=self.question_ids,
+            graded_answers=result.graded_answers,
+            choice_ids=choice_ids,
+            attempt=attempt,
+        )
+
+    def test_writes_choices_and_graded_answers(self):
+        selections = self.all_right()
+        choice_ids = [choice_id for ids in selections.values() for choice_id in ids]
+        result, submission = self.save(selections, choice_ids)
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.score, result.score)
+        self.assertEqual(submission.status, Submission.GRADED)
+        self.assertEqual(set(submission.choices.values_list('id', flat=True)), set(choice_ids))
+        rows = (GradedAnswer.objects.filter(submission=submission).order_by('question_id')
+                .values_list('question_id', 'selected_choice_id', 'is_correct', 'points_earned'))
+        self.assertEqual(list(rows), [
+            (self.single.id, self.single_right.id, True, 1),
+            (self.weighted.id, self.weighted_right.id, True, 2),
+            (self.multi.id, self.multi_right[0].id, True, 2),
+        ])
+
+    def test_drops_choices_of_other_questions(self):
+        other_lesson = Lesson.objects.create(course=self.course, title='Joins', content='')
+        other = Question.objects.create(lesson=other_lesson, question_text='Join type?')
+        stray = Choice.objects.create(question=other, choice_text='Hash', is_correct=True)
+
+        selections = {self.single.id: {self.single_right.id}}
+        _, submission = self.save(selections, [self.single_right.id, stray.id])
+        self.assertEqual(list(submission.choices.values_list('id', flat=True)), [self.single_right.id])
+        self.assertEqual(GradedAnswer.objects.filter(submission=submission).count(), 3)
+
+    def test_closes_the_attempt(self):
+        attempt = get_or_start_attempt(self.user, self.course.id)
+        _, submission = self.save({}, [], attempt=attempt)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.submission_id, submission.id)
+        self.assertFalse(Submission.choices.through.objects.filter(submission=submission).exists())
+
+
+class AnswerKeyVersionTests(ExamTestCase):
+
+    def test_editing_a_choice_invalidates_the_answer_key(self):
+        before = get_answer_key(self.course.id)
+        self.assertEqual(before.questions[self.single.id].correct_ids, {self.single_right.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.single_wrong.is_correct = True
+            self.single_wrong.save()
+
+        after = get_answer_key(self.course.id)
+        self.assertGreater(after.version, before.version)
+        self.assertEqual(after.questions[self.single.id].correct_ids,
+                         {self.single_right.id, self.single_wrong.id})
+
+    @override_settings(ONLINECOURSE_VERSION_TIMEOUT=5)
+    def test_bump_from_another_process_is_seen_after_the_timeout(self):
+        version = get_course_version(self.course.id)
+        # Another process bumped the version; this process's cache still has the old one
+        Course.objects.filter(pk=self.course.id).update(content_version=version + 1)
+        self.assertEqual(get_course_version(self.course.id), version)
+
+        with mock.patch('time.time', return_value=time.time() + 6):
+            self.assertEqual(get_course_version(self.course.id), version + 1)
+            self.assertEqual(get_answer_key(self.course.id).version, version + 1)
+
+
+# SubmitTestCase class - a logged in learner with an open attempt
+class SubmitTestCase(ExamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.submit_url = reverse('onlinecourse_app:submit', args=[self.course.id])
+        # Opening the exam draws the attempt
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+
+    def exam_form(self, **extra):
+        data = {'exam_form': '1', **extra}
+        for question_id, choice_ids in self.all_right().items():
+            data[f'question_{question_id}'] = sorted(choice_ids)
+        return data
+
+    def submit_attempt(self, key):
+        """Open the exam again and submit it all right"""
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        return self.client.post(self.submit_url, self.exam_form(idempotency_key=key))
+
+
+class SubmitTests(SubmitTestCase):
+
+    def test_repeated_post_returns_the_first_submission(self):
+        data = self.exam_form(idempotency_key='attempt-1')
+        first = self.client.post(self.submit_url, data)
+        second = self.client.post(self.submit_url, data)
+
+        submission = Submission.objects.get()
+        self.assertRedirects(first, reverse('onlinecourse_app:show_exam_result', args=[submission.id]))
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(GradedAnswer.objects.count(), 3)
+
+    def test_different_keys_make_separate_submissions(self):
+        self.client.post(self.submit_url, self.exam_form(idempotency_key='attempt-1'))
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        self.client.post(self.submit_url, self.exam_form(idempotency_key='attempt-2'))
+        self.assertEqual(Submission.objects.count(), 2)
+
+    def test_submit_without_exam_form_commits_the_draft(self):
+        autosave_url = reverse('onlinecourse_app:autosave', args=[self.course.id])
+        response = self.client.post(autosave_url, {
+            f'question_{self.single.id}': self.single_right.id,
+            f'question_{self.weighted.id}': self.weighted_wrong.id,
+        })
+        self.assertEqual(response.json()['answered'], 2)
+
+        # Answers posted with the submit override the draft of their question
+        self.client.post(self.submit_url, {f'question_{self.weighted.id}': self.weighted_right.id})
+
+        submission = Submission.objects.get()
+        selected = dict(GradedAnswer.objects.filter(submission=submission)
+                        .values_list('question_id', 'selected_choice_id'))
+        self.assertEqual(selected, {
+            self.single.id: self.single_right.id,
+            self.weighted.id: self.weighted_right.id,
+            self.multi.id: None,
+        })
+        self.assertEqual(submission.score, 60)
+
+    def test_exam_form_ignores_the_draft(self):
+        autosave_url = reverse('onlinecourse_app:autosave', args=[self.course.id])
+        self.client.post(autosave_url, {f'question_{self.single.id}': self.single_right.id})
+        self.client.post(self.submit_url, {'exam_form': '1'})
+        self.assertEqual(Submission.objects.get().score, 0)
+
+
+@override_settings(ONLINECOURSE_ASYNC_GRADING=True, ONLINECOURSE_RESULT_WAIT=0)
+class AsyncGradingTests(SubmitTestCase):
+
+    def test_submit_then_grade_pending(self):
+        data = self.exam_form()
+        data[f'question_{self.weighted.id}'] = self.weighted_wrong.id
+        response = self.client.post(self.submit_url, data)
+
+        submission = Submission.objects.get()
+        result_url = reverse('onlinecourse_app:show_exam_result', args=[submission.id])
+        self.assertEqual(response['Location'], result_url + '?wait=1')
+        self.assertEqual(submission.status, Submission.PENDING)
+        self.assertFalse(GradedAnswer.objects.exists())
+        self.assertFalse(CourseStats.objects.filter(course=self.course).exists())
+        self.assertTemplateUsed(self.client.get(result_url), 'onlinecourse_app/exam_pending.html')
+
+        call_command('grade_pending', once=True, stdout=io.StringIO())
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, Submission.GRADED)
+        self.assertEqual(submission.score, 60)
+        self.assertEqual(GradedAnswer.objects.filter(submission=submission).count(), 3)
+
+        stats = CourseStats.objects.get(course=self.course)
+        self.assertEqual((stats.attempts, stats.passes, stats.score_total), (1, 0, 60))
+        self.assertEqual(list(ScoreBucket.objects.filter(course=self.course).values_list('bucket', 'count')),
+                         [(6, 1)])
+        question_stats = dict((question_id, (attempts, correct)) for question_id, attempts, correct in
+                              QuestionStats.objects.values_list('question_id', 'attempts', 'correct'))
+        self.assertEqual(question_stats, {
+            self.single.id: (1, 1),
+            self.weighted.id: (1, 0),
+            self.multi.id: (1, 1),
+        })
+
+        enrollment = Enrollment.objects.get(user=self.user, course=self.course)
+        self.assertEqual((enrollment.attempts, enrollment.best_score, enrollment.last_score), (1, 60, 60))
+        self.assertFalse(enrollment.passed)
+
+        response = self.client.get(result_url)
+        self.assertTemplateUsed(response, 'onlinecourse_app/exam_result.html')
+        self.assertEqual(response.context['score'], 60)
+        self.assertEqual(response.context['correct_answers'], 2)
+
+    def test_batch_merges_the_progress_of_a_learner(self):
+        data = self.exam_form()
+        data[f'question_{self.weighted.id}'] = self.weighted_wrong.id
+        self.client.post(self.submit_url, data)
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        self.client.post(self.submit_url, self.exam_form())
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        self.client.post(self.submit_url, {'exam_form': '1'})
+        self.assertEqual(Submission.objects.filter(status=Submission.PENDING).count(), 3)
+
+        call_command('grade_pending', once=True, stdout=io.StringIO())
+
+        enrollment = Enrollment.objects.get(user=self.user, course=self.course)
+        self.assertEqual((enrollment.attempts, enrollment.best_score, enrollment.last_score), (3, 100, 0))
+        self.assertTrue(enrollment.passed)
+        self.assertEqual(enrollment.last_attempt_at, Submission.objects.latest('id').submitted_at)
+
+    def test_grade_pending_reads_the_version_from_the_database(self):
+        get_answer_key(self.course.id)
+        data = self.exam_form()
+        data[f'question_{self.weighted.id}'] = self.weighted_wrong.id
+        self.client.post(self.submit_url, data)
+
+        # Edited by another process: this process's cached version is stale
+        Choice.objects.filter(pk=self.weighted_right.pk).update(is_correct=False)
+        Choice.objects.filter(pk=self.weighted_wrong.pk).update(is_correct=True)
+        Course.objects.filter(pk=self.course.pk).update(content_version=F('content_version') + 1)
+
+        call_command('grade_pending', once=True, stdout=io.StringIO())
+        self.assertEqual(Submission.objects.get().score, 100)
+
+
+class PackAnswersTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        answers = [(3, 12, True, 2.0), (5, None, False, 0.0), (8, 30, False, 0.5)]
+        choice_ids = [12, 30, 31]
+        self.assertEqual(unpack_answers(pack_answers(answers, choice_ids)), (answers, choice_ids))
+
+    def test_fractional_points_are_exact(self):
+        # Partial credit on a question of grade 2 with three correct choices
+        points = 2 * 2 / 3
+        answers, _ = unpack_answers(pack_answers([(3, 12, False, points)], [12]))
+        self.assertEqual(answers[0][3], points)
+
+    def test_reads_format_version_1(self):
+        packed = (struct.pack('<BHH', 1, 1, 1) + struct.pack('<IIBf', 3, 12, True, 0.5)
+                  + struct.pack('<I', 12))
+        self.assertEqual(unpack_answers(packed), ([(3, 12, True, 0.5)], [12]))
+
+    def test_empty(self):
+        self.assertEqual(unpack_answers(pack_answers([], [])), ([], []))
+
+    def test_memoryview(self):
+        # PostgreSQL returns binary fields as memoryview
+        packed = pack_answers([(1, 2, True, 1.0)], [2])
+        self.assertEqual(unpack_answers(memoryview(packed)), ([(1, 2, True, 1.0)], [2]))
+
+    def test_unknown_version(self):
+        packed = bytearray(pack_answers([], []))
+        packed[0] = 99
+        with self.assertRaises(ValueError):
+            unpack_answers(bytes(packed))
+
+
+class ArchiveTests(SubmitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        data = self.exam_form()
+        # Half of the multi-select question, so its choices matter on the result page
+        data[f'question_{self.multi.id}'] = self.multi_right[1].id
+        self.client.post(self.submit_url, data)
+        self.submission = Submission.objects.get()
+        self.result_url = reverse('onlinecourse_app:show_exam_result', args=[self.submission.id])
+        self.details_url = reverse('onlinecourse_app:submission_details', args=[self.submission.id])
+
+    def test_archive_batch_moves_the_submission(self):
+        attempt_id = ExamAttempt.objects.get(submission=self.submission).id
+        self.assertEqual(archive_batch([self.submission.id]), 1)
+
+        self.assertFalse(Submission.objects.exists())
+        self.assertFalse(GradedAnswer.objects.exists())
+        self.assertFalse(Submission.choices.through.objects.exists())
+        # The attempt goes too, instead of becoming the open attempt again
+        self.assertFalse(ExamAttempt.objects.filter(id=attempt_id).exists())
+
+        archived = ArchivedSubmission.objects.get(id=self.submission.id)
+        self.assertEqual(archived.score, self.submission.score)
+        self.assertEqual(archived.submitted_at, self.submission.submitted_at)
+        answers, choice_ids = unpack_answers(archived.answers)
+        self.assertEqual([answer[0] for answer in answers], self.question_ids)
+        self.assertEqual(choice_ids, sorted([self.single_right.id, self.weighted_right.id, self.multi_right[1].id]))
+
+    def test_pending_submissions_stay(self):
+        Submission.objects.update(status=Submission.PENDING)
+        self.assertEqual(archive_batch([self.submission.id]), 0)
+        self.assertTrue(Submission.objects.exists())
+
+    def test_result_page_of_an_archived_submission(self):
+        before = self.client.get(self.result_url)
+        archive_batch([self.submission.id])
+        after = self.client.get(self.result_url)
+
+        self.assertTemplateUsed(after, 'onlinecourse_app/exam_result.html')
+        self.assertEqual(after.context['submission_data'], before.context['submission_data'])
+        self.assertEqual(after.context['score'], before.context['score'])
+        rows = {row['question_id']: row for row in after.context['submission_data']}
+        self.assertEqual(rows[self.multi.id]['selected_choice'], 'Unique column')
+        self.assertEqual(rows[self.multi.id]['points_earned'], 1)
+
+    def test_submission_details_of_an_archived_submission(self):
+        before = self.client.get(self.details_url).json()
+        archive_batch([self.submission.id])
+        response = self.client.get(self.details_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), before)
+
+    def test_export_includes_archived_submissions(self):
+        self.user.is_staff = True
+        self.user.save()
+        archive_batch([self.submission.id])
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        self.client.post(self.submit_url, self.exam_form())
+        live = Submission.objects.get()
+
+        response = self.client.get(reverse('onlinecourse_app:export_submissions'),
+                                   {'course': self.course.id, 'format': 'jsonl'})
+        rows = [json.loads(line) for line in response.getvalue().decode().splitlines()]
+        self.assertEqual([(row['id'], row['score']) for row in rows],
+                         [(self.submission.id, self.submission.score), (live.id, 100)])
+
+        out = io.StringIO()
+        call_command('export_submissions', course=str(self.course.id), passed='1', format='jsonl', stdout=out)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()],
+                         [self.submission.id, live.id])
+
+    def test_submission_list_includes_archived_submissions(self):
+        archive_batch([self.submission.id])
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        self.client.post(self.submit_url, self.exam_form())
+        live = Submission.objects.get()
+
+        url = reverse('onlinecourse_app:list_submissions')
+        first = self.client.get(url, {'limit': 1, 'fields': 'id,status'}).json()
+        self.assertEqual(first['results'], [{'id': self.submission.id, 'status': 'archived'}])
+        second = self.client.get(url, {'limit': 1, 'fields': 'id,status', 'cursor': first['next_cursor']}).json()
+        self.assertEqual(second, {'results': [{'id': live.id, 'status': Submission.GRADED}], 'next_cursor': None})
+
+    def test_missing_submission(self):
+        missing = self.submission.id + 100
+        response = self.client.get(reverse('onlinecourse_app:submission_details', args=[missing]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('onlinecourse_app:show_exam_result', args=[missing]))
+        self.assertRedirects(response, reverse('onlinecourse_app:index'))
+
+
+class EstimatedCountTests(SubmitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for key in ('first', 'second', 'third'):
+            self.submit_attempt(key)
+        self.ids = list(Submission.objects.order_by('id').values_list('id', flat=True))
+
+    def test_sqlite_estimate_ignores_archived_rows(self):
+        archive_batch(self.ids[:2])
+        self.assertEqual(estimate_row_count(Submission, 'default'), 1)
+
+    @override_settings(ONLINECOURSE_ADMIN_COUNT_LIMIT=2)
+    def test_changelist_labels_the_estimate(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse('admin:onlinecourse_app_submission_changelist'))
+        self.assertTrue(response.context['cl'].paginator.approximate)
+        self.assertContains(response, 'About 3 submissions')
+
+
+@override_settings(ONLINECOURSE_QUERY_STATS=True)
+class QueryStatsMiddlewareTests(ExamTestCase):
+
+    view_name = 'onlinecourse_app:my_courses'
+
+    def setUp(self):
+        super().setUp()
+        query_stats.reset()
+        self.client.force_login(self.user)
+        self.url = reverse(self.view_name)
+
+    def recorded_queries(self):
+        return query_stats.summary()[self.view_name]['queries']['max']
+
+    def test_counts_the_queries_of_a_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertGreater(self.recorded_queries(), 0)
+        self.assertEqual(self.recorded_queries(), len(queries))
+
+    @override_settings(ONLINECOURSE_QUERY_BUDGETS={view_name: 1}, ONLINECOURSE_QUERY_BUDGET_ACTION='raise')
+    def test_budget_overrun_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(self.url)
+
+    def test_async_request(self):
+        self.async_client.force_login(self.user)
+        # The test database connection was opened before the middleware was loaded
+        _install_query_timer(connection)
+        with CaptureQueriesContext(connection) as queries:
+            # The view's queries run back in this thread, on the test connection
+            response = async_to_sync(self.async_client.get)(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.recorded_queries(), len(queries))
+
+
+class SearchTests(ExamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = Fts5SearchBackend()
+        # setUpTestData commits nothing, so the signals never indexed it
+        list(self.backend.rebuild())
+
+    def test_signals_keep_the_index_in_sync(self):
+        self.assertEqual(self.backend.object_ids('question', 'type', 10), [self.single.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.single.question_text = 'Which tree structure?'
+            self.single.save()
+        self.assertEqual(self.backend.object_ids('question', 'type', 10), [])
+        self.assertEqual(self.backend.object_ids('question', 'structure', 10), [self.single.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.weighted.delete()
+        self.assertEqual(self.backend.object_ids('question', 'lookup', 10), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(course=self.course, title='Covering indexes', content='Index-only scans')
+        self.assertIn(lesson.id, self.backend.object_ids('lesson', 'covering', 10))
+
+    def test_titles_rank_above_bodies(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            in_body = Lesson.objects.create(course=self.course, title='Joins', content='Hash joins build a hash table')
+            in_title = Lesson.objects.create(course=self.course, title='Hash indexes', content='Equality lookups')
+        hits = self.backend.search('hash', kinds=['lesson'])
+        self.assertEqual([hit.object_id for hit in hits], [in_title.id, in_body.id])
+        self.assertIn('<mark>', hits[1].snippet)
+
+    def test_search_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.backend.search('tree')
+
+    def test_like_fallback(self):
+        backend = LikeSearchBackend()
+        hits = backend.search('tree')
+        self.assertEqual([(hit.kind, hit.object_id) for hit in hits], [('lesson', self.lesson.id)])
+        self.assertEqual(hits[0].snippet, 'B-<mark>tree</mark>s')
+        self.assertEqual(backend.search('tree', kinds=['course', 'question']), [])
+        self.assertEqual(backend.search('lookup cost', kinds=['question'])[0].object_id, self.weighted.id)
+        self.assertIsNone(backend.object_ids('question', 'lookup', 10))
+
+    @override_settings(ONLINECOURSE_SEARCH_BACKEND='onlinecourse_app.search.LikeSearchBackend')
+    def test_search_page_with_the_fallback(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('onlinecourse_app:search'), {'q': 'cost'})
+        self.assertEqual([result['hit'].object_id for result in response.context['results']], [self.weighted.id])
+
+
+class ListSubmissionsTests(SubmitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for key in ('first', 'second', 'third'):
+            self.submit_attempt(key)
+        self.ids = list(Submission.objects.order_by('id').values_list('id', flat=True))
+        self.url = reverse('onlinecourse_app:list_submissions')
+
+    def test_unchanged_page_answers_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, b'')
+
+    def test_etag_changes_after_a_new_submission(self):
+        etag = self.client.get(self.url)['ETag']
+        self.submit_attempt('fourth')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_cursor_pagination(self):
+        first = self.client.get(self.url, {'limit': 2, 'fields': 'id'}).json()
+        self.assertEqual(first, {'results': [{'id': self.ids[0]}, {'id': self.ids[1]}], 'next_cursor': self.ids[1]})
+        second = self.client.get(self.url, {'limit': 2, 'fields': 'id', 'cursor': first['next_cursor']}).json()
+        self.assertEqual(second, {'results': [{'id': self.ids[2]}], 'next_cursor': None})
+
+    def test_learners_only_see_their_own_submissions(self):
+        other = User.objects.create_user('other', password='secret')
+        Submission.objects.create(user=other, lesson=self.lesson, score=100)
+        results = self.client.get(self.url, {'fields': 'id'}).json()['results']
+        self.assertEqual([row['id'] for row in results], self.ids)
+
+
+class PageCacheTests(ExamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('onlinecourse_app:course_details', args=[self.course.id])
+
+    def test_second_get_is_served_from_the_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_content_edit_invalidates_the_page(self):
+        first = self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.title = 'Hash indexes'
+            self.lesson.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertContains(response, 'Hash indexes')
+
+    def test_home_page_is_per_user(self):
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('onlinecourse_app:index')), 'learner')
+
+        self.client.force_login(other)
+        response = self.client.get(reverse('onlinecourse_app:index'))
+        self.assertContains(response, 'other')
+        self.assertNotContains(response, 'learner')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EnrollLearnersTests(TestCase):
+
+    header = 'username,password,email,role,occupation,full_time,password_hash\n'
+
+    def enroll(self, rows, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.csv')
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.write(self.header + rows)
+            out = io.StringIO()
+            call_command('enroll_learners', path, '--processes', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_creates_users_with_profiles(self):
+        self.enroll('ada,pw1,ada@example.com,learner,developer,,\n'
+                    'grace,pw2,grace@example.com,instructor,,no,\n'
+                    'nopass,,,,,,\n')
+        ada = User.objects.get(username='ada')
+        self.assertTrue(ada.check_password('pw1'))
+        self.assertEqual(ada.learner.occupation, Learner.DEVELOPER)
+        grace = User.objects.get(username='grace')
+        self.assertFalse(grace.instructor.full_time)
+        self.assertFalse(Learner.objects.filter(user=grace).exists())
+        self.assertFalse(User.objects.get(username='nopass').has_usable_password())
+
+    def test_existing_users_are_skipped(self):
+        self.enroll('ada,pw1,ada@example.com,learner,,,\n')
+        output = self.enroll('ada,pw2,new@example.com,learner,,,\nalan,pw3,,learner,,,\n')
+        self.assertIn('Created 1, updated 0 and skipped 1 users', output)
+        ada = User.objects.get(username='ada')
+        self.assertEqual(ada.email, 'ada@example.com')
+        self.assertTrue(ada.check_password('pw1'))
+
+    def test_update(self):
+        self.enroll('ada,pw1,ada@example.com,learner,student,,\n')
+        output = self.enroll('ada,pw2,new@example.com,learner,dba,,\n', '--update')
+        self.assertIn('Created 0, updated 1 and skipped 0 users', output)
+        ada = User.objects.get(username='ada')
+        self.assertEqual(ada.email, 'new@example.com')
+        self.assertTrue(ada.check_password('pw2'))
+        self.assertEqual(ada.learner.occupation, Learner.DATABASE_ADMIN)
+
+    def test_role_change_replaces_the_profile(self):
+        self.enroll('ada,pw1,,learner,,,\n')
+        self.enroll('ada,,,instructor,,yes,\n', '--update')
+        ada = User.objects.get(username='ada')
+        self.assertTrue(Instructor.objects.filter(user=ada).exists())
+        self.assertFalse(Learner.objects.filter(user=ada).exists())
+        # No password in the row keeps the old one
+        self.assertTrue(ada.check_password('pw1'))
+
+    def test_password_hash_rows_are_stored_as_they_are(self):
+        password_hash = make_password('exported')
+        self.enroll(f'ada,,,learner,,,{password_hash}\n')
+        ada = User.objects.get(username='ada')
+        self.assertEqual(ada.password, password_hash)
+        self.assertTrue(ada.check_password('exported'))
+
+    def test_unknown_hash_format_fails(self):
+        with self.assertRaises(CommandError):
+            self.enroll('ada,,,learner,,,not-a-hash\n')
+        self.assertFalse(User.objects.exists())
+
+
+class CatalogTests(ExamTestCase):
+
+    def export(self, path, *args):
+        call_command('export_catalog', path, *args, stdout=io.StringIO())
+        with open(path, encoding='utf-8') as stream:
+            return stream.read()
+
+    def test_export_import_round_trip(self):
+        Lesson.objects.create(course=self.course, title='Empty lesson', content='No questions yet')
+        Course.objects.create(name='Empty course', description='No lessons yet')
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('catalog.jsonl', 'catalog.csv'):
+                with self.subTest(name):
+                    path = os.path.join(directory, name)
+                    exported = self.export(path)
+                    Course.objects.all().delete()
+                    call_command('import_catalog', path, '--batch-size', '2', stdout=io.StringIO())
+                    self.assertEqual(self.export(path), exported)
+        answer_key = build_answer_key(Course.objects.get(name='Databases').id)
+        self.assertEqual(sorted(len(question.correct_ids) for question in answer_key.questions.values()), [1, 1, 2])
+
+    def test_each_committed_batch_invalidates_its_courses(self):
+        before = get_course_version(self.course.id)
+        records = [
+            {'course': 'Databases', 'lesson': 'Indexes', 'question': 'Clustered?',
+             'choices': [{'text': 'Yes', 'is_correct': True}]},
+            {'lesson': 'A record without a course'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                list(CatalogImporter(batch_size=1).run(iter(records)))
+        # The first batch committed: its course is stale and its question searchable
+        self.assertGreater(get_course_version(self.course.id), before)
+        question = Question.objects.get(question_text='Clustered?')
+        self.assertEqual(Fts5SearchBackend().object_ids('question', 'clustered', 10), [question.id])
+
+    def test_jsonl_is_correct(self):
+        stream = io.StringIO(json.dumps({
+            'course': 'Flags', 'lesson': 'Parsing', 'question': 'Which?',
+            'choices': [
+                {'text': 'bool', 'is_correct': True},
+                {'text': 'string', 'is_correct': 'false'},
+                {'text': 'number', 'is_correct': 1},
+                {'text': 'zero', 'is_correct': 0},
+                {'text': 'missing'},
+            ],
+        }) + '\n')
+        list(CatalogImporter().run(iter_jsonl(stream)))
+        self.assertEqual(dict(Choice.objects.filter(question__lesson__course__name='Flags')
+                              .values_list('choice_text', 'is_correct')),
+                         {'bool': True, 'string': False, 'number': True, 'zero': False, 'missing': False})
+
+
+class SubmissionExportTests(SubmitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.submit_attempt('passed')
+        self.client.get(reverse('onlinecourse_app:take_exam', args=[self.course.id]))
+        self.client.post(self.submit_url, {'exam_form': '1'})
+        self.passed, self.failed = Submission.objects.order_by('id')
+        Submission.objects.filter(pk=self.passed.pk).update(
+            submitted_at=timezone.make_aware(datetime(2020, 1, 1, 12)))
+
+    def export_ids(self, **params):
+        return [row['id'] for row in iter_export_rows(parse_filters(params))]
+
+    def test_filters(self):
+        self.assertEqual(self.export_ids(), [self.passed.id, self.failed.id])
+        self.assertEqual(self.export_ids(passed='1'), [self.passed.id])
+        self.assertEqual(self.export_ids(passed='fail'), [self.failed.id])
+        self.assertEqual(self.export_ids(since='2021-01-01'), [self.failed.id])
+        # A date alone as the upper bound includes that whole day
+        self.assertEqual(self.export_ids(until='2020-01-01'), [self.passed.id])
+        self.assertEqual(self.export_ids(course=str(self.course.id + 1)), [])
+        self.assertEqual(self.export_ids(user=str(self.user.id), course=str(self.course.id)),
+                         [self.passed.id, self.failed.id])
+
+    def test_pending_submissions_have_no_result(self):
+        Submission.objects.filter(pk=self.failed.pk).update(status=Submission.PENDING)
+        self.assertEqual(self.export_ids(passed='0'), [])
+        row = list(iter_export_rows({}))[1]
+        self.assertEqual((row['id'], row['score'], row['passed']), (self.failed.id, None, None))
+
+    def test_invalid_filters(self):
+        for params in ({'since': 'yesterday'}, {'passed': 'maybe'}, {'course': 'x'}):
+            with self.subTest(params), self.assertRaises(ValueError):
+                parse_filters(params)
+
+    def test_csv_export_view(self):
+        url = reverse('onlinecourse_app:export_submissions')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        response = self.client.get(url, {'passed': '1'})
+        lines = response.getvalue().decode().splitlines()
+        self.assertEqual(lines[0], ','.join(EXPORT_FIELDS))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{self.passed.id},{self.user.id},learner,'))
+
+
+class ExamPaperTests(SubmitTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.wide = Question.objects.create(lesson=cls.lesson, question_text='Page size?', grade=1)
+        for size in range(1, 9):
+            Choice.objects.create(question=cls.wide, choice_text=f'{size} KB', is_correct=size == 8)
+        cls.joins = Lesson.objects.create(course=cls.course, title='Joins', content='Nested loops')
+        cls.join_questions = [
+            Question.objects.create(lesson=cls.joins, question_text=f'Join {number}?', grade=1)
+            for number in range(4)
+        ]
+        for question in cls.join_questions:
+            Choice.objects.create(question=question, choice_text='Hash', is_correct=True)
+
+    def setUp(self):
+        # Configured before SubmitTestCase draws the attempt
+        config = ExamConfig.objects.create(course=self.course, questions_per_attempt=3)
+        LessonQuota.objects.create(exam_config=config, lesson=self.joins, questions=2)
+        super().setUp()
+
+    def choice_order(self, seed):
+        paper = shuffle_paper(get_exam_paper(self.course.id), seed)
+        return {item['question']['id']: [choice['id'] for choice in item['choices']] for item in paper}
+
+    def test_same_seed_same_order(self):
+        self.assertEqual(self.choice_order('1:a1b2'), self.choice_order('1:a1b2'))
+
+    def test_different_seeds_different_order(self):
+        self.assertNotEqual(self.choice_order('1:a1b2')[self.wide.id], self.choice_order('1:c3d4')[self.wide.id])
+
+    def test_reload_shows_the_same_paper(self):
+        url = reverse('onlinecourse_app:take_exam', args=[self.course.id])
+        first = self.client.get(url).context['exam_questions']
+        self.assertEqual(self.client.get(url).context['exam_questions'], first)
+
+    def test_sampling_honors_lesson_quotas(self):
+        pool = get_question_pool(self.course.id)
+        join_ids = {question.id for question in self.join_questions}
+        for seed in range(50):
+            drawn = sample_questions(pool, str(seed))
+            self.assertEqual(len(drawn), 3)
+            self.assertEqual(len(set(drawn)), 3)
+            self.assertGreaterEqual(len(join_ids.intersection(drawn)), 2)
+            self.assertEqual(sample_questions(pool, str(seed)), drawn)
+
+    def test_grading_only_scores_the_drawn_questions(self):
+        attempt = get_open_attempt(self.user, self.course.id)
+        data = self.exam_form()
+        data[f'question_{self.wide.id}'] = Choice.objects.get(question=self.wide, is_correct=True).id
+        for question in self.join_questions:
+            data[f'question_{question.id}'] = question.choice_set.get().id
+        self.client.post(self.submit_url, data)
+
+        submission = Submission.objects.get()
+        self.assertEqual(sorted(GradedAnswer.objects.filter(submission=submission)
+                                .values_list('question_id', flat=True)), sorted(attempt.question_ids))
+        self.assertEqual(submission.score, 100)
+        # Choices of questions that weren't drawn are dropped
+        self.assertFalse(submission.choices.exclude(question_id__in=attempt.question_ids).exists())
+
+
+class PrimaryReplicaRoutingTests(TransactionTestCase):
+    """
+    Routing with a replica alias that mirrors the test database, as
+    ONLINECOURSE_DB_REPLICA_NAME configures it (TEST MIRROR). The test
+    case commits its writes so the replica connection can read them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            # Added once the test database exists (the test runner only sets
+            # up configured aliases), pointing at it like a mirror would
+            default = connections['default'].settings_dict
+            replica = {**default, 'TEST': {**default['TEST'], 'MIRROR': 'default'}}
+            patcher = mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: replica})
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+            cls.addClassCleanup(connections.__delitem__, REPLICA_ALIAS)
+            cls.addClassCleanup(lambda: connections[REPLICA_ALIAS].close())
+        cls.databases = {'default', REPLICA_ALIAS}
+        super().setUpClass()
+
+    def setUp(self):
+        self.course = Course.objects.create(name='Databases', description='Indexes and queries')
+        self.user = User.objects.create_user('learner', password='secret')
+        self.middleware = PrimaryPinMiddleware(self.catalog_alias)
+        self.factory = RequestFactory()
+
+    def catalog_alias(self, request):
+        # Stands in for a view: reports where a catalog read goes
+        return HttpResponse(Course.objects.all().db)
+
+    def test_catalog_reads_go_to_the_replica(self):
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual(course._state.db, REPLICA_ALIAS)
+        self.assertEqual(course.name, 'Databases')
+        self.assertEqual(User.objects.get(pk=self.user.pk)._state.db, 'default')
+        self.assertEqual(Submission.objects.all().db, 'default')
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(self.course._state.db, 'default')
+        course = Course.objects.get(pk=self.course.pk)
+        course.name = 'Indexing'
+        course.save()
+        self.assertEqual(course._state.db, 'default')
+        self.assertEqual(Course.objects.using('default').get(pk=course.pk).name, 'Indexing')
+
+    def test_pin_to_primary(self):
+        with pin_to_primary():
+            self.assertEqual(Course.objects.get(pk=self.course.pk)._state.db, 'default')
+        self.assertEqual(Course.objects.get(pk=self.course.pk)._state.db, REPLICA_ALIAS)
+
+    def test_clients_are_pinned_after_a_post(self):
+        response = self.middleware(self.factory.get('/'))
+        self.assertEqual(response.content, REPLICA_ALIAS.encode())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = self.middleware(self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        pin = response.cookies[PIN_COOKIE]
+
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = pin.value
+        self.assertEqual(self.middleware(request).content, b'default')
+
+        # Once the replication lag has passed, reads go back to the replica
+        request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.middleware(request).content, REPLICA_ALIAS.encode())
+
+    def test_async_post_is_pinned(self):
+        async def view(request):
+            return HttpResponse(Course.objects.all().db)
+
+        middleware = PrimaryPinMiddleware(view)
+        response = async_to_sync(middleware)(self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_submit_pins_the_client(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('onlinecourse_app:submit', args=[self.course.id]), {'exam_form': '1'})
+        self.assertIn(PIN_COOKIE, self.client.cookies)
+
+
+class SqlitePragmaTests(TestCase):
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_pragmas_are_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            cache_size = cursor.fetchone()[0]
+            with override_settings(ONLINECOURSE_SQLITE_PRAGMAS={'cache_size': -1234}):
+                apply_sqlite_pragmas(sender=connection.__class__, connection=connection)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
+            cursor.execute(f'PRAGMA cache_size = {cache_size}')
 
-# Create your tests here.
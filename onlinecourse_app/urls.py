@@ -1,26 +1,50 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
 app_name = 'onlinecourse_app'
 
+# Under ASGI the learner read views can run natively async
+learner_views = async_views if getattr(settings, 'ONLINECOURSE_ASYNC_VIEWS', False) else views
+
 urlpatterns = [
     # Home page
-    path('', views.index, name='index'),
+    path('', learner_views.index, name='index'),
+    
+    # Learner dashboard with progress per enrolled course
+    path('my-courses/', views.my_courses, name='my_courses'),
+    
+    # Learner search across courses, lessons and questions
+    path('search/', views.search, name='search'),
     
     # Course details page
-    path('course/<int:course_id>/', views.course_details, name='course_details'),
+    path('course/<int:course_id>/', learner_views.course_details, name='course_details'),
     
     # Exam page
-    path('course/<int:course_id>/exam/', views.take_exam, name='take_exam'),
+    path('course/<int:course_id>/exam/', learner_views.take_exam, name='take_exam'),
+    
+    # Autosave of exam answers while the exam is open
+    path('course/<int:course_id>/autosave/', views.autosave, name='autosave'),
     
     # TASK 6 REQUIREMENT: submit path
     path('course/<int:course_id>/submit/', views.submit, name='submit'),
     
     # TASK 6 REQUIREMENT: show_exam_result path
-    path('result/<int:submission_id>/', views.show_exam_result, name='show_exam_result'),
+    path('result/<int:submission_id>/', learner_views.show_exam_result, name='show_exam_result'),
     
     # Optional: API endpoint for submission details
-    path('api/submission/<int:submission_id>/', views.get_submission_details, name='submission_details'),
+    path('api/submission/<int:submission_id>/', learner_views.get_submission_details, name='submission_details'),
+    path('api/submissions/', views.list_submissions, name='list_submissions'),
+    
+    # Instructor analytics dashboard and its JSON endpoint
+    path('course/<int:course_id>/analytics/', views.course_analytics, name='course_analytics'),
+    path('api/course/<int:course_id>/analytics/', views.course_analytics_json, name='course_analytics_json'),
+    
+    # Instructor export of submissions (CSV or JSON Lines)
+    path('api/submissions/export/', views.export_submissions, name='export_submissions'),
+    
+    # Staff-only query count and latency statistics
+    path('api/stats/queries/', views.query_stats_view, name='query_stats'),
 ]
 
 # URL Pattern Explanations:
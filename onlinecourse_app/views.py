@@ -1,13 +1,39 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, JsonResponse
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import IntegrityError
+from django.views.decorators.http import require_POST
 from django.contrib import messages
-from .models import Course, Lesson, Question, Choice, Submission
+from django.conf import settings
+from .models import Course, Lesson, Submission, Instructor, Enrollment, ArchivedSubmission
+from .answer_key import get_answer_key, truncate_text
+from .grading import (
+    selections_from_post, grade_attempt, save_submission, save_pending_submission, find_submission,
+)
+from .exam_paper import get_attempt_paper, attempt_seed, shuffle_paper
+from .attempts import get_or_start_attempt, get_open_attempt
+from .drafts import save_draft, get_draft_selections, delete_draft
+from .archive import get_archived_submission, archived_graded_answers
+from .analytics import PASSING_SCORE, course_report
+from .middleware import query_stats
+from .search import KINDS, get_search_backend
+from .content_version import get_course_version, get_catalog_version
+from .page_cache import versioned_page
+from .reporting import (
+    parse_filters, filter_submissions, iter_export_rows, csv_lines, jsonl_lines,
+    parse_fields, serialize_submission,
+)
+from django.utils.http import quote_etag
+from operator import attrgetter
+import hashlib
 from django.contrib.auth.models import User
 import json
+import time
 from datetime import datetime
 
-# Home page view
+# Home page view, cached per catalog version (it shows the username)
+@versioned_page('index', get_catalog_version, per_user=True)
 def index(request):
     """Display all available courses"""
     courses = Course.objects.all()
@@ -17,7 +43,8 @@ def index(request):
     }
     return render(request, 'onlinecourse_app/index.html', context)
 
-# Course details view
+# Course details view, cached per course content version
+@versioned_page('course_details', get_course_version)
 def course_details(request, course_id):
     """Display course details with all lessons"""
     course = get_object_or_404(Course, id=course_id)
@@ -30,118 +57,146 @@ def course_details(request, course_id):
     }
     return render(request, 'onlinecourse_app/course_details_bootstrap.html', context)
 
+# Learner dashboard: progress in every course, one row per enrollment
+@login_required
+def my_courses(request):
+    """List the learner's courses with attempts, scores and pass status"""
+    enrollments = (Enrollment.objects.filter(user=request.user)
+                   .select_related('course')
+                   .order_by('-last_attempt_at', '-id'))
+    context = {
+        'enrollments': enrollments,
+        'passing_score': PASSING_SCORE,
+        'user': request.user,
+    }
+    return render(request, 'onlinecourse_app/my_courses.html', context)
+
+# Results per page of the learner search
+SEARCH_PAGE_SIZE = 20
+
+# Search view
+@login_required
+def search(request):
+    """Ranked full-text search across courses, lessons and questions"""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind')
+    kinds = [kind] if kind in KINDS else list(KINDS)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    
+    hits = []
+    if query:
+        # One extra hit tells whether there is a next page
+        hits = get_search_backend().search(query, kinds=kinds, limit=SEARCH_PAGE_SIZE + 1,
+                                           offset=(page - 1) * SEARCH_PAGE_SIZE)
+    has_next = len(hits) > SEARCH_PAGE_SIZE
+    hits = hits[:SEARCH_PAGE_SIZE]
+    
+    # Names for the hits, one query per kind of parent
+    course_names = dict(Course.objects.filter(id__in={hit.course_id for hit in hits})
+                        .values_list('id', 'name'))
+    lesson_titles = dict(Lesson.objects.filter(id__in={hit.lesson_id for hit in hits if hit.lesson_id})
+                         .values_list('id', 'title'))
+    results = [
+        {
+            'hit': hit,
+            'course_name': course_names.get(hit.course_id, ''),
+            'lesson_title': lesson_titles.get(hit.lesson_id, ''),
+        }
+        for hit in hits
+    ]
+    
+    context = {
+        'query': query,
+        'kind': kind if kind in KINDS else '',
+        'kinds': KINDS,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+        'user': request.user,
+    }
+    return render(request, 'onlinecourse_app/search.html', context)
+
 # TASK 5 REQUIREMENT: submit function
+@login_required
 def submit(request, course_id):
     """
     Handle exam submission
     This function processes submitted exam answers and calculates the score
     """
     if request.method == 'POST':
+        # A repeated POST (double click, timer, retry) returns the first submission
+        idempotency_key = (request.headers.get('Idempotency-Key')
+                           or request.POST.get('idempotency_key', ''))[:64]
+        existing_id = find_submission(request.user, idempotency_key)
+        if existing_id is not None:
+            return redirect('onlinecourse_app:show_exam_result', submission_id=existing_id)
+        
         try:
             # Get the course
             course = get_object_or_404(Course, id=course_id)
             
             # Get all questions for this course
             lessons = Lesson.objects.filter(course=course)
-            questions = Question.objects.filter(lesson__in=lessons)
-            
-            # Initialize scoring variables
-            total_questions = questions.count()
-            correct_answers = 0
-            submission_data = []
             
-            # Process each question
-            for question in questions:
-                # Get selected choice ID from POST data
-                selected_choice_id = request.POST.get(f'question_{question.id}')
-                
-                if selected_choice_id:
-                    try:
-                        selected_choice = Choice.objects.get(id=selected_choice_id)
-                        is_correct = selected_choice.is_correct
-                        
-                        # Find correct choices for this question
-                        correct_choices = Choice.objects.filter(question=question, is_correct=True)
-                        correct_choice_ids = [str(c.id) for c in correct_choices]
-                        
-                        # Check if answer is correct
-                        if is_correct:
-                            correct_answers += 1
-                            status = "Correct"
-                        else:
-                            status = "Incorrect"
-                            
-                        # Record submission data
-                        submission_data.append({
-                            'question_id': question.id,
-                            'question_text': question.question_text[:100] + "..." if len(question.question_text) > 100 else question.question_text,
-                            'selected_choice': selected_choice.choice_text,
-                            'correct_choice': correct_choices.first().choice_text if correct_choices.exists() else "No correct choice",
-                            'is_correct': is_correct,
-                            'status': status,
-                            'grade': question.grade
-                        })
-                        
-                    except Choice.DoesNotExist:
-                        # Selected choice doesn't exist
-                        submission_data.append({
-                            'question_id': question.id,
-                            'question_text': question.question_text[:100] + "..." if len(question.question_text) > 100 else question.question_text,
-                            'selected_choice': "No selection",
-                            'correct_choice': "N/A",
-                            'is_correct': False,
-                            'status': "Not answered",
-                            'grade': 0
-                        })
-                else:
-                    # No answer submitted for this question
-                    submission_data.append({
-                        'question_id': question.id,
-                        'question_text': question.question_text[:100] + "..." if len(question.question_text) > 100 else question.question_text,
-                        'selected_choice': "No selection",
-                        'correct_choice': "N/A",
-                        'is_correct': False,
-                        'status': "Not answered",
-                        'grade': 0
-                    })
-            
-            # Calculate score percentage
-            score_percentage = 0
-            if total_questions > 0:
-                score_percentage = (correct_answers / total_questions) * 100
-            
-            # Determine if passed (70% or higher)
-            passed = score_percentage >= 70
+            # Grade from the cached answer key instead of querying per question
+            answer_key = get_answer_key(course.id)
             
-            # Create submission record
-            submission = Submission.objects.create(
-                user=request.user if request.user.is_authenticated else None,
-                lesson=lessons.first() if lessons.exists() else None,
-                score=score_percentage,
-            )
+            # Only the questions drawn for this attempt are graded
+            attempt = get_or_start_attempt(request.user, course.id)
             
-            # Add selected choices to submission
-            for question in questions:
-                selected_choice_id = request.POST.get(f'question_{question.id}')
-                if selected_choice_id:
-                    try:
-                        selected_choice = Choice.objects.get(id=selected_choice_id)
-                        submission.choices.add(selected_choice)
-                    except Choice.DoesNotExist:
-                        pass
+            # The exam form posts every answer; any other submit commits the
+            # autosaved draft, overlaid with whatever answers it does carry
+            selections = selections_from_post(answer_key, attempt.question_ids, request.POST)
+            if not request.POST.get('exam_form'):
+                selections = {**get_draft_selections(attempt.id), **selections}
             
-            # Save the submission
-            submission.save()
+            lesson_id = lessons.order_by('id').values_list('id', flat=True).first()
+            choice_ids = [choice_id for ids in selections.values() for choice_id in ids]
             
-            # Store submission data in session for result page
-            request.session['submission_data'] = submission_data
-            request.session['total_questions'] = total_questions
-            request.session['correct_answers'] = correct_answers
-            request.session['score_percentage'] = score_percentage
-            request.session['passed'] = passed
+            try:
+                if getattr(settings, 'ONLINECOURSE_ASYNC_GRADING', False):
+                    # Only the raw answers are stored; grade_pending grades them
+                    submission = save_pending_submission(
+                        user=request.user,
+                        lesson_id=lesson_id,
+                        question_ids=attempt.question_ids,
+                        choice_ids=choice_ids,
+                        attempt=attempt,
+                        idempotency_key=idempotency_key,
+                    )
+                else:
+                    # Compare selected and correct choice sets, weighted by grade
+                    result = grade_attempt(answer_key, attempt.question_ids, selections)
+                    
+                    # Create submission record with its choices and graded answers
+                    submission = save_submission(
+                        user=request.user,
+                        course_id=course.id,
+                        lesson_id=lesson_id,
+                        score=result.score,
+                        question_ids=attempt.question_ids,
+                        graded_answers=result.graded_answers,
+                        choice_ids=choice_ids,
+                        attempt=attempt,
+                        idempotency_key=idempotency_key,
+                    )
+            except IntegrityError:
+                # A concurrent duplicate POST committed first
+                existing_id = find_submission(request.user, idempotency_key)
+                if existing_id is None:
+                    raise
+                return redirect('onlinecourse_app:show_exam_result', submission_id=existing_id)
+            delete_draft(attempt.id)
             
             # Redirect to result page
-            return redirect('onlinecourse_app:show_exam_result', submission_id=submission.id)
+            response = redirect('onlinecourse_app:show_exam_result', submission_id=submission.id)
+            if submission.status == Submission.PENDING:
+                # Only this first load waits for the grade; refreshes don't
+                response['Location'] += '?wait=1'
+            return response
             
         except Exception as e:
             # Handle any errors during submission
@@ -152,6 +207,89 @@ def submit(request, course_id):
         # If not POST request, redirect to course details
         return redirect('onlinecourse_app:course_details', course_id=course_id)
 
+def _wait_for_grading(submission):
+    """
+    Poll a pending submission for up to ONLINECOURSE_RESULT_WAIT seconds
+    Returns it reloaded once graded, or unchanged when still pending.
+    """
+    deadline = time.monotonic() + getattr(settings, 'ONLINECOURSE_RESULT_WAIT', 1.0)
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        status = Submission.objects.filter(id=submission.id).values_list('status', flat=True).first()
+        if status != Submission.PENDING:
+            return Submission.objects.select_related('lesson__course').get(id=submission.id)
+    return submission
+
+def _pending_context(user, submission, course):
+    return {
+        'submission': submission,
+        'course': course,
+        'refresh_seconds': getattr(settings, 'ONLINECOURSE_RESULT_REFRESH', 2),
+        'user': user,
+    }
+
+
+def _has_multi_select(answer_key):
+    return answer_key is not None and any(len(key.correct_ids) > 1 for key in answer_key.questions.values())
+
+
+def _result_rows(answer_key, graded_answers, choice_ids=None):
+    """Rows of the result page; choice_ids are needed for multi-select questions"""
+    selected_texts = {}
+    for choice_id in choice_ids or ():
+        question_id = answer_key.question_for_choice(choice_id)
+        if question_id is not None and len(answer_key.questions[question_id].correct_ids) > 1:
+            selected_texts.setdefault(question_id, []).append(answer_key.choice_text(choice_id))
+    
+    submission_data = []
+    for graded_answer in graded_answers:
+        question = graded_answer.question
+        question_key = answer_key.questions.get(question.id) if answer_key else None
+        if question.id in selected_texts:
+            selected_choice = ", ".join(selected_texts[question.id])
+        elif graded_answer.selected_choice:
+            selected_choice = graded_answer.selected_choice.choice_text
+        else:
+            selected_choice = "No selection"
+        if graded_answer.selected_choice is None:
+            status = "Not answered"
+        elif graded_answer.is_correct:
+            status = "Correct"
+        else:
+            status = "Incorrect"
+        
+        submission_data.append({
+            'question_id': question.id,
+            'question_text': truncate_text(question.question_text),
+            'selected_choice': selected_choice,
+            'correct_choice': ", ".join(question_key.correct_texts) if question_key and question_key.correct_texts else "N/A",
+            'is_correct': graded_answer.is_correct,
+            'status': status,
+            'grade': question.grade,
+            'points_earned': graded_answer.points_earned,
+        })
+    return submission_data
+
+
+def _result_context(user, submission, course, submission_data):
+    total_questions = len(submission_data)
+    correct_answers = len([item for item in submission_data if item['is_correct']])
+    score_percentage = submission.score
+    passed = score_percentage >= 70
+    
+    return {
+        'submission': submission,
+        'course': course,
+        'submission_data': submission_data,
+        'total_questions': total_questions,
+        'correct_answers': correct_answers,
+        'incorrect_answers': total_questions - correct_answers,
+        'score': score_percentage,
+        'passed': passed,
+        'completion_date': submission.submitted_at.strftime('%B %d, %Y at %I:%M %p'),
+        'user': user,
+    }
+
 # TASK 5 REQUIREMENT: show_exam_result function
 def show_exam_result(request, submission_id):
     """
@@ -159,64 +297,49 @@ def show_exam_result(request, submission_id):
     This function shows the detailed results of an exam submission
     """
     try:
-        # Get the submission
-        submission = get_object_or_404(Submission, id=submission_id)
-        
-        # Get data from session or calculate fresh
-        submission_data = request.session.get('submission_data', [])
-        total_questions = request.session.get('total_questions', 0)
-        correct_answers = request.session.get('correct_answers', 0)
-        score_percentage = request.session.get('score_percentage', submission.score)
-        passed = request.session.get('passed', submission.score >= 70)
-        
-        # If no session data, calculate from submission
-        if not submission_data:
-            # Get all choices in this submission
-            selected_choices = submission.choices.all()
-            
-            # Get questions from selected choices
-            questions = Question.objects.filter(choice__in=selected_choices).distinct()
-            
-            # Build submission data
-            for question in questions:
-                # Get user's selected choice for this question
-                user_choice = selected_choices.filter(question=question).first()
-                correct_choice = Choice.objects.filter(question=question, is_correct=True).first()
-                
-                submission_data.append({
-                    'question_id': question.id,
-                    'question_text': question.question_text[:100] + "..." if len(question.question_text) > 100 else question.question_text,
-                    'selected_choice': user_choice.choice_text if user_choice else "No selection",
-                    'correct_choice': correct_choice.choice_text if correct_choice else "N/A",
-                    'is_correct': user_choice.is_correct if user_choice else False,
-                    'status': "Correct" if user_choice and user_choice.is_correct else "Incorrect",
-                    'grade': question.grade
-                })
-            
-            total_questions = questions.count()
-            correct_answers = len([item for item in submission_data if item['is_correct']])
+        # Get the submission; old ones are read from the archive
+        submission = Submission.objects.select_related('lesson__course').filter(id=submission_id).first()
+        if submission is None:
+            submission = get_archived_submission(submission_id)
+            if submission is None:
+                raise Submission.DoesNotExist
         
         # Get course information
         course = None
         if submission.lesson:
             course = submission.lesson.course
         
-        # Prepare context for template
-        context = {
-            'submission': submission,
-            'course': course,
-            'submission_data': submission_data,
-            'total_questions': total_questions,
-            'correct_answers': correct_answers,
-            'score': score_percentage,
-            'passed': passed,
-            'completion_date': submission.submitted_at.strftime('%B %d, %Y at %I:%M %p'),
-            'user': request.user,
-        }
+        # An asynchronously graded submission may still be in the queue;
+        # the load right after submit waits a moment for the grade
+        if submission.status == Submission.PENDING:
+            if request.GET.get('wait'):
+                submission = _wait_for_grading(submission)
+            if submission.status == Submission.PENDING:
+                return render(request, 'onlinecourse_app/exam_pending.html',
+                              _pending_context(request.user, submission, course))
+        
+        # Correct answers come from the cached answer key
+        answer_key = get_answer_key(course.id) if course else None
+        
+        if isinstance(submission, ArchivedSubmission):
+            # Answers and choice ids of an archived submission are packed in its row
+            graded_answers, choice_ids = archived_graded_answers(submission)
+        else:
+            # Read graded answers with their question and choice in one query
+            graded_answers = (submission.graded_answers
+                              .select_related('question', 'selected_choice')
+                              .order_by('question_id'))
+            
+            # Multi-select questions list every selected choice, read from the
+            # submission's choice ids and resolved against the answer key
+            choice_ids = None
+            if _has_multi_select(answer_key):
+                choice_ids = (Submission.choices.through.objects
+                              .filter(submission_id=submission.id)
+                              .values_list('choice_id', flat=True))
         
-        # Clear session data
-        if 'submission_data' in request.session:
-            del request.session['submission_data']
+        submission_data = _result_rows(answer_key, graded_answers, choice_ids)
+        context = _result_context(request.user, submission, course, submission_data)
         
         return render(request, 'onlinecourse_app/exam_result.html', context)
         
@@ -228,46 +351,187 @@ def show_exam_result(request, submission_id):
         return redirect('onlinecourse_app:index')
 
 # Additional helper view for exam page
+@login_required
 def take_exam(request, course_id):
     """Display exam questions for a course"""
     course = get_object_or_404(Course, id=course_id)
-    lessons = Lesson.objects.filter(course=course)
-    questions = Question.objects.filter(lesson__in=lessons).order_by('id')
     
-    # Prepare questions with choices
-    exam_questions = []
-    for question in questions:
-        choices = Choice.objects.filter(question=question).order_by('?')  # Randomize choices
-        exam_questions.append({
-            'question': question,
-            'choices': choices,
-        })
+    # Questions drawn for this attempt, choices shuffled per learner and attempt
+    attempt = get_or_start_attempt(request.user, course.id)
+    paper = get_attempt_paper(course.id, attempt.question_ids)
+    exam_questions = shuffle_paper(paper, attempt_seed(request.user.pk, attempt.seed))
+    
+    # Answers autosaved before a reload or crash are checked again
+    selected_ids = {choice_id for ids in get_draft_selections(attempt.id).values() for choice_id in ids}
     
     context = {
         'course': course,
         'exam_questions': exam_questions,
-        'total_questions': questions.count(),
+        'total_questions': len(exam_questions),
+        'selected_ids': selected_ids,
+        'idempotency_key': f'attempt-{attempt.id}-{attempt.seed}',
         'user': request.user,
     }
     
     return render(request, 'onlinecourse_app/exam.html', context)
 
+# Autosave of exam answers
+@login_required
+@require_POST
+def autosave(request, course_id):
+    """Store the current answers of the open attempt in the draft cache"""
+    attempt = get_open_attempt(request.user, course_id)
+    if attempt is None:
+        return JsonResponse({'error': 'No open exam attempt'}, status=409)
+    
+    selections = selections_from_post(get_answer_key(course_id), attempt.question_ids, request.POST)
+    draft = save_draft(attempt.id, selections)
+    return JsonResponse({'answered': len(selections), 'saved_at': draft['saved_at']})
+
 # API view to get submission details (optional)
 def get_submission_details(request, submission_id):
     """API endpoint to get submission details in JSON format"""
     if request.method == 'GET':
-        try:
-            submission = Submission.objects.get(id=submission_id)
-            data = {
-                'id': submission.id,
-                'user': submission.user.username if submission.user else 'Anonymous',
-                'score': submission.score,
-                'passed': submission.score >= 70,
-                'submitted_at': submission.submitted_at.isoformat(),
-                'course': submission.lesson.course.name if submission.lesson and submission.lesson.course else 'N/A',
-            }
-            return JsonResponse(data)
-        except Submission.DoesNotExist:
+        # User, lesson and course come with the submission in one query;
+        # old submissions are found in the archive
+        submission = (Submission.objects.select_related('user', 'lesson__course').filter(id=submission_id).first()
+                      or get_archived_submission(submission_id))
+        if submission is None:
             return JsonResponse({'error': 'Submission not found'}, status=404)
+        return JsonResponse(serialize_submission(submission))
     
     return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+
+def is_instructor(user):
+    """Staff members and users with an Instructor profile can see course analytics"""
+    return user.is_authenticated and (
+        user.is_staff or Instructor.objects.filter(user=user).exists()
+    )
+
+# Instructor dashboard with course analytics
+@user_passes_test(is_instructor)
+def course_analytics(request, course_id):
+    """Display pass rate, score histogram and per-question difficulty"""
+    course = get_object_or_404(Course, id=course_id)
+    report = course_report(course)
+    
+    # Scale histogram bars to the largest bucket
+    largest = max([bucket['count'] for bucket in report['histogram']] + [1])
+    for bucket in report['histogram']:
+        bucket['width'] = bucket['count'] * 100 / largest
+    
+    context = {
+        'course': course,
+        'report': report,
+        'user': request.user,
+    }
+    return render(request, 'onlinecourse_app/course_analytics.html', context)
+
+# API view to get course analytics
+def course_analytics_json(request, course_id):
+    """API endpoint to get course analytics in JSON format"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not is_instructor(request.user):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    
+    try:
+        course = Course.objects.get(id=course_id)
+    except Course.DoesNotExist:
+        return JsonResponse({'error': 'Course not found'}, status=404)
+    return JsonResponse(course_report(course))
+
+# Streaming export of submissions for instructors
+def export_submissions(request):
+    """Stream submissions as CSV or JSON Lines, filtered by course, date and pass/fail"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not is_instructor(request.user):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    rows = iter_export_rows(filters)
+    if request.GET.get('format') == 'jsonl':
+        response = StreamingHttpResponse(jsonl_lines(rows), content_type='application/x-ndjson')
+        filename = 'submissions.jsonl'
+    else:
+        response = StreamingHttpResponse(csv_lines(rows), content_type='text/csv')
+        filename = 'submissions.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# Maximum page size of the submission list API
+SUBMISSION_PAGE_SIZE = 100
+MAX_SUBMISSION_PAGE_SIZE = 1000
+
+# API view to list submissions
+def list_submissions(request):
+    """
+    API endpoint listing submissions in JSON format
+    Filters: user, course, since, until, passed, since_id. Archived
+    submissions are listed too. Pages are keyset based: pass the returned
+    next_cursor as ?cursor= to get the next one.
+    ?fields= selects a subset of fields. Responses carry an ETag and
+    conditional requests with a matching If-None-Match get a 304.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+    
+    try:
+        filters = parse_filters(request.GET)
+        fields = parse_fields(request.GET.get('fields'))
+        after_id = max(int(request.GET.get('since_id') or 0), int(request.GET.get('cursor') or 0))
+        limit = min(int(request.GET.get('limit') or SUBMISSION_PAGE_SIZE), MAX_SUBMISSION_PAGE_SIZE)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'limit must be positive'}, status=400)
+    
+    # Learners only ever see their own submissions
+    if not is_instructor(request.user):
+        filters['user_id'] = request.user.id
+    
+    # One query per table and page, merged by id; one extra row tells
+    # whether another page exists
+    submissions = sorted(
+        (submission
+         for archived in (False, True)
+         for submission in filter_submissions(**filters, archived=archived)
+         .filter(id__gt=after_id)
+         .select_related('user', 'lesson__course')
+         .order_by('id')[:limit + 1]),
+        key=attrgetter('id'),
+    )[:limit + 1]
+    has_more = len(submissions) > limit
+    submissions = submissions[:limit]
+    
+    data = {
+        'results': [serialize_submission(submission, fields) for submission in submissions],
+        'next_cursor': submissions[-1].id if has_more else None,
+    }
+    response = JsonResponse(data)
+    
+    # The ETag is a digest of the body, so unchanged pages answer 304
+    etag = quote_etag(hashlib.md5(response.content).hexdigest())
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponse(status=304)
+    response['ETag'] = etag
+    return response
+
+# Query statistics collected by QueryStatsMiddleware
+@staff_member_required
+def query_stats_view(request):
+    """API endpoint with per-view query count and latency percentiles"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        query_stats.reset()
+    return JsonResponse({
+        'enabled': bool(getattr(settings, 'ONLINECOURSE_QUERY_STATS', False)),
+        'views': query_stats.summary(),
+    })
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -37,16 +38,21 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "onlinecourse_app",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Keeps clients on the primary database right after they write
+    "onlinecourse_app.routers.PrimaryPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # Inactive unless ONLINECOURSE_QUERY_STATS is enabled below
+    "onlinecourse_app.middleware.QueryStatsMiddleware",
 ]
 
 ROOT_URLCONF = "onlinecourse_project.urls"
@@ -54,7 +60,7 @@ ROOT_URLCONF = "onlinecourse_project.urls"
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
-        "DIRS": [],
+        "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -72,11 +78,161 @@ WSGI_APPLICATION = "onlinecourse_project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Everything is driven by environment variables. The "production" profile
+# keeps connections open and, on SQLite, switches to WAL with a busy
+# timeout so reads don't wait on submit writes. Setting
+# ONLINECOURSE_DB_REPLICA_NAME adds a "replica" alias that catalog reads
+# are routed to (see onlinecourse_app.routers).
+
+# Serve the learner read views as native async views (see README, "ASGI")
+ONLINECOURSE_ASYNC_VIEWS = os.environ.get("ONLINECOURSE_ASYNC_VIEWS", "") == "1"
+
+DB_PROFILE = os.environ.get("ONLINECOURSE_DB_PROFILE", "development")
+PRODUCTION_DB = DB_PROFILE == "production"
+DB_ENGINE = os.environ.get("ONLINECOURSE_DB_ENGINE", "django.db.backends.sqlite3")
+DB_IS_SQLITE = DB_ENGINE.endswith("sqlite3")
+
+
+def _database(name):
+    database = {
+        "ENGINE": DB_ENGINE,
+        "NAME": name,
+        # Async views run their queries in per-request threads, which can't reuse connections
+        "CONN_MAX_AGE": int(os.environ.get("ONLINECOURSE_DB_CONN_MAX_AGE",
+                                           60 if PRODUCTION_DB and not ONLINECOURSE_ASYNC_VIEWS else 0)),
+        "CONN_HEALTH_CHECKS": PRODUCTION_DB,
+    }
+    if DB_IS_SQLITE:
+        # Seconds a connection waits for the write lock before failing
+        database["OPTIONS"] = {"timeout": float(os.environ.get("ONLINECOURSE_SQLITE_TIMEOUT", 20 if PRODUCTION_DB else 5))}
+    else:
+        database.update({
+            "USER": os.environ.get("ONLINECOURSE_DB_USER", ""),
+            "PASSWORD": os.environ.get("ONLINECOURSE_DB_PASSWORD", ""),
+            "HOST": os.environ.get("ONLINECOURSE_DB_HOST", ""),
+            "PORT": os.environ.get("ONLINECOURSE_DB_PORT", ""),
+        })
+    return database
+
+
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+    "default": _database(os.environ.get("ONLINECOURSE_DB_NAME", BASE_DIR / "db.sqlite3")),
+}
+
+if os.environ.get("ONLINECOURSE_DB_REPLICA_NAME"):
+    DATABASES["replica"] = _database(os.environ["ONLINECOURSE_DB_REPLICA_NAME"])
+    # Tests use the primary's test database for the replica
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["onlinecourse_app.routers.PrimaryReplicaRouter"]
+
+# Seconds after a write during which a client keeps reading from the primary
+ONLINECOURSE_REPLICA_LAG = int(os.environ.get("ONLINECOURSE_REPLICA_LAG", 10))
+
+# PRAGMAs applied to every new SQLite connection
+ONLINECOURSE_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 20000,
+    "foreign_keys": "ON",
+} if PRODUCTION_DB else {}
+
+
+# Caches and sessions
+# ONLINECOURSE_CACHE_PROFILE is "locmem" (per process) or "file" (shared by
+# every process on the host, the production default). Rendered pages, exam
+# drafts and sessions live in caches of their own, so none of them evicts
+# the others or answer keys and exam papers, and with the "cache" session
+# engine a request reads its session without touching the database;
+# "cached_db" also writes sessions through to the database. The production
+# default is "cached_db": a cache cull deletes entries at random, and with
+# the "cache" engine every session it deletes logs a user out, mid-exam
+# included.
+
+CACHE_PROFILE = os.environ.get("ONLINECOURSE_CACHE_PROFILE", "file" if PRODUCTION_DB else "locmem")
+CACHE_DIR = Path(os.environ.get("ONLINECOURSE_CACHE_DIR", BASE_DIR / ".cache"))
+
+
+def _cache(name, max_entries):
+    if CACHE_PROFILE == "file":
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_DIR / name,
+            "OPTIONS": {"MAX_ENTRIES": max_entries},
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": f"onlinecourse-{name}",
+        "OPTIONS": {"MAX_ENTRIES": max_entries},
     }
+
+
+CACHES = {
+    "default": _cache("default", int(os.environ.get("ONLINECOURSE_CACHE_MAX_ENTRIES", 10000))),
+    "pages": _cache("pages", int(os.environ.get("ONLINECOURSE_PAGE_MAX_ENTRIES", 10000))),
+    # One draft per open exam attempt; size it above the concurrent attempts
+    "drafts": _cache("drafts", int(os.environ.get("ONLINECOURSE_DRAFT_MAX_ENTRIES", 50000))),
+    "sessions": _cache("sessions", int(os.environ.get("ONLINECOURSE_SESSION_MAX_ENTRIES", 100000))),
+}
+
+# Content versions are mirrored in the default cache. A locmem cache misses
+# the bumps made by other processes, so there they are re-read every few
+# seconds; 0 keeps them until the next bump.
+ONLINECOURSE_VERSION_TIMEOUT = int(os.environ.get("ONLINECOURSE_VERSION_TIMEOUT",
+                                                  5 if CACHE_PROFILE == "locmem" else 0)) or None
+
+ONLINECOURSE_PAGE_CACHE = "pages"
+
+ONLINECOURSE_DRAFT_CACHE = "drafts"
+
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+}[os.environ.get("ONLINECOURSE_SESSION_ENGINE", "cached_db" if PRODUCTION_DB else "db")]
+
+SESSION_CACHE_ALIAS = "sessions"
+
+
+# Asynchronous grading
+# Set ONLINECOURSE_ASYNC_GRADING=1 to make submit store the answers and
+# return at once; run `manage.py grade_pending` to grade them. The first
+# result page load waits up to ONLINECOURSE_RESULT_WAIT seconds, then the
+# page refreshes itself without waiting.
+
+ONLINECOURSE_ASYNC_GRADING = os.environ.get("ONLINECOURSE_ASYNC_GRADING", "") == "1"
+
+ONLINECOURSE_RESULT_WAIT = float(os.environ.get("ONLINECOURSE_RESULT_WAIT", 1.0))
+
+
+# Submission archive
+# `manage.py archive_submissions` moves graded submissions older than
+# ONLINECOURSE_ARCHIVE_AFTER_DAYS into one compact row each.
+
+ONLINECOURSE_ARCHIVE_AFTER_DAYS = int(os.environ.get("ONLINECOURSE_ARCHIVE_AFTER_DAYS", 365))
+
+
+# Query instrumentation
+# Set ONLINECOURSE_QUERY_STATS=1 to record query count, DB time, template
+# time and wall time per URL name (see /api/stats/queries/). Views running
+# more queries than their budget are logged, or raise with action "raise".
+
+ONLINECOURSE_QUERY_STATS = os.environ.get("ONLINECOURSE_QUERY_STATS", "") == "1"
+
+ONLINECOURSE_QUERY_BUDGET_ACTION = os.environ.get("ONLINECOURSE_QUERY_BUDGET_ACTION", "log")
+
+ONLINECOURSE_QUERY_BUDGETS = {
+    "onlinecourse_app:index": 5,
+    "onlinecourse_app:course_details": 6,
+    "onlinecourse_app:take_exam": 10,
+    "onlinecourse_app:submit": 36,
+    "onlinecourse_app:show_exam_result": 8,
+    "onlinecourse_app:my_courses": 4,
+    "onlinecourse_app:submission_details": 4,
+    "onlinecourse_app:list_submissions": 7,
+    "admin:onlinecourse_app_lesson_changelist": 12,
+    "admin:onlinecourse_app_question_changelist": 12,
+    "admin:onlinecourse_app_submission_changelist": 12,
 }
 
 
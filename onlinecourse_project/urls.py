@@ -3,11 +3,13 @@ from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('accounts/', include('django.contrib.auth.urls')),
     path('', include('onlinecourse_app.urls')),
 ]
 
 # This configuration:
 # 1. Includes Django admin at /admin/
-# 2. Includes all onlinecourse_app URLs at the root level
-# 3. Makes submit available at: /course/<id>/submit/
-# 4. Makes show_exam_result available at: /result/<id>/
+# 2. Includes Django's login/logout views at /accounts/ (exams need a login)
+# 3. Includes all onlinecourse_app URLs at the root level
+# 4. Makes submit available at: /course/<id>/submit/
+# 5. Makes show_exam_result available at: /result/<id>/
@@ -0,0 +1,249 @@
+"""
+Exam-burst load harness for the submit path
+
+Simulates the end of an exam: every virtual user logs in, opens the exam,
+then all of them post their answers at the same moment (the deadline) and
+follow the redirect to the result page. Runs against a locally running
+WSGI/ASGI server and needs nothing but the standard library.
+
+    python manage.py seed_benchmark_data --users 500
+    gunicorn onlinecourse_project.wsgi -w 4        # or runserver, uvicorn, ...
+    python tools/exam_burst.py --course 1 --users 300 --threads 100
+
+Reports throughput, p50/p99 latency per step, error counts and how often
+the server failed with "database is locked".
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.cookiejar import CookieJar
+import argparse
+import base64
+import json
+import random
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+STEPS = ['login', 'take_exam', 'submit', 'show_exam_result']
+LOCKED = 'database is locked'
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Let 302s through so submit and the result page are timed separately"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class VirtualUser:
+    """One learner with its own cookie jar"""
+
+    def __init__(self, base_url, username, password, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect()
+        )
+
+    def request(self, path, data=None):
+        """Return (status, headers, body) without following redirects"""
+        url = path if path.startswith('http') else self.base_url + path
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        request = urllib.request.Request(url, data=body, headers={'Referer': url})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.headers, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read().decode('utf-8', 'replace')
+
+    def cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return None
+
+
+def _csrf_token(body):
+    match = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', body)
+    return match.group(1) if match else None
+
+
+def _flash_messages(value):
+    """Decode Django's messages cookie (signed, optionally compressed) without verifying it"""
+    if not value:
+        return ''
+    value = urllib.parse.unquote(value.strip('"'))
+    payload = value.split(':')[0]
+    compressed = payload.startswith('.')
+    payload = payload.lstrip('.')
+    try:
+        data = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        if compressed:
+            data = zlib.decompress(data)
+        return data.decode('utf-8', 'replace')
+    except (ValueError, zlib.error):
+        return value
+
+
+def _answers(body, rng):
+    """Pick one choice per question of the exam form"""
+    options = {}
+    for name, value in re.findall(r'name="(question_\d+)"\s+value="(\d+)"', body):
+        options.setdefault(name, []).append(value)
+    return {name: rng.choice(values) for name, values in options.items()}
+
+
+def run_user(options, number, submit_at):
+    """Run one virtual user; returns its timings and failures"""
+    rng = random.Random(number)
+    user = VirtualUser(options['base_url'], f"{options['user_prefix']}{number}",
+                       options['password'], options['timeout'])
+    result = {'timings': {}, 'error': None, 'locked': False}
+    step = 'login'
+    try:
+        status, _, body = user.request('/accounts/login/')
+        started = time.perf_counter()
+        status, headers, body = user.request('/accounts/login/', {
+            'username': user.username,
+            'password': user.password,
+            'csrfmiddlewaretoken': _csrf_token(body) or user.cookie('csrftoken'),
+            'next': '/',
+        })
+        result['timings']['login'] = time.perf_counter() - started
+        if status != 302:
+            raise RuntimeError(f'login failed with status {status}')
+
+        step = 'take_exam'
+        exam_path = f"/course/{options['course']}/exam/"
+        started = time.perf_counter()
+        status, _, body = user.request(exam_path)
+        result['timings']['take_exam'] = time.perf_counter() - started
+        if status != 200:
+            raise RuntimeError(f'take_exam returned {status}')
+        data = _answers(body, rng)
+        data['csrfmiddlewaretoken'] = _csrf_token(body)
+
+        # Everybody submits at the deadline
+        time.sleep(max(submit_at - time.time(), 0))
+
+        step = 'submit'
+        started = time.perf_counter()
+        status, headers, body = user.request(f"/course/{options['course']}/submit/", data)
+        result['timings']['submit'] = time.perf_counter() - started
+        result['submitted_at'] = time.time()
+        location = headers.get('Location', '')
+        if LOCKED in body or LOCKED in _flash_messages(user.cookie('messages')):
+            result['locked'] = True
+        if status != 302 or '/result/' not in location:
+            raise RuntimeError(f'submit returned {status} to {location or "nowhere"}')
+
+        step = 'show_exam_result'
+        started = time.perf_counter()
+        status, _, body = user.request(location)
+        result['timings']['show_exam_result'] = time.perf_counter() - started
+        if status != 200:
+            raise RuntimeError(f'show_exam_result returned {status}')
+    except Exception as e:
+        result['error'] = f'{step}: {e}'
+        if LOCKED in str(e):
+            result['locked'] = True
+    return result
+
+
+def run_group(options, numbers, submit_at):
+    """Run a group of virtual users on a thread pool"""
+    with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+        return list(pool.map(lambda number: run_user(options, number, submit_at), numbers))
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def summarize(results, elapsed):
+    report = {'users': len(results), 'elapsed_s': round(elapsed, 3), 'steps': {}}
+    for step in STEPS:
+        timings = sorted(r['timings'][step] * 1000 for r in results if step in r['timings'])
+        report['steps'][step] = {
+            'count': len(timings),
+            'p50_ms': round(_percentile(timings, 0.50), 1) if timings else None,
+            'p99_ms': round(_percentile(timings, 0.99), 1) if timings else None,
+            'max_ms': round(timings[-1], 1) if timings else None,
+        }
+
+    errors = {}
+    for result in results:
+        if result['error']:
+            kind = result['error'].split(':')[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    ok = sum(1 for r in results if not r['error'])
+
+    # Submit throughput over the burst window
+    submitted = sorted(r['submitted_at'] for r in results if 'submitted_at' in r)
+    burst = (submitted[-1] - submitted[0]) if len(submitted) > 1 else 0
+    report.update({
+        'completed': ok,
+        'error_rate': round(1 - ok / len(results), 4) if results else 0,
+        'errors': errors,
+        'database_locked': sum(1 for r in results if r['locked']),
+        'submits_per_s': round(len(submitted) / burst, 1) if burst else None,
+        'flows_per_s': round(ok / elapsed, 1) if elapsed else None,
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--course', type=int, required=True)
+    parser.add_argument('--users', type=int, default=100, help='Virtual users')
+    parser.add_argument('--user-prefix', default='bench_user_',
+                        help='Usernames are <prefix><n>, as created by seed_benchmark_data')
+    parser.add_argument('--password', default='benchmark')
+    parser.add_argument('--threads', type=int, default=50, help='Threads per process')
+    parser.add_argument('--processes', type=int, default=1, help='Processes, each with its own thread pool')
+    parser.add_argument('--deadline', type=float, default=10.0,
+                        help='Seconds after start at which every user submits')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    parser.add_argument('--output', help='Write the JSON report here as well')
+    args = parser.parse_args(argv)
+
+    options = {
+        'base_url': args.base_url,
+        'course': args.course,
+        'user_prefix': args.user_prefix,
+        'password': args.password,
+        'threads': args.threads,
+        'timeout': args.timeout,
+    }
+    numbers = list(range(args.users))
+    started = time.time()
+    submit_at = started + args.deadline
+
+    if args.processes > 1:
+        groups = [numbers[index::args.processes] for index in range(args.processes)]
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = [pool.submit(run_group, options, group, submit_at) for group in groups]
+            results = [result for future in futures for result in future.result()]
+    else:
+        results = run_group(options, numbers, submit_at)
+
+    report = summarize(results, time.time() - started)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            stream.write(output + '\n')
+    return 0 if report['completed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())